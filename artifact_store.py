@@ -0,0 +1,147 @@
+#!/usr/bin/env python
+"""Python tools for saving scan artifacts (PNGs and DOMs) once per distinct content"""
+import os
+import gzip
+import json
+import hashlib
+import tempfile
+import threading
+
+DEFAULT_STORE_DIR = "artifacts"
+DEFAULT_MANIFEST_FILE = "URLScan_Artifacts.jsonl"
+
+# kind -> extension of its stored bodies (compressed DOMs add '.gz')
+EXTENSIONS = {"png": ".png", "dom": ".html"}
+
+
+class ArtifactStore:
+    """
+    Content addressed store for PNG screenshots and DOMs. Each distinct body is saved once,
+    as '<store_dir>/<first 2 hex digits>/<sha256>.<ext>', and an append only manifest (JSONL)
+    maps every UUID and kind to the hash of its body. Phishing kits are reused heavily, so
+    byte-identical artifacts from many scans share a single file instead of one each.
+    DOMs can optionally be gzip compressed - the hash is always of the uncompressed body.
+    Records from earlier runs in the same directory are loaded, so bodies are shared across runs.
+    Safe to use from several threads.
+    """
+
+    def __init__(self, store_dir, manifest_file, compress_dom=False):
+        self.store_dir = store_dir
+        self.manifest_file = manifest_file
+        self.compress_dom = compress_dom
+        self.entries = {}
+        self.duplicates = 0
+        self.bytes_saved = 0
+        self.lock = threading.Lock()
+
+        os.makedirs(store_dir, exist_ok=True)
+        if os.path.isfile(manifest_file):
+            self.entries = self._load()
+        self.out_file = open(manifest_file, "a", encoding="utf8")  # pylint: disable=consider-using-with
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _load(self):
+        """Read the manifest of earlier runs, ignoring a partly written final line"""
+        entries = {}
+        with open(self.manifest_file, "r", encoding="utf8") as in_file:
+            for line in in_file:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                entries[(record["uuid"], record["type"])] = record
+        return entries
+
+    def __len__(self):
+        return len(self.entries)
+
+    def blob_path(self, sha256, kind, compressed=False):
+        """Returns the path the body with a given hash is stored at"""
+        extension = EXTENSIONS[kind] + (".gz" if compressed else "")
+        return os.path.join(self.store_dir, sha256[:2], sha256 + extension)
+
+    def path(self, uuid, kind):
+        """Returns the path of the body stored for a UUID and kind, or None if there is none"""
+        entry = self.entries.get((uuid, kind))
+        if entry is None:
+            return None
+        return os.path.join(os.path.dirname(self.manifest_file) or ".", entry["path"])
+
+    def has(self, uuid, kind):
+        """Check whether the artifact for a UUID is recorded and its body is on disk"""
+        file_path = self.path(uuid, kind)
+        return file_path is not None and os.path.isfile(file_path)
+
+    def read(self, uuid, kind):
+        """Returns the (uncompressed) body stored for a UUID and kind"""
+        file_path = self.path(uuid, kind)
+        opener = gzip.open if file_path.endswith(".gz") else open
+        with opener(file_path, "rb") as in_file:
+            return in_file.read()
+
+    def put(self, uuid, kind, chunks, expected_size=None):
+        """
+        Method to store an artifact from chunks of bytes. The body is hashed (and compressed,
+        for DOMs if selected) as it is written to a temporary file, which is renamed into place
+        unless a body with the same hash is already stored. Returns (bytes received, whether
+        the body was a duplicate), or None (leaving nothing behind) if the number of bytes
+        does not match 'expected_size'
+        """
+        compressed = kind == "dom" and self.compress_dom
+        descriptor, temp_file = tempfile.mkstemp(dir=self.store_dir, suffix=".part")
+        digest = hashlib.sha256()
+        written = 0
+        try:
+            with os.fdopen(descriptor, "wb") as raw:
+                # Note: mtime=0 keeps the compressed file identical for identical bodies
+                o_f = gzip.GzipFile(fileobj=raw, mode="wb", mtime=0) if compressed else raw
+                with o_f:
+                    for chunk in chunks:
+                        if chunk:
+                            digest.update(chunk)
+                            o_f.write(chunk)
+                            written += len(chunk)
+            if expected_size is not None and written != int(expected_size):
+                os.remove(temp_file)
+                return None
+
+            sha256 = digest.hexdigest()
+            blob_file = self.blob_path(sha256, kind, compressed)
+            duplicate = os.path.isfile(blob_file)
+            if duplicate:
+                os.remove(temp_file)
+            else:
+                os.makedirs(os.path.dirname(blob_file), exist_ok=True)
+                os.replace(temp_file, blob_file)
+        except BaseException:
+            if os.path.exists(temp_file):
+                os.remove(temp_file)
+            raise
+
+        record = {
+            "uuid": uuid,
+            "type": kind,
+            "sha256": sha256,
+            "size": written,
+            "path": os.path.relpath(blob_file, os.path.dirname(self.manifest_file) or "."),
+        }
+        line = json.dumps(record) + "\n"
+        with self.lock:
+            self.entries[(uuid, kind)] = record
+            if duplicate:
+                self.duplicates += 1
+                self.bytes_saved += written
+            self.out_file.write(line)
+            self.out_file.flush()
+        return written, duplicate
+
+    def close(self):
+        """Close the manifest"""
+        with self.lock:
+            if not self.out_file.closed:
+                self.out_file.close()
@@ -0,0 +1,214 @@
+#!/usr/bin/env python
+"""Python tools for downloading scan artifacts (PNG screenshots and DOMs) from URLScan.io"""
+import os
+import logging
+import tempfile
+import threading
+
+from lazy_modules import lazy_import
+from urlscan_client import URLScanError, error_for_status
+
+futures = lazy_import("concurrent.futures")
+requests = lazy_import("requests")
+
+logger = logging.getLogger(__name__)
+logger.addHandler(logging.NullHandler())
+
+CHUNK_SIZE = 64 * 1024
+PNG_SIGNATURE = b"\x89PNG"
+
+# kind -> (path on URLScan.io, file name in the output directory)
+ARTIFACTS = {
+    "png": ("/screenshots/{uuid}.png", "{uuid}.png"),
+    "dom": ("/dom/{uuid}", "DOM_{uuid}.html"),
+}
+
+
+def artifact_file(uuid, kind, out_dir):
+    """Returns the path an artifact for a UUID is saved to"""
+    return os.path.join(out_dir, ARTIFACTS[kind][1].format(uuid=uuid))
+
+
+def is_valid_artifact(file_path, kind):
+    """Check an artifact already on disk is complete: not empty and, for PNGs, a PNG"""
+    try:
+        if os.path.getsize(file_path) == 0:
+            return False
+        if kind == "png":
+            with open(file_path, "rb") as in_file:
+                return in_file.read(len(PNG_SIGNATURE)) == PNG_SIGNATURE
+    except OSError:
+        return False
+    return True
+
+
+def download_artifact(uuid, kind, out_dir, client):
+    """
+    Method to download one artifact ('png' or 'dom') for a UUID to the output directory.
+    The body is streamed to a temporary file in chunks and renamed into place once complete,
+    so a partial download never looks finished. Artifacts already on disk are skipped.
+    With an artifact store on the client, the body is saved there (once per distinct content)
+    instead of to its own file. Returns True once the artifact is on disk, raises a
+    URLScanError (see 'error_for_status') if it could not be downloaded
+    """
+    store = client.artifact_store
+    out_file = artifact_file(uuid, kind, out_dir)
+    if store.has(uuid, kind) if store is not None else is_valid_artifact(out_file, kind):
+        return True
+
+    # A finished scan never changes - serve the artifact from the cache when possible
+    if client.cache is not None:
+        cached = client.cache.get(uuid, kind)
+        client.metrics.increment("cache_lookups_total", kind=kind, hit=cached is not None)
+        if cached is not None:
+            with client.metrics.timer("disk_write_seconds", kind=kind):
+                if store is not None:
+                    store_artifact(uuid, kind, [cached], client)
+                else:
+                    write_atomic(out_file, [cached])
+            return True
+
+    response = client.get(ARTIFACTS[kind][0].format(uuid=uuid), stream=True)
+    status = response.status_code
+    if status != 200:
+        response.close()
+        raise error_for_status(
+            f"{kind.upper()} retrieval for uuid: '{uuid}' failed with status: '{status}'.", status
+        )
+
+    with response:
+        # Note: 'Content-Length' only matches the decoded body when it was sent uncompressed
+        expected = None
+        if not response.headers.get("Content-Encoding"):
+            expected = response.headers.get("Content-Length")
+        # Note: the body is written as it arrives, so this covers the transfer and the write
+        with client.metrics.timer("artifact_transfer_seconds", kind=kind):
+            chunks = response.iter_content(CHUNK_SIZE)
+            try:
+                if store is not None:
+                    written = store_artifact(uuid, kind, chunks, client, expected)
+                else:
+                    written = write_atomic(out_file, chunks, expected)
+            except requests.exceptions.RequestException as error:
+                raise URLScanError(
+                    f"{kind.upper()} download for uuid: '{uuid}' failed: '{error}'", status
+                ) from error
+    if written is None:
+        raise URLScanError(f"{kind.upper()} download for uuid: '{uuid}' was incomplete.", status)
+    client.metrics.increment("response_bytes_total", written, endpoint=kind)
+
+    # Only artifacts small enough to cache are read back into memory for it
+    if client.cache is not None and client.cache.accepts(written):
+        if store is not None:
+            client.cache.put(uuid, kind, store.read(uuid, kind))
+        else:
+            with open(out_file, "rb") as in_file:
+                client.cache.put(uuid, kind, in_file.read())
+    return True
+
+
+def store_artifact(uuid, kind, chunks, client, expected_size=None):
+    """
+    Method to save an artifact in the client's artifact store, counting the bodies that were
+    already stored. Returns the number of bytes received, or None if the body was incomplete
+    """
+    stored = client.artifact_store.put(uuid, kind, chunks, expected_size)
+    if stored is None:
+        return None
+    written, duplicate = stored
+    client.metrics.increment("artifacts_stored_total", kind=kind, duplicate=duplicate)
+    return written
+
+
+def write_atomic(out_file, chunks, expected_size=None):
+    """
+    Method to write chunks of bytes to a temporary file and rename it to 'out_file'.
+    Returns the number of bytes written, or None (leaving nothing behind) if the total
+    does not match 'expected_size'
+    """
+    directory = os.path.dirname(out_file) or "."
+    descriptor, temp_file = tempfile.mkstemp(dir=directory, suffix=".part")
+    written = 0
+    try:
+        with os.fdopen(descriptor, "wb") as o_f:
+            for chunk in chunks:
+                if chunk:
+                    o_f.write(chunk)
+                    written += len(chunk)
+        if expected_size is not None and written != int(expected_size):
+            os.remove(temp_file)
+            return None
+        os.replace(temp_file, out_file)
+    except BaseException:
+        if os.path.exists(temp_file):
+            os.remove(temp_file)
+        raise
+    return written
+
+
+class ArtifactDownloader:
+    """
+    Downloads artifacts on a dedicated pool of worker threads, separate from the threads
+    retrieving scan results, so PNG and DOM transfers overlap each other and the result
+    requests instead of running one after another for each UUID.
+    """
+
+    def __init__(self, client, out_dir, kinds, workers=4):
+        self.client = client
+        self.out_dir = out_dir
+        self.kinds = kinds
+        self.executor = futures.ThreadPoolExecutor(max_workers=max(1, workers))
+        self.failed = 0
+        self.lock = threading.Lock()
+        # Bound the number of queued downloads so a long stream of UUIDs can not pile up
+        self.slots = threading.BoundedSemaphore(max(1, workers) * 4)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def submit(self, uuid, on_done=None):
+        """
+        Queue every selected artifact kind for a UUID. 'on_done()' (optional) is called once
+        all of them have been downloaded - not at all if any of them failed
+        """
+        state = {"outstanding": len(self.kinds), "failed": False}
+
+        def finished(future):
+            succeeded = self._check(future)
+            with self.lock:
+                state["outstanding"] -= 1
+                state["failed"] = state["failed"] or not succeeded
+                complete = state["outstanding"] == 0 and not state["failed"]
+            if complete and on_done is not None:
+                on_done()
+
+        for kind in self.kinds:
+            self.slots.acquire()  # pylint: disable=consider-using-with
+            future = self.executor.submit(
+                download_artifact, uuid, kind, self.out_dir, self.client
+            )
+            future.add_done_callback(finished)
+
+    def _check(self, future):
+        """
+        Release the download's slot and count it if it failed or raised an error.
+        Returns whether it succeeded
+        """
+        self.slots.release()
+        try:
+            succeeded = future.result()
+        except Exception as error:  # pylint: disable=broad-except
+            logger.error("[!] Error: %s", error)
+            succeeded = False
+        if not succeeded:
+            with self.lock:
+                self.failed += 1
+        return bool(succeeded)
+
+    def close(self):
+        """Wait for every queued download to finish. Returns the number that failed"""
+        self.executor.shutdown(wait=True)
+        return self.failed
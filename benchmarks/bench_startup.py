@@ -0,0 +1,95 @@
+#!/usr/bin/env python
+"""Benchmark of Yall_Scan's startup time for runs that need no network access"""
+import os
+import re
+import sys
+import json
+import time
+import argparse
+import tempfile
+import statistics
+import subprocess
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+__description__ = "Benchmark how long yall_scan.py takes to start and finish for '--help', input\
+     validation and a UUID served from the cache - and check none of them load the HTTP stack."
+
+SCRIPT = os.path.join(REPO_DIR, "yall_scan.py")
+CACHED_UUID = "00000000-0000-4000-8000-000000000000"
+# Modules that should only be loaded once a request is actually sent
+HTTP_MODULES = re.compile(r"\|\s+(requests|urllib3|http\.client)$", re.MULTILINE)
+
+
+def build_cases(work_dir):
+    """Method to prepare a cache holding one result. Returns {case name: command}"""
+    # pylint: disable=import-outside-toplevel
+    from result_cache import ResultCache
+
+    cache_file = os.path.join(work_dir, "cache.sqlite")
+    cache = ResultCache(cache_file)
+    cache.put(CACHED_UUID, "result", json.dumps({"task": {"uuid": CACHED_UUID}}).encode("utf8"))
+    cache.close()
+
+    return {
+        "python (baseline)": [sys.executable, "-c", "pass"],
+        "--help": [sys.executable, SCRIPT, "--help"],
+        "invalid input": [sys.executable, SCRIPT, "--url_file", os.path.join(work_dir, "missing.txt"), "-N"],
+        "cached uuid": [
+            sys.executable, SCRIPT,
+            "--uuid", CACHED_UUID,
+            "--cache_file", cache_file,
+            "--no_history",
+            # Nothing listens here: the run fails if it tries to reach the network
+            "--base_url", "http://127.0.0.1:9",
+            "--max_attempts", "1",
+            "-o", os.path.join(work_dir, "out"),
+            "-N",
+        ],
+    }
+
+
+def time_command(command, runs, env):
+    """Method to run a command 'runs' times. Returns the wall clock times in milliseconds"""
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run(command, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=False)
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+def loads_http_stack(command, env):
+    """Check whether a command imports the HTTP stack (using python's '-X importtime')"""
+    traced = [command[0], "-X", "importtime"] + command[1:]
+    stderr = subprocess.run(traced, env=env, capture_output=True, text=True, check=False).stderr
+    return bool(HTTP_MODULES.search(stderr))
+
+
+def main():
+    """Main driver method -- times each startup case and prints a table of the results"""
+    parser = argparse.ArgumentParser(description=__description__)
+    parser.add_argument("--runs", type=int, default=10, help="Runs of each case (default: 10).")
+    options = parser.parse_args()
+
+    env = dict(os.environ, URLSCAN_API_KEY="benchmark-key")
+    failed = False
+    print(f"{'case':<20}{'min ms':>9}{'median ms':>11}{'max ms':>9}  HTTP stack loaded")
+    with tempfile.TemporaryDirectory() as work_dir:
+        for name, command in build_cases(work_dir).items():
+            timings = time_command(command, options.runs, env)
+            loaded = loads_http_stack(command, env)
+            failed = failed or (loaded and name != "python (baseline)")
+            print(
+                f"{name:<20}{min(timings):>9.1f}{statistics.median(timings):>11.1f}"
+                f"{max(timings):>9.1f}  {'yes' if loaded else 'no'}"
+            )
+
+    if failed:
+        print("\n[!] Error: A run that needs no network access loaded the HTTP stack.")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
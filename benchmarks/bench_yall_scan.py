@@ -0,0 +1,229 @@
+#!/usr/bin/env python
+"""Benchmarks for Yall_Scan's batch modes, run against the local mock URLScan.io server"""
+import os
+import sys
+import json
+import time
+import uuid
+import argparse
+import tempfile
+import contextlib
+import subprocess
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+__description__ = "Benchmark scan_urls, get_uuids_data, PNG/DOM downloads and the pipeline\
+     against a local mock URLScan.io server. Reports items/sec, p50/p99 request latency\
+     and peak RSS for each mode, batch size and worker count."
+
+# mode -> unit the throughput is reported in
+MODES = {
+    "scan": "URLs/sec",
+    "uuids": "UUIDs/sec",
+    "artifacts": "UUIDs/sec",
+    "pipeline": "URLs/sec",
+}
+
+
+def percentile(values, percent):
+    """Returns the nearest-rank percentile of a list of numbers (0 if it is empty)"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, int(round(percent / 100 * len(ordered))) - 1))
+    return ordered[rank]
+
+
+def peak_rss():
+    """Returns the peak resident set size of this process in bytes (None if unknown)"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Note: Linux reports kilobytes, macOS reports bytes
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def run_case(mode, size, workers, base_url):
+    """
+    Method to run one benchmark case in this process and return its measurements.
+    Every request the client sends is timed (until its response headers arrive)
+    """
+    # pylint: disable=import-outside-toplevel
+    import yall_scan
+    from urlscan_api import URLScanClient
+
+    yall_scan.INTERACTIVE = False
+    client = URLScanClient(
+        "benchmark-key",
+        base_url=base_url,
+        rate_limit=None,
+        workers=workers,
+        pool_size=max(10, workers * 2),
+    )
+
+    latencies = []
+    send_request = client.request
+
+    def timed_request(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return send_request(*args, **kwargs)
+        finally:
+            latencies.append(time.perf_counter() - start)
+
+    client.request = timed_request
+
+    data = {"url": "", "visibility": "unlisted", "customagent": "", "country": "us", "tags": []}
+    urls = [f"https://example.com/page/{index}" for index in range(size)]
+    uuids = [str(uuid.uuid4()) for _ in range(size)]
+
+    with tempfile.TemporaryDirectory() as out_dir:
+        options = argparse.Namespace(
+            workers=workers,
+            download_workers=workers,
+            get_png=mode == "artifacts",
+            get_dom=mode == "artifacts",
+            out_dir=out_dir,
+            first_poll=0.05,
+            scan_timeout=60,
+            fields=None,
+            next_agent=None,
+        )
+        # The tool reports on every item it handles - keep that out of the results
+        with open(os.devnull, "w", encoding="utf8") as null, contextlib.redirect_stdout(null):
+            start = time.perf_counter()
+            if mode == "scan":
+                results = yall_scan.scan_urls(urls, client, data, workers)
+            elif mode == "pipeline":
+                results = yall_scan.run_pipeline(urls, client, data, options)[1]
+            else:
+                results = yall_scan.get_uuids_data(uuids, options, client)
+            elapsed = time.perf_counter() - start
+    client.close()
+
+    return {
+        "mode": mode,
+        "size": size,
+        "workers": workers,
+        "completed": sum(1 for result in results if result),
+        "seconds": round(elapsed, 3),
+        "per_second": round(size / elapsed, 2) if elapsed else 0.0,
+        "requests": len(latencies),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 2),
+        "peak_rss": peak_rss(),
+    }
+
+
+def start_mock_server(options):
+    """Method to start mock_server.py in its own process. Returns (process, base URL)"""
+    command = [
+        sys.executable,
+        os.path.join(REPO_DIR, "mock_server.py"),
+        "--port", "0",
+        "--latency", str(options.latency),
+        "--jitter", str(options.jitter),
+        "--rate_429", str(options.rate_429),
+        "--result_size", str(options.result_size),
+        "--png_size", str(options.png_size),
+        "--dom_size", str(options.dom_size),
+    ]
+    process = subprocess.Popen(  # pylint: disable=consider-using-with
+        command, stdout=subprocess.PIPE, text=True
+    )
+    line = process.stdout.readline()
+    if "http://" not in line:
+        process.kill()
+        sys.exit("[!] Error: Mock server failed to start.")
+    return process, line[line.index("http://"):].strip()
+
+
+def run_isolated(mode, size, workers, base_url):
+    """
+    Method to run one case in a fresh interpreter so its peak RSS is not inflated
+    by the cases that ran before it. Returns the case's measurements
+    """
+    command = [sys.executable, os.path.abspath(__file__), "--case", mode, str(size), str(workers), base_url]
+    output = subprocess.run(command, check=True, capture_output=True, text=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def format_bytes(size):
+    """Returns a byte count as a short human readable string"""
+    if size is None:
+        return "n/a"
+    for unit in ("B", "KB", "MB"):
+        if size < 1024:
+            return f"{size:.0f}{unit}"
+        size /= 1024
+    return f"{size:.1f}GB"
+
+
+def print_row(result):
+    """Method to print one case's measurements as a table row"""
+    unit = MODES[result["mode"]]
+    print(
+        f"{result['mode']:<10}{result['size']:>7}{result['workers']:>8}"
+        f"{result['per_second']:>12.1f} {unit:<10}"
+        f"{result['p50_ms']:>9.1f}{result['p99_ms']:>9.1f}"
+        f"{format_bytes(result['peak_rss']):>10}"
+        f"{result['completed']:>7}/{result['size']}"
+    )
+
+
+def main():
+    """Main driver method -- runs every selected case and prints a table of the results"""
+    parser = argparse.ArgumentParser(description=__description__)
+    parser.add_argument("--modes", nargs="+", choices=list(MODES), default=list(MODES))
+    parser.add_argument("--sizes", nargs="+", type=int, default=[50, 200], help="Batch sizes.")
+    parser.add_argument("--workers", nargs="+", type=int, default=[1, 8], help="Worker counts.")
+    parser.add_argument("--latency", type=float, default=0.02, help="Mock server latency (seconds).")
+    parser.add_argument("--jitter", type=float, default=0.01, help="Mock server latency jitter (seconds).")
+    parser.add_argument("--rate_429", type=float, default=0.0, help="Share of requests that get a '429'.")
+    parser.add_argument("--result_size", type=int, default=50000, help="Bytes per scan result.")
+    parser.add_argument("--png_size", type=int, default=100000, help="Bytes per PNG.")
+    parser.add_argument("--dom_size", type=int, default=50000, help="Bytes per DOM.")
+    parser.add_argument("--base_url", help="Use an already running server instead of starting one.")
+    parser.add_argument("--json", dest="json_file", help="Also save the results to a JSON file.")
+    parser.add_argument("--case", nargs=4, help=argparse.SUPPRESS)
+    options = parser.parse_args()
+
+    if options.case:
+        mode, size, workers, base_url = options.case
+        print(json.dumps(run_case(mode, int(size), int(workers), base_url)))
+        return
+
+    server = None
+    base_url = options.base_url
+    if base_url is None:
+        server, base_url = start_mock_server(options)
+    print(f"[+] Benchmarking against: {base_url}\n")
+    print(f"{'mode':<10}{'size':>7}{'workers':>8}{'throughput':>23}{'p50 ms':>9}{'p99 ms':>9}{'peak RSS':>10}{'done':>9}")
+
+    results = []
+    try:
+        for mode in options.modes:
+            for size in options.sizes:
+                for workers in options.workers:
+                    result = run_isolated(mode, size, workers, base_url)
+                    results.append(result)
+                    print_row(result)
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+    if options.json_file:
+        with open(options.json_file, "w", encoding="utf8") as o_f:
+            json.dump(results, o_f, indent=4)
+        print(f"\n[+] Results saved to: '{options.json_file}'")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,175 @@
+#!/usr/bin/env python
+"""Python tools for extracting indicators (domains, IPs, ASNs, certificates, hashes) from scan results"""
+import os
+import threading
+
+from lazy_modules import lazy_import
+from output_formats import compression_of, loads, open_text, read_json
+
+futures = lazy_import("concurrent.futures")
+
+# Indicator type -> key of its list in a scan result's 'lists' section
+IOC_LISTS = {
+    "domain": "domains",
+    "ip": "ips",
+    "asn": "asns",
+    "certificate": "certificates",
+    "hash": "hashes",
+}
+# Indicator type -> key in a result's 'page' section (all a search result has)
+PAGE_FIELDS = {"domain": "domain", "ip": "ip", "asn": "asn"}
+
+# JSONL lines handed to a worker process at a time
+CHUNK_LINES = 256
+
+
+def extract_iocs(result):
+    """Returns (uuid, {indicator type: set of values}) for a single scan or search result"""
+    uuid = result.get("_id") or (result.get("task") or {}).get("uuid") or ""
+    lists = result.get("lists") or {}
+    page = result.get("page") or {}
+
+    iocs = {}
+    for ioc_type, list_name in IOC_LISTS.items():
+        values = set()
+        for value in lists.get(list_name) or ():
+            if isinstance(value, dict):
+                # Certificates are objects - identify them by subject and issuer
+                value = f"{value.get('subjectName', '')} ({value.get('issuer', '')})"
+            values.add(str(value))
+        if ioc_type in PAGE_FIELDS and page.get(PAGE_FIELDS[ioc_type]):
+            values.add(str(page[PAGE_FIELDS[ioc_type]]))
+        if ioc_type == "asn":
+            # Lists hold bare numbers ('15133'), the page section prefixes them ('AS15133')
+            values = {"AS" + value.upper().lstrip("AS") for value in values}
+        if values:
+            iocs[ioc_type] = values
+    return uuid, iocs
+
+
+class IOCIndex:
+    """
+    Deduplicated index of the indicators found across a run. Each indicator type keeps a
+    dict (a hash index) of value -> [number of scans it was seen in, first UUID it was seen
+    in], so adding a result costs one lookup per indicator however many have been seen.
+    Safe to update from several threads.
+    """
+
+    def __init__(self):
+        self.index = {ioc_type: {} for ioc_type in IOC_LISTS}
+        self.results = 0
+        self.lock = threading.Lock()
+
+    def add(self, result):
+        """Add the indicators of one scan or search result"""
+        uuid, iocs = extract_iocs(result)
+        with self.lock:
+            self._add(uuid, iocs)
+            self.results += 1
+
+    def _add(self, uuid, iocs):
+        for ioc_type, values in iocs.items():
+            seen = self.index[ioc_type]
+            for value in values:
+                entry = seen.get(value)
+                if entry is None:
+                    seen[value] = [1, uuid]
+                else:
+                    entry[0] += 1
+
+    def merge(self, partial, results):
+        """Merge a partial index ({type: {value: [count, uuid]}}) built by a worker process"""
+        with self.lock:
+            for ioc_type, values in partial.items():
+                seen = self.index[ioc_type]
+                for value, (count, uuid) in values.items():
+                    entry = seen.get(value)
+                    if entry is None:
+                        seen[value] = [count, uuid]
+                    else:
+                        entry[0] += count
+            self.results += results
+
+    def __len__(self):
+        return sum(len(values) for values in self.index.values())
+
+    def write(self, out_file):
+        """Method to save the index as a tab separated table: type, value, scans, first UUID"""
+        with self.lock, open(out_file, "w", encoding="utf8") as o_f:
+            o_f.write("type\tvalue\tscans\tfirst_uuid\n")
+            for ioc_type, values in self.index.items():
+                for value in sorted(values):
+                    count, uuid = values[value]
+                    value = value.replace("\t", " ").replace("\n", " ")
+                    o_f.write(f"{ioc_type}\t{value}\t{count}\t{uuid}\n")
+
+
+def index_results(results):
+    """Returns (partial index, number of results) for an iterable of results"""
+    index = IOCIndex()
+    for result in results:
+        if isinstance(result, dict):
+            uuid, iocs = extract_iocs(result)
+            index._add(uuid, iocs)  # pylint: disable=protected-access
+            index.results += 1
+    return index.index, index.results
+
+
+def index_lines(lines):
+    """Worker process task: parse a chunk of JSONL lines and index their indicators"""
+    return index_results(loads(line) for line in lines if line.strip())
+
+
+def index_file(file_name):
+    """Worker process task: parse a whole JSON file (one result or a list) and index it"""
+    content = read_json(file_name)
+    return index_results(content if isinstance(content, list) else [content])
+
+
+def is_jsonl(file_name):
+    """Check whether a (possibly compressed) file holds one JSON object per line"""
+    with open_text(file_name, "r", compression_of(file_name)) as in_file:
+        first_line = in_file.readline()
+    try:
+        return isinstance(loads(first_line), dict)
+    except ValueError:
+        return False
+
+
+def index_files(file_names, index, workers=None):
+    """
+    Method to extract the indicators of every result in a list of files (any output format)
+    into 'index' across a pool of worker processes. JSONL files are split into chunks of
+    lines so a single large file is parsed by every worker, other files go to one worker each.
+    Returns the index
+    """
+    workers = max(1, workers or os.cpu_count() or 1)
+    with futures.ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = set()
+
+        def submit(function, argument):
+            # Keep a bounded number of chunks in flight so memory use stays flat
+            if len(pending) >= workers * 2:
+                done, _ = futures.wait(pending, return_when=futures.FIRST_COMPLETED)
+                for future in done:
+                    pending.remove(future)
+                    index.merge(*future.result())
+            pending.add(executor.submit(function, argument))
+
+        for file_name in file_names:
+            if not is_jsonl(file_name):
+                submit(index_file, file_name)
+                continue
+            with open_text(file_name, "r", compression_of(file_name)) as in_file:
+                chunk = []
+                for line in in_file:
+                    chunk.append(line)
+                    if len(chunk) == CHUNK_LINES:
+                        submit(index_lines, chunk)
+                        chunk = []
+                if chunk:
+                    submit(index_lines, chunk)
+
+        for future in futures.as_completed(pending):
+            index.merge(*future.result())
+    return index
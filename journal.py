@@ -0,0 +1,75 @@
+#!/usr/bin/env python
+"""Python tools for recording the progress of a batch run so it can be resumed after a failure"""
+import os
+import json
+import threading
+
+
+class ProgressJournal:
+    """
+    Append only journal (JSONL) of the items in a batch that have been completed.
+    Each record holds the item's position in the input, the item itself and - when
+    'keep_results' is set - the response it produced. Records are flushed and synced to
+    disk as soon as an item completes, so a run that dies part way through can be resumed
+    from the exact point of failure without repeating (or paying quota for) finished items.
+    """
+
+    def __init__(self, journal_file, resume=False, keep_results=True):
+        self.journal_file = journal_file
+        self.keep_results = keep_results
+        self.completed = {}
+        self.lock = threading.Lock()
+
+        if resume and os.path.isfile(journal_file):
+            self.completed = self._load()
+            mode = "a"
+        else:
+            mode = "w"
+        self.out_file = open(journal_file, mode, encoding="utf8")  # pylint: disable=consider-using-with
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _load(self):
+        """Read the records of a previous run, ignoring a partly written final line"""
+        completed = {}
+        with open(self.journal_file, "r", encoding="utf8") as in_file:
+            for line in in_file:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                completed[record["index"]] = (record["item"], record.get("result"))
+        return completed
+
+    def lookup(self, index, item):
+        """
+        Returns (True, result) if 'item' at position 'index' was completed by a previous run,
+        otherwise (False, None). The result is None unless the journal keeps results
+        """
+        entry = self.completed.get(index)
+        if entry is None or entry[0] != item:
+            return False, None
+        return True, entry[1]
+
+    def record(self, index, item, result):
+        """Write the record for a completed item and sync it to disk"""
+        record = {"index": index, "item": item}
+        if self.keep_results:
+            record["result"] = result
+        line = json.dumps(record, ensure_ascii=False) + "\n"
+        with self.lock:
+            self.out_file.write(line)
+            self.out_file.flush()
+            os.fsync(self.out_file.fileno())
+
+    def close(self, finished=False):
+        """Close the journal - once a run has 'finished' the journal is no longer needed"""
+        with self.lock:
+            if not self.out_file.closed:
+                self.out_file.close()
+        if finished and os.path.isfile(self.journal_file):
+            os.remove(self.journal_file)
@@ -0,0 +1,74 @@
+#!/usr/bin/env python
+"""Python tools for spreading requests to URLScan.io across several API keys"""
+import os
+import re
+import threading
+
+KEYS_ENV_VAR = "URLSCAN_API_KEYS"
+
+
+class KeyPool:
+    """
+    Pool of URLScan.io API keys, each with its own RateLimitController tracking that key's
+    quota. Every request is sent with the key that can go soonest (most remaining quota as
+    the tie-breaker, then round robin). A key that receives a '429' reports no quota left
+    until its window resets, so it drops out of rotation until then while the other keys
+    carry on - total throughput grows with the number of keys.
+    'make_limiter()' returns a new RateLimitController for each key.
+    """
+
+    def __init__(self, api_keys, make_limiter):
+        if not api_keys:
+            raise ValueError("at least one API key is required")
+        self.keys = list(dict.fromkeys(api_keys))
+        self.limiters = {api_key: make_limiter() for api_key in self.keys}
+        self.next_index = 0
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.keys)
+
+    def choose(self, action):
+        """Returns the API key best placed to send the next request for 'action'"""
+        with self.lock:
+            start = self.next_index
+            self.next_index = (self.next_index + 1) % len(self.keys)
+
+        best_key = None
+        best_rank = None
+        for offset in range(len(self.keys)):
+            api_key = self.keys[(start + offset) % len(self.keys)]
+            delay, remaining = self.limiters[api_key].status(action)
+            # A key that has not reported its quota yet is assumed to have all of it left
+            rank = (delay, -remaining if remaining is not None else -float("inf"))
+            if best_rank is None or rank < best_rank:
+                best_key, best_rank = api_key, rank
+        return best_key
+
+    def wait_time(self, action):
+        """Returns the seconds until one of the keys may send a request for 'action'"""
+        return min(limiter.status(action)[0] for limiter in self.limiters.values())
+
+    def acquire(self, action):
+        """Block until one of the keys may send a request for 'action'. Returns that key"""
+        api_key = self.choose(action)
+        self.limiters[api_key].acquire(action)
+        return api_key
+
+    def update(self, api_key, response, action):
+        """Record the quota headers a response reported for the key it was sent with"""
+        return self.limiters[api_key].update(response, action)
+
+
+def load_api_keys(key_file=None):
+    """
+    Method to load several API keys from a file (one per line, '#' starts a comment)
+    or from the 'URLSCAN_API_KEYS' environment variable (separated by commas or spaces).
+    Returns an empty list if neither provides any keys
+    """
+    if key_file:
+        with open(key_file, "r", encoding="utf8") as in_file:
+            lines = [line.split("#", 1)[0].strip() for line in in_file]
+        return [line for line in lines if line]
+
+    return [key for key in re.split(r"[,\s]+", os.environ.get(KEYS_ENV_VAR, "")) if key]
@@ -0,0 +1,57 @@
+#!/usr/bin/env python
+"""Python tools for deferring the import of heavy modules until they are first used"""
+import sys
+import types
+import threading
+import importlib
+import importlib.util
+
+
+class LazyModule(types.ModuleType):
+    """
+    Stand-in for a module that is imported the first time one of its attributes is used.
+    The import runs under a lock, so worker threads touching the module at the same time
+    all wait for it to finish instead of seeing it half loaded.
+    """
+
+    def __init__(self, name):
+        super().__init__(name)
+        self.__dict__["_lock"] = threading.Lock()
+        self.__dict__["_module"] = None
+
+    def __getattr__(self, attribute):
+        # Only called for attributes the stand-in does not have itself, i.e. the module's
+        return getattr(self._resolve(), attribute)
+
+    def _resolve(self):
+        """Import the module (once) and return it"""
+        module = self.__dict__["_module"]
+        if module is None:
+            with self.__dict__["_lock"]:
+                module = self.__dict__["_module"]
+                if module is None:
+                    module = importlib.import_module(self.__name__)
+                    self.__dict__["_module"] = module
+        return module
+
+
+def resolve(module):
+    """Method to finish importing a module returned by 'lazy_import' straight away. Returns it"""
+    if isinstance(module, LazyModule):
+        return module._resolve()  # pylint: disable=protected-access
+    return module
+
+
+def lazy_import(name):
+    """
+    Method to import a module lazily: a stand-in for the module is returned straight away,
+    but the module's code only runs the first time one of its attributes is used. Runs that
+    never touch it - '--help', input validation, results served from the cache - never pay
+    for loading it. Raises ImportError straight away if the module is not installed
+    """
+    if name in sys.modules:
+        return sys.modules[name]
+
+    if importlib.util.find_spec(name) is None:
+        raise ImportError(f"No module named '{name}'", name=name)
+    return LazyModule(name)
@@ -0,0 +1,215 @@
+#!/usr/bin/env python
+"""Python tools for collecting run statistics (counters, gauges, latency histograms) and exporting them"""
+import os
+import json
+import time
+import bisect
+import tempfile
+import threading
+import contextlib
+
+# Upper bounds (seconds) of the latency histogram buckets, Prometheus style
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+PROMETHEUS_PREFIX = "yall_scan_"
+
+
+class Histogram:
+    """Counts observations into fixed buckets, keeping their total and maximum as well"""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        # The final slot counts everything above the last bucket (+Inf)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.maximum = 0.0
+
+    def observe(self, value):
+        """Add one observation"""
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.total += value
+        self.maximum = max(self.maximum, value)
+
+    def quantile(self, fraction):
+        """Returns an upper bound for the given quantile (0-1) from the bucket counts"""
+        if not self.count:
+            return 0.0
+        rank = fraction * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank and count:
+                if index < len(self.buckets):
+                    return min(self.buckets[index], self.maximum)
+                return self.maximum
+        return self.maximum
+
+    def summary(self):
+        """Returns the histogram as a dict suitable for JSON"""
+        return {
+            "count": self.count,
+            "sum": round(self.total, 6),
+            "mean": round(self.total / self.count, 6) if self.count else 0.0,
+            "p50": round(self.quantile(0.5), 6),
+            "p99": round(self.quantile(0.99), 6),
+            "max": round(self.maximum, 6),
+            "buckets": dict(zip([str(bound) for bound in self.buckets] + ["+Inf"], self.counts)),
+        }
+
+
+class RunMetrics:
+    """
+    Thread safe registry of the statistics of a run. Counters, gauges and histograms are
+    identified by a name plus optional labels (e.g. endpoint='result', status='200'), so
+    every API call can be counted and timed without coordinating between worker threads.
+    'write()' saves a JSON snapshot and, optionally, the Prometheus text format - and
+    'start_flushing()' repeats that periodically during a long run.
+    """
+
+    def __init__(self):
+        self.started = time.time()
+        self.counters = {}
+        self.gauges = {}
+        self.histograms = {}
+        self.lock = threading.Lock()
+        self.flusher = None
+        self.stop_flushing = threading.Event()
+
+    @staticmethod
+    def _key(name, labels):
+        return name, tuple(sorted((label, str(value)) for label, value in labels.items()))
+
+    def increment(self, name, amount=1, **labels):
+        """Add 'amount' to a counter"""
+        key = self._key(name, labels)
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + amount
+
+    def set_gauge(self, name, value, **labels):
+        """Set a gauge to its latest value"""
+        key = self._key(name, labels)
+        with self.lock:
+            self.gauges[key] = value
+
+    def observe(self, name, value, **labels):
+        """Record one observation (e.g. a latency in seconds) in a histogram"""
+        key = self._key(name, labels)
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram()
+            histogram.observe(value)
+
+    @contextlib.contextmanager
+    def timer(self, name, **labels):
+        """Context manager recording how long its body took in a histogram"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def snapshot(self):
+        """Returns every statistic collected so far as a dict suitable for JSON"""
+
+        def entries(values, convert):
+            return [
+                {"name": name, "labels": dict(labels), "value": convert(value)}
+                for (name, labels), value in sorted(values.items())
+            ]
+
+        with self.lock:
+            elapsed = time.time() - self.started
+            return {
+                "started": self.started,
+                "elapsed_seconds": round(elapsed, 3),
+                "counters": entries(self.counters, lambda value: value),
+                "gauges": entries(self.gauges, lambda value: value),
+                "histograms": entries(self.histograms, lambda histogram: histogram.summary()),
+            }
+
+    def to_prometheus(self):
+        """Returns every statistic collected so far in the Prometheus text exposition format"""
+
+        def series(name, labels, extra=()):
+            pairs = list(labels) + list(extra)
+            if not pairs:
+                return PROMETHEUS_PREFIX + name
+            text = ",".join(f'{label}="{escape(value)}"' for label, value in pairs)
+            return f"{PROMETHEUS_PREFIX}{name}{{{text}}}"
+
+        lines = []
+        typed = set()
+
+        def declare(name, kind):
+            if name not in typed:
+                typed.add(name)
+                lines.append(f"# TYPE {PROMETHEUS_PREFIX}{name} {kind}")
+
+        with self.lock:
+            declare("elapsed_seconds", "gauge")
+            lines.append(f"{series('elapsed_seconds', ())} {time.time() - self.started:.3f}")
+            for (name, labels), value in sorted(self.counters.items()):
+                declare(name, "counter")
+                lines.append(f"{series(name, labels)} {value}")
+            for (name, labels), value in sorted(self.gauges.items()):
+                declare(name, "gauge")
+                lines.append(f"{series(name, labels)} {value}")
+            for (name, labels), histogram in sorted(self.histograms.items()):
+                declare(name, "histogram")
+                cumulative = 0
+                bounds = [str(bound) for bound in histogram.buckets] + ["+Inf"]
+                for bound, count in zip(bounds, histogram.counts):
+                    cumulative += count
+                    lines.append(f"{series(name + '_bucket', labels, [('le', bound)])} {cumulative}")
+                lines.append(f"{series(name + '_sum', labels)} {histogram.total:.6f}")
+                lines.append(f"{series(name + '_count', labels)} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+    def write(self, stats_file=None, prometheus_file=None):
+        """Method to save a JSON snapshot and/or the Prometheus text format, replacing older copies"""
+        if stats_file:
+            replace_file(stats_file, json.dumps(self.snapshot(), indent=4))
+        if prometheus_file:
+            replace_file(prometheus_file, self.to_prometheus())
+
+    def start_flushing(self, interval, stats_file=None, prometheus_file=None):
+        """Method to 'write()' the statistics every 'interval' seconds on a background thread"""
+
+        def flush():
+            while not self.stop_flushing.wait(interval):
+                try:
+                    self.write(stats_file, prometheus_file)
+                except OSError as error:
+                    print(f"[!] Error: Run stats could not be saved: '{error}'")
+
+        self.flusher = threading.Thread(target=flush, daemon=True)
+        self.flusher.start()
+
+    def close(self, stats_file=None, prometheus_file=None):
+        """Stop any periodic flushing and write the final statistics"""
+        self.stop_flushing.set()
+        if self.flusher is not None:
+            self.flusher.join()
+        self.write(stats_file, prometheus_file)
+
+
+def escape(value):
+    """Escape a label value for the Prometheus text format"""
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def replace_file(out_file, text):
+    """Method to write text to a temporary file and rename it over 'out_file'"""
+    directory = os.path.dirname(out_file) or "."
+    descriptor, temp_file = tempfile.mkstemp(dir=directory, suffix=".part")
+    try:
+        with os.fdopen(descriptor, "w", encoding="utf8") as o_f:
+            o_f.write(text)
+        os.replace(temp_file, out_file)
+    except BaseException:
+        if os.path.exists(temp_file):
+            os.remove(temp_file)
+        raise
@@ -0,0 +1,273 @@
+#!/usr/bin/env python
+"""Local mock of the URLScan.io API used to test and benchmark this tool offline"""
+import sys
+import json
+import time
+import uuid
+import random
+import argparse
+import threading
+import collections
+from urllib.parse import parse_qs, urlsplit
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+__description__ = "Local mock of the URLScan.io API: accepts scans and serves results, PNGs and DOMs\
+     with configurable latency, payload sizes and injected '429' responses."
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+
+
+class MockState:
+    """Settings and shared state of a running mock server"""
+
+    def __init__(
+        self,
+        latency=0.0,
+        jitter=0.0,
+        rate_429=0.0,
+        retry_after=1,
+        scan_delay=0.0,
+        result_size=50000,
+        png_size=100000,
+        dom_size=50000,
+        quota=100000,
+        search_total=250,
+        scan_quotas=(60, 500, 5000),
+    ):
+        self.latency = latency
+        self.jitter = jitter
+        self.rate_429 = rate_429
+        self.retry_after = retry_after
+        self.scan_delay = scan_delay
+        self.quota = quota
+        self.search_total = search_total
+        # Submission limits per visibility for each quota window, reported by '/user/quotas/'
+        self.scan_quotas = dict(zip(("minute", "hour", "day"), scan_quotas))
+        self.submitted = collections.Counter()
+        self.scans = {}
+        self.requests = 0
+        self.lock = threading.Lock()
+
+        # Payloads are built once so serving them costs the server as little as possible
+        padding = "x" * max(0, result_size - 400)
+        self.result_template = {
+            "task": {"uuid": "", "url": "", "visibility": "unlisted"},
+            "page": {"domain": "example.com", "ip": "93.184.216.34", "asn": "AS15133"},
+            "verdicts": {"overall": {"score": 0, "malicious": False}},
+            "lists": {
+                "ips": ["93.184.216.34"],
+                "domains": ["example.com"],
+                "asns": ["15133"],
+                "hashes": [],
+                "certificates": [],
+            },
+            "data": {"padding": padding},
+        }
+        self.png = PNG_SIGNATURE + b"\0" * max(0, png_size - len(PNG_SIGNATURE))
+        self.dom = b"<html><body>" + b"x" * max(0, dom_size - 27) + b"</body></html>"
+
+    def count_request(self):
+        """Count a request, returns how much of the fake quota is left"""
+        with self.lock:
+            self.requests += 1
+            return max(0, self.quota - self.requests % self.quota)
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    """Request handler imitating the parts of URLScan.io used by this tool"""
+
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+    state = MockState()
+
+    def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+        """Silence the default per-request logging"""
+
+    def send_body(self, status, body, content_type="application/json"):
+        """Send a response with the rate limit headers URLScan.io includes"""
+        if not isinstance(body, bytes):
+            body = json.dumps(body).encode("utf8")
+        remaining = self.state.count_request()
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("X-Rate-Limit-Limit", str(self.state.quota))
+        self.send_header("X-Rate-Limit-Remaining", str(remaining))
+        if status == 429:
+            self.send_header("Retry-After", str(self.state.retry_after))
+            self.send_header("X-Rate-Limit-Reset-After", str(self.state.retry_after))
+        else:
+            self.send_header("X-Rate-Limit-Reset-After", "60")
+        self.end_headers()
+        self.wfile.write(body)
+
+    def simulate(self):
+        """Apply the configured latency, returns True if this request should get a '429'"""
+        delay = self.state.latency + random.uniform(0, self.state.jitter)
+        if delay > 0:
+            time.sleep(delay)
+        if self.state.rate_429 and random.random() < self.state.rate_429:
+            self.send_body(429, {"status": 429, "message": "Rate limit exceeded (mock)"})
+            return True
+        return False
+
+    def do_POST(self):  # pylint: disable=invalid-name
+        """Accept a scan submission"""
+        length = int(self.headers.get("Content-Length", 0))
+        body = self.rfile.read(length)
+        if self.simulate():
+            return
+        if self.path.rstrip("/") != "/api/v1/scan":
+            self.send_body(404, {"status": 404, "message": "Not found"})
+            return
+
+        try:
+            submission = json.loads(body)
+        except ValueError:
+            self.send_body(400, {"status": 400, "message": "Invalid JSON"})
+            return
+
+        scan_uuid = str(uuid.uuid4())
+        with self.state.lock:
+            self.state.scans[scan_uuid] = time.monotonic()
+            self.state.submitted[submission.get("visibility", "unlisted")] += 1
+        self.send_body(
+            200,
+            {
+                "message": "Submission successful",
+                "uuid": scan_uuid,
+                "result": f"http://{self.headers.get('Host')}/result/{scan_uuid}/",
+                "api": f"http://{self.headers.get('Host')}/api/v1/result/{scan_uuid}/",
+                "visibility": submission.get("visibility", "unlisted"),
+                "options": {"useragent": submission.get("customagent", "")},
+                "url": submission.get("url", ""),
+                "country": submission.get("country", "us"),
+            },
+        )
+
+    def do_GET(self):  # pylint: disable=invalid-name
+        """Serve results, searches, quotas, screenshots and DOMs"""
+        if self.simulate():
+            return
+        path = self.path.split("?", 1)[0]
+
+        if path.startswith("/api/v1/result/"):
+            scan_uuid = path[len("/api/v1/result/"):].strip("/")
+            with self.state.lock:
+                submitted = self.state.scans.get(scan_uuid)
+            if submitted is not None and time.monotonic() - submitted < self.state.scan_delay:
+                self.send_body(404, {"status": 404, "message": "Scan is not finished yet"})
+                return
+            result = dict(self.state.result_template)
+            result["task"] = {"uuid": scan_uuid, "url": "", "visibility": "unlisted"}
+            self.send_body(200, result)
+        elif path.rstrip("/") == "/api/v1/search":
+            self.send_body(200, self.search(parse_qs(urlsplit(self.path).query)))
+        elif path.rstrip("/") == "/user/quotas":
+            self.send_body(200, self.quotas())
+        elif path.startswith("/screenshots/"):
+            self.send_body(200, self.state.png, "image/png")
+        elif path.startswith("/dom/"):
+            self.send_body(200, self.state.dom, "text/html")
+        else:
+            self.send_body(404, {"status": 404, "message": "Not found"})
+
+    def quotas(self):
+        """Returns the quota status of each visibility - every submission counts against all windows"""
+        limits = {}
+        with self.state.lock:
+            for visibility in ("public", "unlisted", "private"):
+                used = self.state.submitted[visibility]
+                limits[visibility] = {
+                    window: {"limit": limit, "used": min(used, limit), "remaining": max(0, limit - used)}
+                    for window, limit in self.state.scan_quotas.items()
+                }
+        return {"source": "mock", "limits": limits}
+
+    def search(self, query):
+        """Returns a page of fake search results, honouring 'size' and the 'search_after' cursor"""
+        size = min(10000, int(query.get("size", ["100"])[0]))
+        start = 0
+        if "search_after" in query:
+            # Results are numbered in sort order - the cursor's second value is the last one sent
+            start = int(query["search_after"][0].split(",")[1]) + 1
+        end = min(self.state.search_total, start + size)
+        results = [
+            {
+                "_id": str(uuid.UUID(int=index)),
+                "task": {"uuid": str(uuid.UUID(int=index)), "url": f"https://example.com/{index}"},
+                "page": {"domain": "example.com"},
+                "sort": [1700000000000 - index, index],
+            }
+            for index in range(start, end)
+        ]
+        return {"results": results, "total": self.state.search_total, "has_more": end < self.state.search_total}
+
+
+class MockServer(ThreadingHTTPServer):
+    """Threaded HTTP server that ignores clients dropping their kept-alive connections"""
+
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+
+def start_server(state=None, host="127.0.0.1", port=0):
+    """Method to start a mock server on a background thread. Returns the server"""
+    handler = type("BoundMockHandler", (MockHandler,), {"state": state or MockState()})
+    server = MockServer((host, port), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    """Main driver method -- runs a mock URLScan.io server until interrupted"""
+    parser = argparse.ArgumentParser(description=__description__)
+    parser.add_argument("--host", default="127.0.0.1", help="Address to listen on.")
+    parser.add_argument("--port", type=int, default=8000, help="Port to listen on (0 = any).")
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds added to every response.")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Random extra seconds (0 - jitter).")
+    parser.add_argument("--rate_429", type=float, default=0.0, help="Share of requests (0-1) that get a '429'.")
+    parser.add_argument("--retry_after", type=int, default=1, help="Seconds a '429' asks clients to wait.")
+    parser.add_argument("--scan_delay", type=float, default=0.0, help="Seconds before a submitted scan finishes.")
+    parser.add_argument("--result_size", type=int, default=50000, help="Approximate bytes per result.")
+    parser.add_argument("--png_size", type=int, default=100000, help="Bytes per PNG screenshot.")
+    parser.add_argument("--dom_size", type=int, default=50000, help="Bytes per DOM.")
+    parser.add_argument("--search_total", type=int, default=250, help="Scans the search endpoint can find.")
+    parser.add_argument("--quota", type=int, default=100000, help="Requests reported per rate limit window.")
+    parser.add_argument(
+        "--scan_quotas",
+        default="60,500,5000",
+        help="Submissions allowed per minute, hour and day for each visibility (reported by '/user/quotas/').",
+    )
+    options = parser.parse_args()
+
+    state = MockState(
+        latency=options.latency,
+        jitter=options.jitter,
+        rate_429=options.rate_429,
+        retry_after=options.retry_after,
+        scan_delay=options.scan_delay,
+        result_size=options.result_size,
+        png_size=options.png_size,
+        dom_size=options.dom_size,
+        quota=options.quota,
+        search_total=options.search_total,
+        scan_quotas=tuple(int(limit) for limit in options.scan_quotas.split(",")),
+    )
+    server = start_server(state, options.host, options.port)
+    # Note: this line is read by the benchmarks to find the port that was picked
+    print(f"[+] Mock URLScan.io listening on: http://{options.host}:{server.server_port}")
+    sys.stdout.flush()
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        print("\n[-] Stopping mock server...")
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+#!/usr/bin/env python
+"""Python tools for writing and reading results as pretty, compact, JSONL or compressed JSONL files"""
+import io
+import json
+import gzip
+
+from lazy_modules import lazy_import
+
+# Optional faster JSON backend and zstd compression - the stdlib is used when they are missing
+#  (both are only loaded once they are used)
+try:
+    orjson = lazy_import("orjson")
+except ImportError:
+    orjson = None
+
+try:
+    zstandard = lazy_import("zstandard")
+except ImportError:
+    zstandard = None
+
+# --output_format -> extension of the files it writes (replacing '.json')
+OUTPUT_FORMATS = {
+    "pretty": ".json",
+    "compact": ".json",
+    "jsonl": ".jsonl",
+    "gzip": ".jsonl.gz",
+    "zstd": ".jsonl.zst",
+}
+STREAM_FORMATS = ("jsonl", "gzip", "zstd")
+
+GZIP_MAGIC = b"\x1f\x8b"
+ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+
+
+def dumps(json_content, pretty=False):
+    """Serialise JSON content to a string - pretty (indented) or on a single line"""
+    if pretty:
+        # Note: kept on the stdlib so the default output stays exactly as it was
+        return json.dumps(json_content, ensure_ascii=False, indent=4)
+    if orjson is not None:
+        try:
+            return orjson.dumps(json_content).decode("utf8")
+        except TypeError:  # e.g. integers over 64 bits - the stdlib can handle those
+            pass
+    return json.dumps(json_content, ensure_ascii=False, separators=(",", ":"))
+
+
+def loads(text):
+    """Parse JSON from a string or bytes"""
+    if orjson is not None:
+        return orjson.loads(text)
+    return json.loads(text)
+
+
+def output_path(out_file, output_format):
+    """Returns the path a '.json' result file is written to in the given output format"""
+    extension = OUTPUT_FORMATS[output_format]
+    if out_file.endswith(".json"):
+        out_file = out_file[: -len(".json")]
+    return out_file + extension
+
+
+def open_text(file_name, mode, compression=None):
+    """
+    Method to open a text file ('r', 'w' or 'a'), compressed with gzip or zstd when
+    'compression' is '.gz' or '.zst' - by default when the file name ends in either.
+    Returns a text file object
+    """
+    if compression is None:
+        compression = next(
+            (extension for extension in (".gz", ".zst") if file_name.endswith(extension)), ""
+        )
+    if compression == ".gz":
+        return gzip.open(file_name, mode + "t", encoding="utf8")
+    if compression == ".zst":
+        if zstandard is None:
+            raise ValueError("reading or writing '.zst' files requires the 'zstandard' package")
+        raw = open(file_name, mode + "b")  # pylint: disable=consider-using-with
+        if mode == "r":
+            stream = zstandard.ZstdDecompressor().stream_reader(
+                raw, read_across_frames=True, closefd=True
+            )
+        else:
+            stream = zstandard.ZstdCompressor().stream_writer(raw, closefd=True)
+        return io.TextIOWrapper(stream, encoding="utf8")
+    return open(file_name, mode, encoding="utf8")  # pylint: disable=consider-using-with
+
+
+def write_json(out_file, json_content, output_format="pretty"):
+    """
+    Method to save JSON content in an output format: 'pretty' or 'compact' write a single
+    document, the JSONL formats write a list one entry per line (optionally compressed)
+    """
+    with open_text(out_file, "w") as o_f:
+        if output_format not in STREAM_FORMATS:
+            o_f.write(dumps(json_content, pretty=output_format == "pretty"))
+            return
+        entries = json_content if isinstance(json_content, list) else [json_content]
+        for entry in entries:
+            o_f.write(dumps(entry) + "\n")
+
+
+def compression_of(file_name):
+    """Returns '.gz', '.zst' or '' depending on the compression a file's first bytes show"""
+    with open(file_name, "rb") as in_file:
+        magic = in_file.read(4)
+    if magic.startswith(GZIP_MAGIC):
+        return ".gz"
+    if magic == ZSTD_MAGIC:
+        return ".zst"
+    return ""
+
+
+def read_json(file_name):
+    """
+    Method to read JSON content from a file written in any output format (compression is
+    detected from the file's contents). A JSONL file is returned as a list of its entries
+    """
+    with open_text(file_name, "r", compression_of(file_name)) as in_file:
+        text = in_file.read()
+
+    try:
+        return loads(text)
+    except ValueError:
+        return [loads(line) for line in text.splitlines() if line.strip()]
@@ -0,0 +1,280 @@
+#!/usr/bin/env python
+"""Python tools for running URL submission, result polling and downloads as concurrent stages"""
+import time
+import heapq
+import queue
+import threading
+import collections
+
+from lazy_modules import lazy_import
+
+futures = lazy_import("concurrent.futures")
+
+
+class ScanPipeline:
+    """
+    Runs the three stages of a scan at the same time:
+      submit -> poll until the result is ready -> fetch artifacts (PNG/DOM)
+    Each UUID is handed to the polling stage as soon as its submission returns, and
+    each finished result is handed to the fetching stage as soon as it is retrieved,
+    so a batch takes roughly its submission time plus one scan instead of two batch runs.
+
+    'poll_result(uuid)' returns the result JSON, None while the scan is still running,
+    or raises an exception if the result can not be retrieved.
+    'fetch_artifacts(uuid)' (optional) downloads anything else needed for a finished scan.
+    'on_result(index, result)' (optional) receives each finished result as soon as it is
+    retrieved - without it results are kept in memory and returned by 'run()'.
+    'on_failure(uuid, reason)' (optional) is told about each UUID that could not be retrieved.
+    """
+
+    def __init__(
+        self,
+        poll_result,
+        fetch_artifacts=None,
+        on_result=None,
+        on_failure=None,
+        workers=4,
+        fetch_workers=None,
+        first_poll=10,
+        max_delay=30,
+        timeout=300,
+    ):
+        self.poll_result = poll_result
+        self.fetch_artifacts = fetch_artifacts
+        self.on_result = on_result
+        self.on_failure = on_failure
+        self.workers = max(1, workers)
+        self.fetch_workers = max(1, fetch_workers or workers)
+        self.first_poll = first_poll
+        self.max_delay = max_delay
+        self.timeout = timeout
+
+        self.poll_heap = []
+        self.fetch_queue = queue.Queue()
+        self.condition = threading.Condition()
+        self.outstanding = 0
+        self.stopping = False
+        self.results = {}
+        self.counter = 0
+
+    def run(self, submissions):
+        """
+        Method to consume an iterable of submission responses (dicts with a 'uuid' key).
+        Returns a list of result JSON in submission order, with None in place of any result
+        that could not be retrieved - or just the number of submissions if 'on_result' is set
+        """
+        threads = [
+            threading.Thread(target=self._poll_worker, daemon=True)
+            for _ in range(self.workers)
+        ]
+        if self.fetch_artifacts is not None:
+            threads += [
+                threading.Thread(target=self._fetch_worker, daemon=True)
+                for _ in range(self.fetch_workers)
+            ]
+        for thread in threads:
+            thread.start()
+
+        count = 0
+        try:
+            for index, response in enumerate(submissions):
+                count += 1
+                uuid = response.get("uuid")
+                if uuid:
+                    self._schedule(index, uuid, self.first_poll, time.monotonic(), 0)
+
+            # Wait for every submitted UUID to make it through polling and fetching
+            with self.condition:
+                while self.outstanding:
+                    self.condition.wait()
+        finally:
+            with self.condition:
+                self.stopping = True
+                self.condition.notify_all()
+            for _ in range(self.fetch_workers):
+                self.fetch_queue.put(None)
+            for thread in threads:
+                thread.join()
+
+        if self.on_result is not None:
+            return count
+        return [self.results.get(index) for index in range(count)]
+
+    def _schedule(self, index, uuid, delay, started, attempt, is_new=True):
+        """Queue a UUID to be polled once 'delay' seconds have passed"""
+        with self.condition:
+            if is_new:
+                self.outstanding += 1
+            self.counter += 1
+            heapq.heappush(
+                self.poll_heap,
+                (time.monotonic() + delay, self.counter, index, uuid, started, attempt),
+            )
+            self.condition.notify_all()
+
+    def _finish(self):
+        """Mark one UUID as having left the pipeline"""
+        with self.condition:
+            self.outstanding -= 1
+            self.condition.notify_all()
+
+    def _failed(self, uuid, reason):
+        """Report a UUID that could not be retrieved"""
+        if self.on_failure is not None:
+            self.on_failure(uuid, reason)
+
+    def _next_due(self):
+        """Block until a UUID is due to be polled. Returns None once the pipeline stops"""
+        with self.condition:
+            while True:
+                if self.stopping:
+                    return None
+                if self.poll_heap:
+                    wait_time = self.poll_heap[0][0] - time.monotonic()
+                    if wait_time <= 0:
+                        return heapq.heappop(self.poll_heap)[2:]
+                    self.condition.wait(wait_time)
+                else:
+                    self.condition.wait()
+
+    def _poll_worker(self):
+        """Poll scans that are due, rescheduling them with back-off until they finish"""
+        while True:
+            item = self._next_due()
+            if item is None:
+                return
+            index, uuid, started, attempt = item
+
+            try:
+                result = self.poll_result(uuid)
+            except Exception as error:  # pylint: disable=broad-except
+                print(f"[!] Error: Result retrieval for uuid: '{uuid}' failed: '{error}'")
+                self._failed(uuid, error)
+                self._finish()
+                continue
+
+            if result is None:
+                if time.monotonic() - started > self.timeout:
+                    print(
+                        f"[!] Error: Scan for uuid: '{uuid}' did not finish within {self.timeout} seconds."
+                    )
+                    self._failed(uuid, f"Scan did not finish within {self.timeout} seconds")
+                    self._finish()
+                    continue
+                delay = min(self.max_delay, 2 ** attempt)
+                self._schedule(index, uuid, delay, started, attempt + 1, is_new=False)
+                continue
+
+            print(f"[+] Scan results ready for uuid: '{uuid}'")
+            if self.on_result is None:
+                self.results[index] = result
+            else:
+                self.on_result(index, result)
+            if self.fetch_artifacts is None:
+                self._finish()
+            else:
+                self.fetch_queue.put(uuid)
+
+    def _fetch_worker(self):
+        """Download the artifacts of finished scans"""
+        while True:
+            uuid = self.fetch_queue.get()
+            if uuid is None:
+                return
+            try:
+                self.fetch_artifacts(uuid)
+            except Exception as error:  # pylint: disable=broad-except
+                print(f"[!] Error: Artifact download for uuid: '{uuid}' failed: '{error}'")
+            self._finish()
+
+
+def map_in_order(function, items, workers=1, journal=None, deferred=False):
+    """
+    Method to apply a function to each item using a pool of worker threads.
+    Yields results in input order, keeping at most twice 'workers' items in flight
+    With a 'journal' (ProgressJournal) each item is recorded as soon as it completes and
+    items completed by a previous run are not repeated: their saved result is yielded
+    instead, or they are skipped altogether if the journal does not keep results
+    With 'deferred' the function is called as 'function(item, record)' and the item is only
+    journaled once it calls 'record(result)' - e.g. after work it queued elsewhere finished
+    """
+    if journal is not None:
+        function, items = journal_items(function, items, journal, deferred)
+
+    if workers <= 1:
+        for item in items:
+            yield function(item)
+        return
+
+    pending = collections.deque()
+    with futures.ThreadPoolExecutor(max_workers=workers) as executor:
+        for item in items:
+            pending.append(executor.submit(function, item))
+            if len(pending) >= workers * 2:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def map_pulled(function, get, workers=1):
+    """
+    Method to apply a function to items taken from 'get()' (until it returns None) by a
+    pool of worker threads. Each worker only takes an item once it is free to work on it,
+    so no item waits in a lookahead behind others - e.g. an urgent item handed out by a
+    PriorityScheduler goes to the next free worker. Yields results in the order they finish
+    """
+    if workers <= 1:
+        for item in iter(get, None):
+            yield function(item)
+        return
+
+    finished = object()
+    results = queue.Queue()
+
+    def work():
+        try:
+            for item in iter(get, None):
+                results.put((function(item), None))
+        except BaseException as error:  # pylint: disable=broad-except
+            results.put((None, error))
+        finally:
+            results.put((finished, None))
+
+    for _ in range(workers):
+        threading.Thread(target=work, daemon=True).start()
+    running = workers
+    while running:
+        result, error = results.get()
+        if error is not None:
+            raise error
+        if result is finished:
+            running -= 1
+            continue
+        yield result
+
+
+def journal_items(function, items, journal, deferred=False):
+    """Method to wrap a function and its items so 'map_in_order' resumes from a journal"""
+
+    def run_item(entry):
+        index, item, done, result = entry
+        if done:
+            return result
+        if deferred:
+            return function(item, lambda result: journal.record(index, item, result))
+        result = function(item)
+        journal.record(index, item, result)
+        return result
+
+    def entries():
+        skipped = 0
+        for index, item in enumerate(items):
+            done, result = journal.lookup(index, item)
+            if done and not journal.keep_results:
+                skipped += 1
+                continue
+            yield index, item, done, result
+        if skipped:
+            print(f"[=] Skipped {skipped} item(s) completed by a previous run.")
+
+    return run_item, entries()
@@ -0,0 +1,187 @@
+#!/usr/bin/env python
+"""Python tools for planning a batch of URL submissions around the account's quota windows"""
+import math
+import datetime
+
+# Quota window -> its length in seconds, as reported by URLScan.io's '/user/quotas/'
+WINDOWS = {"minute": 60, "hour": 60 * 60, "day": 24 * 60 * 60}
+# Longer schedules only show their first and last phases
+MAX_PHASES_SHOWN = 12
+
+
+def parse_quotas(content):
+    """
+    Method to read the quota status returned by '/user/quotas/'. Returns a dict of
+    action (e.g. 'public', 'unlisted', 'private') -> window -> (limit, remaining)
+    """
+    quotas = {}
+    for action, windows in (content.get("limits") or {}).items():
+        if not isinstance(windows, dict):
+            continue
+        for window, status in windows.items():
+            if window not in WINDOWS or not isinstance(status, dict) or status.get("limit") is None:
+                continue
+            limit = int(status["limit"])
+            remaining = status.get("remaining")
+            if remaining is None:
+                remaining = limit - int(status.get("used") or 0)
+            quotas.setdefault(action, {})[window] = (limit, max(0, int(remaining)))
+    return quotas
+
+
+def window_reset(window, moment):
+    """
+    Returns when the quota window open at 'moment' resets (windows start on UTC boundaries,
+    the client's own 'rate' limit refills with the minute)
+    """
+    seconds = WINDOWS.get(window, WINDOWS["minute"])
+    return datetime.datetime.fromtimestamp(
+        (math.floor(moment.timestamp() / seconds) + 1) * seconds, datetime.timezone.utc
+    )
+
+
+def plan_submissions(count, windows, keys=1, rate_limit=None, now=None):
+    """
+    Method to estimate when 'count' submissions of one visibility can be sent, given its
+    quota 'windows' (window -> (limit, remaining), see 'parse_quotas') for each of 'keys'
+    API keys (assumed to share the same quota) and the client's 'rate_limit' per key and
+    minute (if any). Submissions go out as fast as every window allows, and when a window
+    runs out they wait for it to reset - the minute window at the top of each minute, the
+    hour window on the hour and the day window at midnight UTC.
+    Returns a dict with the 'start' and 'finish' times, the 'phases' of the schedule
+    (consecutive minutes sending the same number of submissions, as dicts with 'start',
+    'end', 'per_minute' and 'total') and the window that limited the batch most
+    ('limited_by', None if the batch fits in the quota left right now).
+    Raises ValueError if a window allows no submissions at all
+    """
+    now = now or datetime.datetime.now(datetime.timezone.utc)
+    limits = {window: limit * keys for window, (limit, _) in windows.items()}
+    left = {window: remaining * keys for window, (_, remaining) in windows.items()}
+    if rate_limit is not None:
+        # The client's limiter refills continuously: only part of it is left for this minute
+        limits["rate"] = rate_limit * keys
+        minute_left = (window_reset("minute", now) - now).total_seconds() / WINDOWS["minute"]
+        left["rate"] = max(1, math.floor(limits["rate"] * minute_left))
+    for window, limit in limits.items():
+        if limit <= 0:
+            raise ValueError(f"the '{window}' quota allows no submissions")
+    resets = {window: window_reset(window, now) for window in limits}
+
+    plan = {"count": count, "start": now, "finish": now, "phases": [], "limited_by": None}
+    waits = set()
+    moment = now
+    while count > 0:
+        # Every window whose boundary has passed starts again with its full limit
+        for window, reset_at in resets.items():
+            if reset_at <= moment:
+                left[window] = limits[window]
+                resets[window] = window_reset(window, moment)
+
+        sent = min([count] + list(left.values()))
+        if sent > 0:
+            # Submissions are spread across the minute at the per-minute rate (if there is one)
+            per_minute = min(limits.get("minute", math.inf), limits.get("rate", math.inf))
+            finish = moment
+            if per_minute != math.inf:
+                finish += min(
+                    window_reset("minute", moment) - moment,
+                    datetime.timedelta(seconds=60.0 * sent / per_minute),
+                )
+            _add_minute(plan["phases"], moment, finish, sent)
+            plan["finish"] = finish
+            count -= sent
+            for window in left:
+                left[window] -= sent
+            if count == 0:
+                break
+
+        # Wait for the windows that ran out (only the next minute if none did)
+        exhausted = [window for window, remaining in left.items() if remaining <= 0]
+        if exhausted:
+            moment = max(resets[window] for window in exhausted)
+            waits.update(exhausted)
+        else:
+            moment = min(resets.values())
+
+    if waits:
+        # The longest window the batch had to wait for
+        plan["limited_by"] = max(waits, key=lambda window: WINDOWS.get(window, WINDOWS["minute"]))
+    return plan
+
+
+def _add_minute(phases, start, end, sent):
+    """Add one minute of submissions to the phases, extending the last phase if it matches"""
+    last = phases[-1] if phases else None
+    if (
+        last is not None
+        and last["per_minute"] == sent
+        and (start - last["last_minute"]).total_seconds() <= 60
+    ):
+        last.update(end=end, total=last["total"] + sent, minutes=last["minutes"] + 1, last_minute=start)
+        return
+    phases.append(
+        {"start": start, "end": end, "per_minute": sent, "total": sent, "minutes": 1, "last_minute": start}
+    )
+
+
+def pacing_rate(plan, windows, keys=1):
+    """
+    Returns the submissions per key and minute that spread a planned batch evenly across its
+    windows instead of sending at full speed until one runs out, or None if the batch fits in
+    the quota left right now (or in the minutes it takes at full speed). The pace never goes
+    above what the hour and day 'windows' the batch runs out of can sustain: their remaining
+    quota spread over their length in minutes
+    """
+    if plan["limited_by"] in (None, "minute", "rate"):
+        return None
+    minutes = max(1.0, (plan["finish"] - plan["start"]).total_seconds() / 60)
+    pace = max(1, math.ceil(plan["count"] / minutes / keys))
+    for window, (_, remaining) in windows.items():
+        if WINDOWS[window] > WINDOWS["minute"] and plan["count"] > remaining * keys:
+            pace = min(pace, max(1, math.floor(remaining * WINDOWS["minute"] / WINDOWS[window])))
+    return pace
+
+
+def format_duration(seconds):
+    """Returns a duration as e.g. '2d 3h 5m' (or '45s' under a minute)"""
+    seconds = int(math.ceil(seconds))
+    if seconds < 60:
+        return f"{seconds}s"
+    days, seconds = divmod(seconds, 24 * 60 * 60)
+    hours, seconds = divmod(seconds, 60 * 60)
+    minutes = int(math.ceil(seconds / 60))
+    parts = [f"{value}{unit}" for value, unit in ((days, "d"), (hours, "h"), (minutes, "m")) if value]
+    return " ".join(parts) or "0m"
+
+
+def format_plan(visibility, plan, windows, pace=None):
+    """Returns the lines describing a planned batch, one per phase of its schedule"""
+    quota = ", ".join(f"{remaining}/{limit} per {window}" for window, (limit, remaining) in windows.items())
+    lines = [f"[*] {visibility}: {plan['count']} submission(s) - quota left: {quota or 'unknown'}"]
+    phases = plan["phases"]
+    if len(phases) > MAX_PHASES_SHOWN:
+        hidden = phases[MAX_PHASES_SHOWN - 2:-1]
+        phases = phases[:MAX_PHASES_SHOWN - 2] + [None] + phases[-1:]
+    for phase in phases:
+        if phase is None:
+            lines.append(f"\t... {sum(entry['total'] for entry in hidden)} more in {len(hidden)} phases ...")
+        elif phase["minutes"] > 1:
+            # Phases running past midnight show the day they end on too
+            end_format = "%H:%M" if phase["end"].date() == phase["start"].date() else "%Y-%m-%d %H:%M"
+            end = phase["end"].strftime(end_format)
+            lines.append(
+                f"\t{phase['start']:%Y-%m-%d %H:%M} - {end} UTC:"
+                f" {phase['total']} ({phase['per_minute']}/minute for {phase['minutes']} minutes)"
+            )
+        else:
+            lines.append(f"\t{phase['start']:%Y-%m-%d %H:%M} UTC: {phase['total']}")
+    duration = format_duration((plan["finish"] - plan["start"]).total_seconds())
+    limited = ""
+    if plan["limited_by"] == "rate":
+        limited = ", paced" if pace is not None else ", limited by --rate_limit"
+    elif plan["limited_by"]:
+        limited = f", limited by the {plan['limited_by']} quota"
+    lines.append(f"[+] Estimated finish: {plan['finish']:%Y-%m-%d %H:%M} UTC (in {duration}{limited})")
+    if pace is not None:
+        lines.append(f"[+] Pacing at {pace}/minute per key spreads the submissions across the windows")
+    return lines
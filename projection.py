@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+"""Python tools for keeping only selected fields of scan results, parsing them incrementally"""
+from lazy_modules import lazy_import, resolve
+from output_formats import loads
+
+# Optional incremental JSON parser - without it the whole document is parsed, then trimmed
+try:
+    ijson = lazy_import("ijson")
+except ImportError:
+    ijson = None
+
+START_EVENTS = ("start_map", "start_array")
+END_EVENTS = ("end_map", "end_array")
+
+
+def parse_fields(spec):
+    """
+    Method to parse a comma separated list of dotted field paths
+    (e.g. 'verdicts,page,lists.ips') into a tuple of key tuples
+    """
+    fields = []
+    for path in spec.split(","):
+        keys = tuple(key for key in path.strip().split(".") if key)
+        if keys:
+            fields.append(keys)
+    if not fields:
+        raise ValueError("at least one field is required")
+    return tuple(fields)
+
+
+def load_parser():
+    """Method to import the incremental parser (if installed) before worker threads use it"""
+    resolve(ijson)
+
+
+def set_path(document, keys, value):
+    """Store a value in a nested dict, creating the dicts along its path"""
+    for key in keys[:-1]:
+        document = document.setdefault(key, {})
+    document[keys[-1]] = value
+
+
+def select_fields(document, fields):
+    """Returns a copy of a result holding only the given field paths (all of it if None)"""
+    if fields is None or not isinstance(document, dict):
+        return document
+
+    selected = {}
+    for keys in fields:
+        value = document
+        for key in keys:
+            if not isinstance(value, dict) or key not in value:
+                break
+            value = value[key]
+        else:
+            set_path(selected, keys, value)
+    return selected
+
+
+def parse_selected(stream, fields):
+    """
+    Method to parse a result from a binary stream keeping only the given field paths.
+    With 'ijson' installed the body is parsed incrementally and only the selected values
+    are ever built in memory, so a multi-megabyte result costs a few kilobytes to keep
+    """
+    if ijson is None:
+        return select_fields(loads(stream.read()), fields)
+
+    wanted = {".".join(keys): keys for keys in fields}
+    selected = {}
+    builder = None
+    keys = None
+    depth = 0
+    # Note: use_float keeps numbers as floats rather than Decimals, which json can not encode
+    for prefix, event, value in ijson.parse(stream, use_float=True):
+        if builder is None:
+            # A selected value starts where its prefix matches (map keys belong to the parent)
+            if prefix not in wanted or event == "map_key" or event in END_EVENTS:
+                continue
+            builder = ijson.ObjectBuilder()
+            keys = wanted[prefix]
+            depth = 0
+        builder.event(event, value)
+        if event in START_EVENTS:
+            depth += 1
+        elif event in END_EVENTS:
+            depth -= 1
+        if depth == 0:
+            set_path(selected, keys, builder.value)
+            builder = None
+    return selected
@@ -0,0 +1,219 @@
+#!/usr/bin/env python
+"""Python tools for pacing requests sent to URLScan.io so a batch stays within its quota"""
+import time
+import datetime
+import threading
+
+
+class TokenBucket:
+    """
+    Thread safe token bucket shared by every worker submitting to URLScan.io.
+    Tokens refill continuously at 'rate_per_minute' and up to 'capacity' may be
+    spent in a burst, after that each caller waits for the next token to arrive.
+    """
+
+    def __init__(self, rate_per_minute, capacity=1):
+        if rate_per_minute <= 0:
+            raise ValueError("rate_per_minute must be greater than 0")
+        self.rate = rate_per_minute / 60.0
+        self.capacity = max(1, int(capacity))
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self):
+        """Add the tokens earned since the last refill, never exceeding capacity"""
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self):
+        """Returns the seconds until a token will be available, without spending one"""
+        with self.lock:
+            self._refill()
+            if self.tokens >= 1:
+                return 0.0
+            return (1 - self.tokens) / self.rate
+
+    def acquire(self):
+        """Block until a token is available and then spend it. Returns seconds waited"""
+        waited = 0.0
+        while True:
+            with self.lock:
+                self._refill()
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return waited
+                delay = (1 - self.tokens) / self.rate
+            time.sleep(delay)
+            waited += delay
+
+
+class RateLimitController:
+    """
+    Thread safe controller that tracks the rate limit headers URLScan.io returns with
+    every response. State is kept per action (e.g. 'public', 'unlisted', 'private',
+    'retrieve') so each quota is paced on its own. Requests are spread out once the
+    remaining quota runs low and held until the window resets once it is used up,
+    instead of waiting for a '429' to arrive.
+    """
+
+    def __init__(self, buckets=None, slow_down_below=0.1, default_delay=60):
+        self.buckets = buckets or {}
+        self.slow_down_below = slow_down_below
+        self.default_delay = default_delay
+        self.quotas = {}
+        self.lock = threading.Lock()
+
+    def acquire(self, action):
+        """Block until a request for 'action' may be sent. Returns seconds waited"""
+        waited = 0.0
+        while True:
+            with self.lock:
+                delay = self._delay_for(action)
+                if delay <= 0:
+                    quota = self.quotas.get(action)
+                    if quota and quota["remaining"] is not None:
+                        # Reserve this request now so other workers see the lower count
+                        quota["remaining"] -= 1
+                        quota["last_sent"] = time.monotonic()
+                    break
+            time.sleep(delay)
+            waited += delay
+
+        bucket = self.buckets.get(action)
+        if bucket is not None:
+            waited += bucket.acquire()
+        return waited
+
+    def status(self, action):
+        """
+        Returns (seconds until a request for 'action' may be sent, remaining quota or None)
+        without reserving anything - used to compare several controllers
+        """
+        with self.lock:
+            delay = self._delay_for(action)
+            quota = self.quotas.get(action)
+            remaining = quota["remaining"] if quota else None
+        bucket = self.buckets.get(action)
+        if bucket is not None:
+            delay = max(delay, bucket.wait_time())
+        return delay, remaining
+
+    def _delay_for(self, action):
+        """Seconds to wait before the next request for 'action' - caller holds the lock"""
+        quota = self.quotas.get(action)
+        if not quota or quota["remaining"] is None:
+            return 0
+        now = time.monotonic()
+        reset_in = quota["reset_at"] - now
+        if reset_in <= 0:
+            # The window has rolled over: forget the old counts until new headers arrive
+            del self.quotas[action]
+            return 0
+        if quota["remaining"] <= 0:
+            return reset_in
+
+        # Spread the last few requests of the window evenly across the time left
+        limit = quota["limit"] or 0
+        if quota["remaining"] <= limit * self.slow_down_below:
+            spacing = reset_in / quota["remaining"]
+            next_slot = quota["last_sent"] + spacing
+            if next_slot > now:
+                return next_slot - now
+        return 0
+
+    def update(self, response, action):
+        """
+        Record the quota reported in the headers of a response for 'action'.
+        Returns the number of seconds until the window resets if the response is a '429'
+        """
+        headers = response.headers
+        remaining = to_number(headers.get("X-Rate-Limit-Remaining"))
+        limit = to_number(headers.get("X-Rate-Limit-Limit"))
+        reset_after = get_reset_after(headers)
+
+        if response.status_code == 429:
+            remaining = 0
+            if reset_after is None:
+                reset_after = self.default_delay
+        elif remaining is None or reset_after is None:
+            return 0
+
+        with self.lock:
+            quota = self.quotas.setdefault(
+                action, {"limit": None, "remaining": None, "reset_at": 0, "last_sent": 0}
+            )
+            if limit is not None:
+                quota["limit"] = limit
+            quota["remaining"] = remaining
+            quota["reset_at"] = time.monotonic() + reset_after
+
+        if response.status_code == 429:
+            return reset_after
+        return 0
+
+
+def to_number(value):
+    """Convert a header value to a number, returns None if it is missing or malformed"""
+    try:
+        return int(float(value))
+    except (TypeError, ValueError):
+        return None
+
+
+def get_reset_after(headers):
+    """
+    Method to find the seconds until the current quota window resets from a set of headers.
+    Checks 'X-Rate-Limit-Reset-After', then the 'X-Rate-Limit-Reset' timestamp and finally
+    'Retry-After'. Returns None if none of them are present
+    """
+    reset_after = headers.get("X-Rate-Limit-Reset-After")
+    if reset_after is not None:
+        try:
+            return max(0.0, float(reset_after))
+        except ValueError:
+            pass
+
+    reset_at = headers.get("X-Rate-Limit-Reset")
+    if reset_at:
+        try:
+            reset_time = datetime.datetime.fromisoformat(reset_at.replace("Z", "+00:00"))
+            now = datetime.datetime.now(datetime.timezone.utc)
+            return max(0.0, (reset_time - now).total_seconds())
+        except ValueError:
+            pass
+
+    retry_after = headers.get("Retry-After")
+    if retry_after is not None:
+        try:
+            return max(0.0, float(retry_after))
+        except ValueError:
+            pass
+
+    return None
+
+
+def main():
+    """Main driver method -- provides simple test for the token bucket"""
+    #####################################################################
+    print("\n")
+    print("*** " * 12)
+    print("\n[*] Initializing program....\n")
+    #####################################################################
+    bucket = TokenBucket(120, capacity=2)
+    start = time.monotonic()
+    for index in range(6):
+        bucket.acquire()
+        print(f"[+] Token {index + 1} acquired after {time.monotonic() - start:.2f} seconds")
+
+    print("\n[*] Testing Complete...")
+    #####################################################################
+    print("[+] Exiting program!\n")
+    print("*** " * 12)
+    print("\n")
+    #####################################################################
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+#!/usr/bin/env python
+"""Python tools for caching finished URLScan.io results, PNGs and DOMs on disk"""
+import os
+import time
+import sqlite3
+import threading
+
+DEFAULT_CACHE_FILE = os.path.join(os.path.expanduser("~"), ".yall_scan", "cache.sqlite")
+DEFAULT_MAX_ENTRY_BYTES = 8 * 1024 * 1024
+
+
+class ResultCache:
+    """
+    Size bounded cache of URLScan.io downloads stored in a single SQLite file.
+    Entries are keyed by UUID and kind ('result', 'png' or 'dom') - a finished scan never
+    changes so entries never expire, instead the least recently used entries are
+    evicted once the total size of the cache grows past 'max_bytes'. Bodies larger than
+    'max_entry_bytes' are not cached, so a huge PNG or DOM is never held in memory whole.
+    With 'refresh' set every lookup misses, so fresh downloads replace the cached copies.
+    """
+
+    def __init__(
+        self,
+        cache_file=DEFAULT_CACHE_FILE,
+        max_bytes=512 * 1024 * 1024,
+        refresh=False,
+        max_entry_bytes=DEFAULT_MAX_ENTRY_BYTES,
+    ):
+        directory = os.path.dirname(cache_file)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = min(max_bytes, max_entry_bytes)
+        self.refresh = refresh
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(cache_file, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute(
+            """CREATE TABLE IF NOT EXISTS cache (
+                uuid TEXT NOT NULL,
+                kind TEXT NOT NULL,
+                body BLOB NOT NULL,
+                size INTEGER NOT NULL,
+                accessed REAL NOT NULL,
+                PRIMARY KEY (uuid, kind)
+            )"""
+        )
+        self.connection.execute(
+            "CREATE INDEX IF NOT EXISTS cache_accessed ON cache (accessed)"
+        )
+        self.connection.commit()
+        self.total_size = self.connection.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM cache"
+        ).fetchone()[0]
+
+    def get(self, uuid, kind):
+        """Returns the cached body (bytes) for a UUID, or None if it is not cached"""
+        if self.refresh:
+            return None
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT body FROM cache WHERE uuid = ? AND kind = ?", (uuid, kind)
+            ).fetchone()
+            if row is None:
+                return None
+            self.connection.execute(
+                "UPDATE cache SET accessed = ? WHERE uuid = ? AND kind = ?",
+                (time.time(), uuid, kind),
+            )
+            self.connection.commit()
+        return bytes(row[0])
+
+    def accepts(self, size):
+        """Check whether a body of 'size' bytes would be cached"""
+        return size <= self.max_entry_bytes
+
+    def put(self, uuid, kind, body):
+        """Store the body (bytes) downloaded for a UUID, evicting old entries if needed"""
+        size = len(body)
+        if not self.accepts(size):
+            return
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT size FROM cache WHERE uuid = ? AND kind = ?", (uuid, kind)
+            ).fetchone()
+            if row is not None:
+                self.total_size -= row[0]
+            self.connection.execute(
+                "INSERT OR REPLACE INTO cache VALUES (?, ?, ?, ?, ?)",
+                (uuid, kind, sqlite3.Binary(body), size, time.time()),
+            )
+            self.total_size += size
+            self._evict()
+            self.connection.commit()
+
+    def _evict(self):
+        """Delete least recently used entries until the cache fits - caller holds the lock"""
+        while self.total_size > self.max_bytes:
+            rows = self.connection.execute(
+                "SELECT uuid, kind, size FROM cache ORDER BY accessed LIMIT 64"
+            ).fetchall()
+            if not rows:
+                self.total_size = 0
+                return
+            for uuid, kind, size in rows:
+                self.connection.execute(
+                    "DELETE FROM cache WHERE uuid = ? AND kind = ?", (uuid, kind)
+                )
+                self.total_size -= size
+                if self.total_size <= self.max_bytes:
+                    return
+
+    def close(self):
+        """Close the underlying database"""
+        with self.lock:
+            self.connection.close()
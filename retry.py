@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+"""Python tools for retrying failed requests to URLScan.io and recording items that still fail"""
+import json
+import time
+import random
+import threading
+
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+
+class RetryPolicy:
+    """
+    Decides whether a request to URLScan.io should be attempted again and for how long to wait.
+    Up to 'max_attempts' attempts are made in total. Responses with a status in
+    'retry_statuses' and errors that are instances of 'retry_exceptions' are retried after an
+    exponential back-off (base_delay * 2 ** attempt, capped at max_delay) with full jitter,
+    so workers that failed together do not all retry at the same moment.
+    'retry_exceptions' may also be a callable returning the exception classes - it is only
+    called once an error has to be checked, so their module need not be loaded before then.
+    """
+
+    def __init__(
+        self,
+        max_attempts=5,
+        base_delay=1.0,
+        max_delay=60.0,
+        retry_statuses=RETRY_STATUSES,
+        retry_exceptions=(),
+    ):
+        self.max_attempts = max(1, max_attempts)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.retry_statuses = frozenset(retry_statuses)
+        self.retry_exceptions = retry_exceptions
+        if not callable(retry_exceptions):
+            self.retry_exceptions = tuple(retry_exceptions)
+
+    def can_retry(self, attempt):
+        """Check whether another attempt is allowed after 'attempt' attempts"""
+        return attempt < self.max_attempts
+
+    def retry_status(self, status_code):
+        """Check whether a response status is worth retrying"""
+        return status_code in self.retry_statuses
+
+    def retry_error(self, error):
+        """Check whether an exception raised by a request is worth retrying"""
+        if callable(self.retry_exceptions):
+            self.retry_exceptions = tuple(self.retry_exceptions())
+        return isinstance(error, self.retry_exceptions)
+
+    def backoff(self, attempt):
+        """Returns a jittered delay (seconds) to wait after the given failed attempt"""
+        ceiling = min(self.max_delay, self.base_delay * (2 ** (attempt - 1)))
+        return random.uniform(0, ceiling)
+
+    def sleep(self, attempt):
+        """Wait for the back-off after the given failed attempt. Returns seconds waited"""
+        delay = self.backoff(attempt)
+        time.sleep(delay)
+        return delay
+
+
+class DeadLetterQueue:
+    """
+    Collects the items of a batch that failed even after retrying, appending each one to a
+    JSONL file so they can be inspected and resubmitted later instead of stopping the run.
+    The file is only created once the first failure is recorded.
+    """
+
+    def __init__(self, dead_letter_file):
+        self.dead_letter_file = dead_letter_file
+        self.count = 0
+        self.lock = threading.Lock()
+
+    def record(self, kind, item, reason):
+        """Append a failed item ('url' or 'uuid') and the reason it failed"""
+        record = {"type": kind, "item": item, "reason": str(reason), "time": time.time()}
+        line = json.dumps(record, ensure_ascii=False) + "\n"
+        with self.lock:
+            with open(self.dead_letter_file, "a", encoding="utf8") as o_f:
+                o_f.write(line)
+            self.count += 1
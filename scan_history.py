@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+"""Python tools for remembering which URLs were recently submitted to URLScan.io"""
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+
+DEFAULT_HISTORY_FILE = os.path.join(os.path.expanduser("~"), ".yall_scan", "history.sqlite")
+
+
+class ScanHistory:
+    """
+    Persistent index of URL -> (UUID, scan time, submission response) stored in SQLite.
+    URLs are keyed by the SHA-1 of the URL in a table without rowids, so lookups stay a single
+    primary key probe even with millions of entries. A URL scanned less than 'ttl' seconds ago
+    is considered fresh and its earlier submission can be reused instead of scanning it again.
+    A visibility and/or country given with a URL are part of its key, so e.g. a private scan
+    is never answered with an earlier public scan of the same URL.
+    """
+
+    def __init__(self, history_file=DEFAULT_HISTORY_FILE, ttl=24 * 60 * 60):
+        directory = os.path.dirname(history_file)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(history_file, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.execute(
+            """CREATE TABLE IF NOT EXISTS history (
+                url_key BLOB PRIMARY KEY,
+                uuid TEXT NOT NULL,
+                scanned REAL NOT NULL,
+                response TEXT NOT NULL
+            ) WITHOUT ROWID"""
+        )
+        self.connection.commit()
+
+    @staticmethod
+    def url_key(url, visibility=None, country=None):
+        """Returns the fixed size key a URL (scanned with a visibility and country) is stored under"""
+        if visibility is not None or country is not None:
+            url = "\0".join((url, visibility or "", country or ""))
+        return hashlib.sha1(url.encode("utf8")).digest()
+
+    def recent(self, url, visibility=None, country=None):
+        """Returns the saved submission response for a URL scanned within the TTL, else None"""
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT scanned, response FROM history WHERE url_key = ?",
+                (self.url_key(url, visibility, country),),
+            ).fetchone()
+        if row is None or time.time() - row[0] > self.ttl:
+            return None
+        return json.loads(row[1])
+
+    def record(self, url, response_json, visibility=None, country=None):
+        """Save the submission response for a URL (ignored if it does not contain a UUID)"""
+        uuid = response_json.get("uuid")
+        if not uuid:
+            return
+        with self.lock:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO history VALUES (?, ?, ?, ?)",
+                (self.url_key(url, visibility, country), uuid, time.time(), json.dumps(response_json)),
+            )
+            self.connection.commit()
+
+    def close(self):
+        """Close the underlying database"""
+        with self.lock:
+            self.connection.close()
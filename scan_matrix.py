@@ -0,0 +1,103 @@
+#!/usr/bin/env python
+"""Python tools for scanning each URL from several countries and with several user agents"""
+import random
+
+import user_agents as UA
+
+# Result field -> its path in a scan result, compared between the variants of a URL
+COMPARED_FIELDS = {
+    "final_url": ("page", "url"),
+    "domain": ("page", "domain"),
+    "ip": ("page", "ip"),
+    "status": ("page", "status"),
+    "title": ("page", "title"),
+    "malicious": ("verdicts", "overall", "malicious"),
+}
+
+
+def parse_agent_types(names):
+    """
+    Method to resolve user agent type names (any case, 'all' for every type) from the
+    'user_agents' registry. Returns the types in order without repeats, raises ValueError
+    """
+    types = []
+    for name in names:
+        types.extend(UA.AGENT_TYPES if name.lower() == "all" else [UA.find_agent_type(name)])
+    return list(dict.fromkeys(types))
+
+
+def choose_agents(agent_types, default_agent=None):
+    """
+    Method to pick the user agent representing each type. The pick is seeded by the type's
+    name, so every URL and every run (e.g. one resumed with '--resume') uses the same agents
+    and the variants stay comparable. Without any 'agent_types' the 'default_agent' is used.
+    Returns a dict of agent type (None for the default) -> user agent
+    """
+    agents = {
+        agent_type: random.Random(agent_type).choice(UA.USER_AGENTS[agent_type])
+        for agent_type in agent_types
+    }
+    return agents or {None: default_agent}
+
+
+def build_variants(urls, countries, agent_types):
+    """
+    Method to build every combination of URL, country and user agent type (the 'agents'
+    of 'choose_agents'). Returns a list of dicts ('url', 'country', 'agent_type') - the
+    agent itself is left out so a journaled variant matches even if the default agent changes
+    """
+    return [
+        {"url": url, "country": country, "agent_type": agent_type}
+        for url in urls
+        for country in countries
+        for agent_type in agent_types
+    ]
+
+
+def summarize_result(scan_content):
+    """Returns the compared fields (see COMPARED_FIELDS) of a scan result"""
+    summary = {}
+    for field, path in COMPARED_FIELDS.items():
+        value = scan_content
+        for key in path:
+            value = value.get(key) if isinstance(value, dict) else None
+        summary[field] = value
+    return summary
+
+
+def group_variants(items, agents, responses, results=None):
+    """
+    Method to group the submissions of a matrix run by URL. 'items' are the submitted
+    variants (see 'build_variants') with the 'agents' they used, 'responses' their submission
+    JSON and 'results' (optional) their scan results, all in the same order. Returns a list of dicts holding
+    the 'url' and its 'variants' (country, agent type, UUID and any error) - with results,
+    each variant also holds its compared fields, and 'differs' names the fields that are
+    not the same for every variant (e.g. a page cloaked from some countries or devices)
+    """
+    groups = {}
+    for index, (item, response) in enumerate(zip(items, responses)):
+        variant = {
+            "country": item["country"],
+            "agent_type": item["agent_type"],
+            "customagent": agents[item["agent_type"]],
+            "uuid": response.get("uuid") or "",
+            "result": response.get("result"),
+        }
+        if not variant["uuid"]:
+            variant["message"] = response.get("message") or response.get("description")
+        if results is not None and results[index] is not None:
+            variant.update(summarize_result(results[index]))
+        groups.setdefault(item["url"], []).append(variant)
+
+    grouped = []
+    for url, variants in groups.items():
+        entry = {"url": url, "variants": variants}
+        if results is not None:
+            scanned = [variant for variant in variants if "final_url" in variant]
+            entry["differs"] = [
+                field
+                for field in COMPARED_FIELDS
+                if len({repr(variant[field]) for variant in scanned}) > 1
+            ]
+        grouped.append(entry)
+    return grouped
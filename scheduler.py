@@ -0,0 +1,191 @@
+#!/usr/bin/env python
+"""Python tools for scheduling URL submissions by priority and visibility"""
+import csv
+import json
+import itertools
+import collections
+import threading
+
+VISIBILITIES = ("public", "unlisted", "private")
+# Priority class -> weight: its share of the submissions of a visibility while others wait too
+PRIORITY_WEIGHTS = {"urgent": 8, "high": 4, "normal": 2, "low": 1}
+DEFAULT_PRIORITY = "normal"
+# Item fields passed on to the scan request
+SCAN_FIELDS = ("visibility", "tags", "country", "customagent")
+
+
+def parse_weights(spec, weights=None):
+    """
+    Method to parse priority weights (e.g. 'urgent:20,low:1') on top of 'weights'
+    (PRIORITY_WEIGHTS by default). Returns a new dict of priority class -> weight
+    """
+    weights = dict(weights or PRIORITY_WEIGHTS)
+    for entry in spec.split(","):
+        name, _, value = entry.strip().partition(":")
+        name = name.lower()
+        if name not in weights:
+            raise ValueError(f"unknown priority '{name}' (choose from: {', '.join(weights)})")
+        try:
+            weights[name] = float(value)
+        except ValueError:
+            raise ValueError(f"invalid weight for '{name}': '{value}'") from None
+        if weights[name] <= 0:
+            raise ValueError(f"the weight for '{name}' must be greater than 0")
+    return weights
+
+
+def parse_item(record):
+    """
+    Method to normalise one scheduled item (a dict with a 'url' and optionally a 'priority',
+    'visibility', 'tags', 'country' and 'customagent'). Returns the item, raises ValueError
+    """
+    url = (record.get("url") or "").strip()
+    if not url:
+        raise ValueError("missing 'url'")
+    item = {"url": url, "priority": (record.get("priority") or DEFAULT_PRIORITY).strip().lower()}
+    if item["priority"] not in PRIORITY_WEIGHTS:
+        raise ValueError(f"unknown priority '{item['priority']}' for '{url}'")
+
+    visibility = (record.get("visibility") or "").strip().lower()
+    if visibility:
+        if visibility not in VISIBILITIES:
+            raise ValueError(f"unknown visibility '{visibility}' for '{url}'")
+        item["visibility"] = visibility
+    tags = record.get("tags")
+    if isinstance(tags, str):
+        # CSV cells hold tags separated by ';' or spaces
+        tags = tags.replace(";", " ").split()
+    if tags:
+        item["tags"] = list(tags)
+    for field in ("country", "customagent"):
+        if record.get(field):
+            item[field] = record[field].strip()
+    return item
+
+
+def read_items(in_file):
+    """
+    Method to read scheduled items from an open file: JSONL (one object per line) or CSV
+    with a header row naming its columns ('url', 'priority', 'visibility', ...).
+    Yields the items, raises ValueError (with the line number) for an invalid one
+    """
+    first_line = in_file.readline()
+    if first_line.lstrip().startswith("{"):
+        for number, line in enumerate(itertools.chain([first_line], in_file), 1):
+            if line.strip():
+                try:
+                    yield parse_item(json.loads(line))
+                except (ValueError, AttributeError) as error:
+                    raise ValueError(f"line {number}: {error}") from None
+        return
+
+    header = [name.strip().lower() for name in next(csv.reader([first_line]), [])]
+    if "url" not in header:
+        raise ValueError("line 1: CSV input needs a header row with a 'url' column")
+    for number, row in enumerate(csv.DictReader(in_file, fieldnames=header), 2):
+        if any(value.strip() for value in row.values() if isinstance(value, str)):
+            try:
+                yield parse_item(row)
+            except ValueError as error:
+                raise ValueError(f"line {number}: {error}") from None
+
+
+def parse_line(line):
+    """Method to parse a line of a watched source: a URL or a JSON item. Returns the item"""
+    if line.startswith("{"):
+        return parse_item(json.loads(line))
+    return {"url": line, "priority": DEFAULT_PRIORITY}
+
+
+class PriorityScheduler:
+    """
+    Weighted fair scheduler for URL submissions. Items wait in one queue per visibility and
+    priority class, and iterating over the scheduler hands them out as submissions can go:
+      - visibilities are independent: each has its own quota budget (the client's limiters
+        for that visibility, see 'ready_in'), so private items never wait behind a public
+        backlog that has run out of quota
+      - within a visibility, priority classes share the submissions in proportion to their
+        weights (stride scheduling). A class that was idle joins at the current virtual time,
+        so an urgent item goes out with the next free submission instead of behind the bulk
+    'ready_in(visibility)' returns the seconds until a submission of that visibility may be sent.
+    Iteration ends once 'close()' has been called and every item has been handed out.
+    """
+
+    def __init__(self, ready_in=None, weights=None, default_visibility="public"):
+        self.ready_in = ready_in or (lambda visibility: 0.0)
+        self.weights = dict(weights or PRIORITY_WEIGHTS)
+        self.default_visibility = default_visibility
+        self.queues = collections.defaultdict(dict)
+        self.passes = {}
+        self.virtual_time = collections.defaultdict(float)
+        self.counts = collections.Counter()
+        self.closed = False
+        self.condition = threading.Condition()
+
+    def put(self, item):
+        """Queue an item (see 'parse_item') for submission"""
+        visibility = item.get("visibility", self.default_visibility)
+        priority = item.get("priority", DEFAULT_PRIORITY)
+        with self.condition:
+            waiting = self.queues[visibility].setdefault(priority, collections.deque())
+            if not waiting:
+                # An idle class starts from now - it can not catch up on the turns it missed
+                key = (visibility, priority)
+                self.passes[key] = max(self.passes.get(key, 0.0), self.virtual_time[visibility])
+            waiting.append(item)
+            self.counts[priority] += 1
+            self.condition.notify()
+
+    def close(self):
+        """No more items will be queued - iteration ends once the queued ones are handed out"""
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+
+    def pending(self):
+        """Returns the number of items waiting to be handed out"""
+        with self.condition:
+            return sum(len(waiting) for classes in self.queues.values() for waiting in classes.values())
+
+    def __iter__(self):
+        while True:
+            item = self.get()
+            if item is None:
+                return
+            yield item
+
+    def get(self):
+        """Wait for the next item that may be submitted. Returns None once closed and empty"""
+        with self.condition:
+            while True:
+                waiting = [visibility for visibility, classes in self.queues.items() if any(classes.values())]
+                if not waiting:
+                    if self.closed:
+                        return None
+                    self.condition.wait()
+                    continue
+                delays = {visibility: self.ready_in(visibility) for visibility in waiting}
+                visibility = min(waiting, key=lambda name: (delays[name], self._next_pass(name)))
+                if delays[visibility] <= 0:
+                    return self._pop(visibility)
+                # Note: woken early if an item of another (ready) visibility arrives
+                self.condition.wait(min(delays[visibility], 1.0))
+
+    def _next_class(self, visibility):
+        """The priority class of a visibility whose turn is next - caller holds the lock"""
+        classes = [priority for priority, waiting in self.queues[visibility].items() if waiting]
+        return min(
+            classes,
+            key=lambda priority: (self.passes[(visibility, priority)], -self.weights[priority]),
+        )
+
+    def _next_pass(self, visibility):
+        return self.passes[(visibility, self._next_class(visibility))]
+
+    def _pop(self, visibility):
+        """Hand out the next item of a visibility - caller holds the lock"""
+        priority = self._next_class(visibility)
+        key = (visibility, priority)
+        self.virtual_time[visibility] = self.passes[key]
+        self.passes[key] += 1.0 / self.weights[priority]
+        return self.queues[visibility][priority].popleft()
@@ -0,0 +1,146 @@
+#!/usr/bin/env python
+"""Python tools for feeding a long running scan with URLs from spool directories, named pipes or stdin"""
+import os
+import sys
+import stat
+import time
+import queue
+import threading
+
+# Files still being written by a producer: ignored until they are renamed
+PARTIAL_SUFFIXES = (".part", ".tmp", ".swp")
+PROCESSED_DIR = "processed"
+# Seconds a spool file must go unmodified before it is read
+SETTLE_SECONDS = 1.0
+
+
+class URLFeed:
+    """
+    Merges URLs from any number of sources into one bounded queue, consumed by iterating
+    over the feed. Sources are read on their own threads:
+      - a directory is watched as a spool: each new file (one URL per line) is read once it
+        has settled and then moved to '<directory>/processed/'
+      - a named pipe is read line by line and reopened whenever its writer closes it
+      - '-' reads stdin until it ends
+    Iteration ends once 'stop()' is called and every queued URL has been handed out (so a
+    shutdown drains the queue), or once every source has ended (e.g. stdin was closed).
+    """
+
+    def __init__(self, sources, interval=5.0, max_queued=1000):
+        self.sources = [(source, self._reader_for(source)) for source in sources]
+        self.interval = interval
+        self.queue = queue.Queue(maxsize=max(1, max_queued))
+        self.stopping = threading.Event()
+        self.active = len(self.sources)
+        self.queued = 0
+        self.lock = threading.Lock()
+
+    def _reader_for(self, source):
+        """Returns the method reading a source, raises ValueError if it can not be read"""
+        if source == "-":
+            return self._read_stream
+        if os.path.isdir(source):
+            return self._watch_directory
+        if os.path.exists(source) and stat.S_ISFIFO(os.stat(source).st_mode):
+            return self._read_pipe
+        raise ValueError(f"'{source}' is not a directory, a named pipe or '-'")
+
+    def start(self):
+        """Start reading every source. Returns the feed"""
+        for source, target in self.sources:
+            # Note: daemon threads - a reader blocked on an idle pipe must not hold up the exit
+            threading.Thread(target=self._run_source, args=(target, source), daemon=True).start()
+        return self
+
+    def stop(self):
+        """Stop reading new URLs - those already queued are still handed out"""
+        self.stopping.set()
+
+    def pending(self):
+        """Returns the number of URLs queued but not yet handed out"""
+        return self.queue.qsize()
+
+    def __iter__(self):
+        while True:
+            try:
+                yield self.queue.get(timeout=0.5)
+            except queue.Empty:
+                with self.lock:
+                    finished = self.active == 0
+                if self.stopping.is_set() or finished:
+                    return
+
+    def _run_source(self, target, source):
+        """Read a source until it ends or the feed stops"""
+        try:
+            target(source)
+        except OSError as error:
+            print(f"[!] Error: Reading URLs from '{source}' failed: '{error}'")
+        finally:
+            with self.lock:
+                self.active -= 1
+
+    def _put(self, url):
+        """Queue a URL, waiting while the queue is full. Returns False once the feed stops"""
+        while not self.stopping.is_set():
+            try:
+                self.queue.put(url, timeout=0.5)
+            except queue.Full:
+                continue
+            with self.lock:
+                self.queued += 1
+            return True
+        return False
+
+    def _put_lines(self, lines):
+        """Queue every non-blank line. Returns the number queued"""
+        count = 0
+        for line in lines:
+            line = line.strip()
+            if line:
+                if not self._put(line):
+                    break
+                count += 1
+        return count
+
+    def _read_stream(self, _source):
+        self._put_lines(sys.stdin)
+
+    def _read_pipe(self, source):
+        while not self.stopping.is_set():
+            # Note: opening blocks until a writer opens the pipe, reading ends when it closes it
+            with open(source, "r", encoding="utf8") as in_file:
+                self._put_lines(in_file)
+
+    def _watch_directory(self, source):
+        processed_dir = os.path.join(source, PROCESSED_DIR)
+        os.makedirs(processed_dir, exist_ok=True)
+        while not self.stopping.is_set():
+            for file_path in spool_files(source):
+                if self.stopping.is_set():
+                    return
+                with open(file_path, "r", encoding="utf8") as in_file:
+                    count = self._put_lines(in_file)
+                if self.stopping.is_set():
+                    # Only partly queued: the file is read again by the next run
+                    return
+                os.replace(file_path, os.path.join(processed_dir, os.path.basename(file_path)))
+                print(f"[+] Queued {count} URL(s) from: '{file_path}'")
+            self.stopping.wait(self.interval)
+
+
+def spool_files(directory):
+    """Returns the settled files waiting in a spool directory, oldest first"""
+    now = time.time()
+    files = []
+    for entry in os.scandir(directory):
+        if (
+            not entry.is_file()
+            or entry.name.startswith(".")
+            or entry.name.endswith(PARTIAL_SUFFIXES)
+        ):
+            continue
+        modified = entry.stat().st_mtime
+        if now - modified >= SETTLE_SECONDS:
+            files.append((modified, entry.path))
+    return [file_path for _, file_path in sorted(files)]
@@ -0,0 +1,435 @@
+#!/usr/bin/env python
+"""Python API for URLScan.io: submit URLs and retrieve results, artifacts and searches from other programs"""
+import os
+import json
+import time
+
+from lazy_modules import lazy_import
+from rate_limit import TokenBucket, RateLimitController
+from key_pool import KeyPool, load_api_keys
+from urlscan_client import (
+    URLScanSession,
+    URLScanError,
+    APIKeyError,
+    NotFoundError,
+    ScanTimeoutError,
+    SubmissionError,
+    error_for_status,
+    URLSCAN_URL,
+    BASE_URL_ENV_VAR,
+)
+from artifacts import artifact_file, download_artifact
+from pipeline import map_in_order
+from projection import parse_selected, select_fields
+
+# The HTTP stack is only loaded once the first request is sent (and asyncio once it is used)
+requests = lazy_import("requests")
+asyncio = lazy_import("asyncio")
+
+API_KEY_ENV_VAR = "URLSCAN_API_KEY"
+VISIBILITIES = ("public", "unlisted", "private")
+# Countries URLScan.io can scan from
+COUNTRY_CODES = ("de", "us", "jp", "fr", "gb", "nl", "ca", "it", "es")
+# URLScan.io keeps at most this many tags per scan
+MAX_TAGS = 10
+DEFAULT_RATE_LIMIT = 30
+
+
+class URLScanClient(URLScanSession):
+    """
+    Client for URLScan.io meant to be embedded in other programs: every method returns its
+    result or raises a URLScanError (SubmissionError, NotFoundError, QuotaExceededError, ...)
+    - it never prompts or exits. The pooled session, rate limiters, retry policy and any
+    cache, history or IOC index (see URLScanSession) are kept between calls, so one client
+    can serve any number of batches.
+
+    'api_keys' is a key, a list of keys or a KeyPool - by default the keys in
+    'URLSCAN_API_KEYS' or the key in 'URLSCAN_API_KEY'. Each key may submit 'rate_limit'
+    scans per minute for each visibility (None leaves pacing to the quota headers alone).
+    'visibility' ('unlisted' unless chosen, like the CLI), 'country', 'user_agent' and 'tags'
+    are the defaults for every submission.
+    Other keyword arguments (pool_size, cache, retry, timeout, metrics) go to URLScanSession
+    """
+
+    def __init__(
+        self,
+        api_keys=None,
+        base_url=None,
+        visibility="unlisted",
+        country=None,
+        user_agent=None,
+        tags=(),
+        rate_limit=DEFAULT_RATE_LIMIT,
+        workers=4,
+        **session_options,
+    ):
+        if api_keys is None:
+            api_keys = load_api_keys() or [key for key in [os.environ.get(API_KEY_ENV_VAR)] if key]
+        elif isinstance(api_keys, str):
+            api_keys = [api_keys]
+        if not isinstance(api_keys, KeyPool):
+            if not api_keys:
+                raise APIKeyError(f"No API key provided or found in '{API_KEY_ENV_VAR}'")
+            buckets = {}
+            if rate_limit is not None:
+                buckets = {visibility: rate_limit for visibility in VISIBILITIES}
+            api_keys = KeyPool(
+                api_keys,
+                lambda: RateLimitController(
+                    {
+                        action: TokenBucket(rate, capacity=max(1, workers))
+                        for action, rate in buckets.items()
+                    }
+                ),
+            )
+        if base_url is None:
+            base_url = os.environ.get(BASE_URL_ENV_VAR, URLSCAN_URL)
+        super().__init__(api_keys, base_url=base_url, **session_options)
+
+        self.workers = max(1, workers)
+        self.scan_defaults = {"visibility": visibility, "tags": list(tags)}
+        if country:
+            self.scan_defaults["country"] = country
+        if user_agent:
+            self.scan_defaults["customagent"] = user_agent
+
+    def request(self, method, path, action="retrieve", **kwargs):
+        """URLScanSession.request, raising a URLScanError if the request could not be sent"""
+        try:
+            return super().request(method, path, action, **kwargs)
+        except requests.exceptions.RequestException as error:
+            raise URLScanError(f"Request to '{self.url_for(path)}' failed: '{error}'") from error
+
+    def recent_scan(self, url, visibility=None, country=None):
+        """
+        Returns the submission of a URL saved in the scan history within its TTL, or None.
+        Only a scan with the same visibility and country (the client's defaults) is reused
+        """
+        if self.history is None:
+            return None
+        previous = self.history.recent(
+            url,
+            visibility or self.scan_defaults["visibility"],
+            country or self.scan_defaults.get("country"),
+        )
+        if previous is not None:
+            self.metrics.increment("history_hits_total")
+        return previous
+
+    def submit(self, url, check_history=True, record_history=True, **scan_options):
+        """
+        Method to submit a URL to be scanned. 'scan_options' are fields of URLScan.io's scan
+        request (visibility, country, customagent, tags, referer, ...) overriding the client's
+        defaults. A URL found in the scan history with the same visibility and country is not
+        submitted again (unless 'check_history' is False) - its earlier submission is returned
+        instead. With 'record_history' False the submission is not saved to the history
+        (e.g. variants of a URL that a normal scan should not reuse).
+        Returns the submission JSON (holding the scan's 'uuid')
+        """
+        scan_data = dict(self.scan_defaults)
+        scan_data.update((key, value) for key, value in scan_options.items() if value is not None)
+        scan_data["url"] = url
+        scan_data["tags"] = list(scan_data.get("tags") or ())[:MAX_TAGS]
+
+        if check_history:
+            previous = self.recent_scan(url, scan_data["visibility"], scan_data.get("country"))
+            if previous is not None:
+                return previous
+
+        response = self.post("/api/v1/scan/", scan_data["visibility"], data=json.dumps(scan_data))
+        status = response.status_code
+        try:
+            content = response.json()
+        except ValueError:
+            content = {}
+        if status != requests.codes.ok:
+            message = content.get("message") or content.get("description") or "no details"
+            raise error_for_status(
+                f"Scan for '{url}' failed with status: '{status}': {message}", status, content
+            )
+        if not content.get("uuid"):
+            raise SubmissionError(f"Scan for '{url}' returned no UUID.", status, content)
+
+        self.metrics.increment("items_completed_total", type="url")
+        if self.history is not None and record_history:
+            self.history.record(url, content, scan_data["visibility"], scan_data.get("country"))
+        return content
+
+    def result(self, uuid, fields=None):
+        """
+        Method to retrieve the results of a scan. With 'fields' (see projection.parse_fields)
+        only those parts are returned. Raises NotFoundError while the scan is still running
+        """
+        cached = self._get_cached(uuid, "result")
+        if cached is not None:
+            return select_fields(self._index_iocs(json.loads(cached)), fields)
+
+        # The body can be parsed as it streams in unless the cache or IOC index need all of it
+        streaming = fields is not None and self.cache is None and self.iocs is None
+        response = self.get("/api/v1/result/" + uuid, stream=streaming)
+
+        status = response.status_code
+        if status != requests.codes.ok:
+            response.close()
+            raise error_for_status(
+                f"Data retrieval for uuid: '{uuid}' failed with status: '{status}'.", status
+            )
+
+        self.metrics.increment("items_completed_total", type="uuid")
+        if streaming:
+            return self._read_selected(response, fields)
+
+        self.metrics.increment("response_bytes_total", len(response.content), endpoint="result")
+        self._put_cached(uuid, "result", response.content)
+        return select_fields(self._index_iocs(response.json()), fields)
+
+    def wait_for_result(self, uuid, fields=None, timeout=300, first_poll=10, max_delay=30):
+        """
+        Method to poll for the results of a scan until it finishes - first after 'first_poll'
+        seconds, then backing off up to 'max_delay'. Raises ScanTimeoutError after 'timeout'
+        """
+        deadline = time.monotonic() + timeout
+        delay = first_poll
+        attempt = 0
+        while True:
+            time.sleep(max(0.0, min(delay, deadline - time.monotonic())))
+            try:
+                return self.result(uuid, fields)
+            except NotFoundError:
+                if time.monotonic() >= deadline:
+                    raise ScanTimeoutError(
+                        f"Scan for uuid: '{uuid}' did not finish within {timeout} seconds."
+                    ) from None
+            attempt += 1
+            delay = min(max_delay, 2 ** attempt)
+
+    def scan(self, url, fields=None, timeout=300, **scan_options):
+        """Method to submit a URL and wait for its results. Returns the scan results"""
+        submission = self.submit(url, **scan_options)
+        return self.wait_for_result(submission["uuid"], fields, timeout)
+
+    def download(self, uuid, kind, out_dir):
+        """
+        Method to download an artifact of a scan ('png' or 'dom') to a directory (or the
+        client's artifact store). Returns the path it was saved to, raises a URLScanError
+        (e.g. NotFoundError for a '404') if it could not be downloaded
+        """
+        download_artifact(uuid, kind, out_dir, self)
+        if self.artifact_store is not None:
+            return self.artifact_store.path(uuid, kind)
+        return artifact_file(uuid, kind, out_dir)
+
+    def search_pages(self, query, size=100, limit=None):
+        """
+        Method to page through URLScan.io's search API for a query using the 'search_after'
+        cursor, yielding each page (a list of search results) as soon as it arrives.
+        Stops once there are no more pages or after 'limit' results (if provided)
+        """
+        params = {"q": query, "size": size}
+        returned = 0
+
+        while limit is None or returned < limit:
+            if limit is not None:
+                params["size"] = min(size, limit - returned)
+
+            response = self.get("/api/v1/search/", action="search", params=params)
+            status = response.status_code
+            if status != requests.codes.ok:
+                raise error_for_status(f"Search for: '{query}' failed with status: '{status}'.", status)
+
+            content = response.json()
+            results = content.get("results", [])
+            if not results:
+                return
+            returned += len(results)
+            yield results
+
+            if not content.get("has_more", len(results) == params["size"]):
+                return
+            # The sort values of the last result mark where the next page starts
+            params["search_after"] = ",".join(str(value) for value in results[-1]["sort"])
+
+    def search(self, query, size=100, limit=None):
+        """Method to yield every result of a search, one at a time (see 'search_pages')"""
+        for page in self.search_pages(query, size, limit):
+            yield from page
+
+    def quotas(self):
+        """
+        Method to retrieve the account's quota status: the limit, used and remaining count of
+        every action (e.g. 'public', 'unlisted', 'private', 'search') for each window
+        ('minute', 'hour', 'day'). Returns the quota JSON (see planner.parse_quotas)
+        """
+        response = self.get("/user/quotas/", action="quotas")
+        status = response.status_code
+        if status != requests.codes.ok:
+            raise error_for_status(f"Quota retrieval failed with status: '{status}'.", status)
+        return response.json()
+
+    def set_rate_limit(self, visibility, rate_per_minute):
+        """Method to change how many scans of a visibility each key may submit per minute"""
+        for limiter in self.keys.limiters.values():
+            limiter.buckets[visibility] = TokenBucket(rate_per_minute, capacity=self.workers)
+
+    def submit_many(self, urls, workers=None, **scan_options):
+        """
+        Method to submit several URLs, 'workers' at a time (the client's by default).
+        Yields each submission JSON - or the URLScanError it raised - in input order
+        """
+        return map_in_order(
+            returning_errors(lambda url: self.submit(url, **scan_options)),
+            urls,
+            workers or self.workers,
+        )
+
+    def results(self, uuids, fields=None, workers=None):
+        """
+        Method to retrieve the results of several scans, 'workers' at a time (the client's
+        by default). Yields each result - or the URLScanError it raised - in input order
+        """
+        return map_in_order(
+            returning_errors(lambda uuid: self.result(uuid, fields)),
+            uuids,
+            workers or self.workers,
+        )
+
+    def _get_cached(self, uuid, kind):
+        """Method to look up a download for a UUID in the cache, returns None on a miss"""
+        if self.cache is None:
+            return None
+        cached = self.cache.get(uuid, kind)
+        self.metrics.increment("cache_lookups_total", kind=kind, hit=cached is not None)
+        return cached
+
+    def _put_cached(self, uuid, kind, content):
+        """Method to store a download for a UUID in the cache (if there is one)"""
+        if self.cache is not None:
+            self.cache.put(uuid, kind, content)
+
+    def _index_iocs(self, scan_content):
+        """Method to add a result's indicators to the IOC index (if there is one)"""
+        if self.iocs is not None:
+            self.iocs.add(scan_content)
+        return scan_content
+
+    def _read_selected(self, response, fields):
+        """Method to parse only the selected fields of a streamed result response"""
+        with response:
+            # Let urllib3 undo any gzip/deflate encoding as the body is read
+            response.raw.decode_content = True
+            scan_content = parse_selected(response.raw, fields)
+            self.metrics.increment("response_bytes_total", response.raw.tell(), endpoint="result")
+        return scan_content
+
+
+def returning_errors(function):
+    """Wrap a function so a URLScanError it raises is returned instead"""
+
+    def call(item):
+        try:
+            return function(item)
+        except URLScanError as error:
+            return error
+
+    return call
+
+
+class AsyncURLScanClient:
+    """
+    asyncio version of URLScanClient with the same methods as coroutines. The HTTP stack is
+    blocking, so requests are sent by a URLScanClient on worker threads: at most 'workers'
+    at a time, sharing its session, rate limiters, cache and history between every call.
+    Waiting for a scan to finish sleeps on the event loop instead of holding a thread.
+    Takes the same arguments as URLScanClient, or an existing one as 'client'
+    """
+
+    def __init__(self, *args, client=None, **kwargs):
+        self.client = client if client is not None else URLScanClient(*args, **kwargs)
+        self._semaphore = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def _run(self, function, *args, **kwargs):
+        """Run a blocking client method on a worker thread"""
+        # Note: created on first use so it belongs to the running event loop
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.client.workers)
+        async with self._semaphore:
+            return await asyncio.to_thread(function, *args, **kwargs)
+
+    async def submit(self, url, check_history=True, record_history=True, **scan_options):
+        """See URLScanClient.submit"""
+        return await self._run(self.client.submit, url, check_history, record_history, **scan_options)
+
+    async def result(self, uuid, fields=None):
+        """See URLScanClient.result"""
+        return await self._run(self.client.result, uuid, fields)
+
+    async def wait_for_result(self, uuid, fields=None, timeout=300, first_poll=10, max_delay=30):
+        """See URLScanClient.wait_for_result"""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        delay = first_poll
+        attempt = 0
+        while True:
+            await asyncio.sleep(max(0.0, min(delay, deadline - loop.time())))
+            try:
+                return await self.result(uuid, fields)
+            except NotFoundError:
+                if loop.time() >= deadline:
+                    raise ScanTimeoutError(
+                        f"Scan for uuid: '{uuid}' did not finish within {timeout} seconds."
+                    ) from None
+            attempt += 1
+            delay = min(max_delay, 2 ** attempt)
+
+    async def scan(self, url, fields=None, timeout=300, **scan_options):
+        """See URLScanClient.scan"""
+        submission = await self.submit(url, **scan_options)
+        return await self.wait_for_result(submission["uuid"], fields, timeout)
+
+    async def download(self, uuid, kind, out_dir):
+        """See URLScanClient.download"""
+        return await self._run(self.client.download, uuid, kind, out_dir)
+
+    async def search(self, query, size=100, limit=None):
+        """See URLScanClient.search - an async iterator of search results"""
+        pages = self.client.search_pages(query, size, limit)
+        while True:
+            page = await self._run(next, pages, None)
+            if page is None:
+                return
+            for search_result in page:
+                yield search_result
+
+    async def quotas(self):
+        """See URLScanClient.quotas"""
+        return await self._run(self.client.quotas)
+
+    async def submit_many(self, urls, **scan_options):
+        """Submit several URLs at once. Returns a list of submissions / URLScanErrors in input order"""
+        return await gather_results(self.submit(url, **scan_options) for url in urls)
+
+    async def results(self, uuids, fields=None):
+        """Retrieve several results at once. Returns a list of results / URLScanErrors in input order"""
+        return await gather_results(self.result(uuid, fields) for uuid in uuids)
+
+    async def close(self):
+        """Close the client's pooled connections (and its cache, history, ...)"""
+        await asyncio.to_thread(self.client.close)
+
+
+async def gather_results(coroutines):
+    """Run coroutines at once, returning a URLScanError a coroutine raised in place of its result"""
+
+    async def run(coroutine):
+        try:
+            return await coroutine
+        except URLScanError as error:
+            return error
+
+    return await asyncio.gather(*(run(coroutine) for coroutine in coroutines))
@@ -0,0 +1,263 @@
+#!/usr/bin/env python
+"""Python tools for sending http requests to URLScan.io over a shared pool of connections"""
+import time
+import logging
+import threading
+
+from lazy_modules import lazy_import
+from rate_limit import RateLimitController, to_number
+from retry import RetryPolicy
+from key_pool import KeyPool
+from metrics import RunMetrics
+
+URLSCAN_URL = "https://urlscan.io"
+BASE_URL_ENV_VAR = "URLSCAN_BASE_URL"
+
+# The HTTP stack is only loaded once the first request is sent
+requests = lazy_import("requests")
+
+# Retries and exceeded quotas are logged - nothing is printed unless the application sets up logging
+logger = logging.getLogger(__name__)
+logger.addHandler(logging.NullHandler())
+
+# Errors raised by requests that are worth retrying, selectable by name -> name of the
+#  class in 'requests.exceptions' (looked up by retry_exceptions() once it is needed)
+RETRY_EXCEPTIONS = {
+    "connection": "ConnectionError",
+    "timeout": "Timeout",
+    "chunked": "ChunkedEncodingError",
+}
+
+
+def retry_exceptions(names=tuple(RETRY_EXCEPTIONS)):
+    """Returns the exception classes for names of errors that are worth retrying"""
+    return tuple(getattr(requests.exceptions, RETRY_EXCEPTIONS[name]) for name in names)
+
+# Path prefix -> endpoint name used to label the statistics of each request
+ENDPOINTS = {
+    "/api/v1/scan": "scan",
+    "/api/v1/result": "result",
+    "/api/v1/search": "search",
+    "/screenshots": "png",
+    "/dom": "dom",
+    "/user/quotas": "quotas",
+}
+
+
+def endpoint_for(path):
+    """Returns the endpoint name for a path on URLScan.io ('other' if it is not a known one)"""
+    for prefix, endpoint in ENDPOINTS.items():
+        if path.startswith(prefix):
+            return endpoint
+    return "other"
+
+
+class URLScanError(Exception):
+    """
+    Raised when URLScan.io does not return the data that was requested.
+    'status_code' is the http status of the response (None if none arrived) and
+    'content' the JSON it returned, if any
+    """
+
+    def __init__(self, message, status_code=None, content=None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.content = content
+
+
+class SubmissionError(URLScanError):
+    """Raised when URLScan.io refuses to scan a URL (e.g. a blocked domain or a '400')"""
+
+
+class APIKeyError(URLScanError):
+    """Raised when no API key is available or URLScan.io rejects it ('401'/'403')"""
+
+
+class NotFoundError(URLScanError):
+    """Raised for a '404': the scan does not exist or - for a result - has not finished yet"""
+
+
+class QuotaExceededError(URLScanError):
+    """Raised when the quota is still used up ('429') once every retry has been spent"""
+
+
+class ScanTimeoutError(URLScanError):
+    """Raised when a scan does not finish within the time it was given"""
+
+
+# http status -> error raised for it
+STATUS_ERRORS = {
+    400: SubmissionError,
+    401: APIKeyError,
+    403: APIKeyError,
+    404: NotFoundError,
+    429: QuotaExceededError,
+}
+
+
+def error_for_status(message, status_code, content=None):
+    """Returns the URLScanError (subclass) for a failed response's http status"""
+    return STATUS_ERRORS.get(status_code, URLScanError)(message, status_code, content)
+
+
+class URLScanSession:
+    """
+    Owns a single pooled requests.Session used for every call made to URLScan.io.
+    Connections are kept alive and reused between requests (and between worker
+    threads) so only the first request to the site pays for the TCP and TLS handshake.
+    'api_keys' is either a single API key paced by 'limiter', or a KeyPool spreading
+    requests across several keys - each request is sent with the key the pool chooses.
+    Failed requests are retried according to a RetryPolicy ('retry').
+    An optional ResultCache ('cache'), ScanHistory ('history'), DeadLetterQueue
+    ('dead_letter'), IOCIndex ('iocs') and ArtifactStore ('artifact_store') are shared with
+    everything using this session.
+    Every request is counted and timed in 'metrics' (a RunMetrics) by endpoint and status,
+    along with the time spent waiting on rate limits and retry back-off.
+    """
+
+    def __init__(
+        self,
+        api_keys,
+        limiter=None,
+        pool_size=10,
+        base_url=URLSCAN_URL,
+        cache=None,
+        retry=None,
+        timeout=30,
+        metrics=None,
+    ):
+        self.base_url = base_url.rstrip("/")
+        if isinstance(api_keys, KeyPool):
+            self.keys = api_keys
+        else:
+            limiter = limiter if limiter is not None else RateLimitController()
+            self.keys = KeyPool([api_keys], lambda: limiter)
+        self.retry = retry
+        if self.retry is None:
+            self.retry = RetryPolicy(retry_exceptions=retry_exceptions)
+        self.timeout = timeout
+        self.metrics = metrics if metrics is not None else RunMetrics()
+        self.cache = cache
+        self.history = None
+        self.dead_letter = None
+        self.iocs = None
+        self.artifact_store = None
+
+        # The requests.Session is created by the first request, so runs served entirely
+        #  from the cache never load the HTTP stack
+        self.pool_size = pool_size
+        self._session = None
+        self.session_lock = threading.Lock()
+
+    @property
+    def session(self):
+        """The pooled requests.Session, created when it is first needed"""
+        if self._session is None:
+            with self.session_lock:
+                if self._session is None:
+                    session = requests.Session()
+                    adapter = requests.adapters.HTTPAdapter(
+                        pool_connections=self.pool_size, pool_maxsize=self.pool_size
+                    )
+                    session.mount("https://", adapter)
+                    session.mount("http://", adapter)
+                    session.headers.update(
+                        {
+                            "Content-Type": "application/json",
+                            "Connection": "keep-alive",
+                        }
+                    )
+                    self._session = session
+        return self._session
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        """Close every pooled connection (and the cache, history and artifact store, if there are any)"""
+        if self._session is not None:
+            self._session.close()
+        if self.artifact_store is not None:
+            self.artifact_store.close()
+        if self.cache is not None:
+            self.cache.close()
+        if self.history is not None:
+            self.history.close()
+
+    def url_for(self, path):
+        """Returns the full URL for a path on URLScan.io (e.g. '/api/v1/scan/')"""
+        return self.base_url + path
+
+    def request(self, method, path, action="retrieve", **kwargs):
+        """
+        Method to send an http request to URLScan.io paced by the rate limiter of the key
+        it is sent with. The quota headers of every response are recorded against that key
+        (a '429' moves later attempts onto another key if one is free). Retryable errors and statuses
+        are attempted again with back-off - a '429' waits for its quota window to reset.
+        Returns the last response, or raises the last error once attempts run out
+        """
+        target_url = self.url_for(path)
+        endpoint = endpoint_for(path)
+        kwargs.setdefault("timeout", self.timeout)
+        headers = kwargs.pop("headers", {})
+        metrics = self.metrics
+
+        attempt = 0
+        while True:
+            attempt += 1
+            with metrics.timer("rate_limit_wait_seconds", action=action):
+                api_key = self.keys.acquire(action)
+            start = time.perf_counter()
+            try:
+                response = self.session.request(
+                    method, target_url, headers={**headers, "API-Key": api_key}, **kwargs
+                )
+            except requests.exceptions.RequestException as error:
+                metrics.increment("request_errors_total", endpoint=endpoint, error=type(error).__name__)
+                if not (self.retry.retry_error(error) and self.retry.can_retry(attempt)):
+                    raise
+                metrics.increment("retries_total", endpoint=endpoint, reason="error")
+                delay = self.retry.sleep(attempt)
+                metrics.observe("retry_sleep_seconds", delay, endpoint=endpoint)
+                logger.warning("[-] Request to '%s' failed: '%s'", target_url, error)
+                logger.warning("[-] Retried after %.1f seconds (attempt %d)...", delay, attempt + 1)
+                continue
+
+            # Note: for streamed downloads this is the time until the headers arrived
+            metrics.observe("request_seconds", time.perf_counter() - start, endpoint=endpoint)
+            reset_delay = self.keys.update(api_key, response, action)
+            status = response.status_code
+            metrics.increment("requests_total", endpoint=endpoint, status=status)
+            remaining = to_number(response.headers.get("X-Rate-Limit-Remaining"))
+            if remaining is not None:
+                metrics.set_gauge("quota_remaining", remaining, action=action, key=api_key[-4:])
+            if not (self.retry.retry_status(status) and self.retry.can_retry(attempt)):
+                return response
+
+            response.close()
+            metrics.increment("retries_total", endpoint=endpoint, reason=str(status))
+            if status == 429:
+                # This key sits out until its quota window resets
+                logger.warning(
+                    "[-] Quota for '%s' requests exceeded on key '...%s', it resets in %d seconds...",
+                    action,
+                    api_key[-4:],
+                    reset_delay,
+                )
+            else:
+                delay = self.retry.sleep(attempt)
+                metrics.observe("retry_sleep_seconds", delay, endpoint=endpoint)
+                logger.warning(
+                    "[-] Request to '%s' returned '%s', retried after %.1f seconds...", target_url, status, delay
+                )
+
+    def get(self, path, action="retrieve", **kwargs):
+        """Send a GET request to a path on URLScan.io"""
+        return self.request("GET", path, action, **kwargs)
+
+    def post(self, path, action, **kwargs):
+        """Send a POST request to a path on URLScan.io"""
+        return self.request("POST", path, action, **kwargs)
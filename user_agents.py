@@ -1,38 +1,32 @@
 #!/usr/bin/env python
 """Python tools dealing with user aganets - list of common agents + methods to select one"""
 import random
+import itertools
 
 # pylint: disable=line-too-long
-def list_user_agents():
-    """Stores lists of user agents divided by browser/os and initializes a dictionary of them """
-    possible_user_agents = {}
-
-    chrome_user_agents = [
+# User agents divided by browser/os - built once at import as immutable tuples
+USER_AGENTS = {
+    "Chrome": (
         "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/92.0.4515.131 Safari/537.36",
         "Mozilla/5.0 (Windows NT 10.0; WOW64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/92.0.4515.131 Safari/537.36",
         "Mozilla/5.0 (Windows NT 10.0) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/92.0.4515.131 Safari/537.36",
         "Mozilla/5.0 (Macintosh; Intel Mac OS X 11_5_1) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/92.0.4515.131 Safari/537.36",
         "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/92.0.4515.131 Safari/537.36",
-    ]
-    possible_user_agents["Chrome"] = chrome_user_agents
-
-    ios_user_agents = [
+    ),
+    "iOS": (
         "Mozilla/5.0 (iPad; CPU OS 11_3 like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/11.0 Tablet/15E148 Safari/604.1",
         "Mozilla/5.0 (iPhone; CPU iPhone OS 14_7_1 like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/14.1.2 Mobile/15E148 Safari/604.1",
         "Mozilla/5.0 (iPhone; CPU iPhone OS 14_7_1 like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) CriOS/92.0.4515.90 Mobile/15E148 Safari/604.1",
         "Mozilla/5.0 (iPhone; CPU iPhone OS 14_7_1 like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) FxiOS/35.0 Mobile/15E148 Safari/605.1.15",
         "Mozilla/5.0 (iPhone; CPU iPhone OS 9_3_2 like Mac OS X) AppleWebKit/601.1 (KHTML, like Gecko) CriOS/51.0.2704.104 Mobile/13F69 Safari/601.1.46",
         "Mozilla/5.0 (iPhone; CPU iPhone OS 8_1_1 like Mac OS X) AppleWebKit/600.1.4 (KHTML, like Gecko) CriOS/47.0.2526.70 Mobile/12B436 Safari/600.1.4 (000410)",
-    ]
-    possible_user_agents["iOS"] = ios_user_agents
-
-    android_user_agents = [
+    ),
+    "Android": (
         "Mozilla/5.0 (Linux; Android 4.0.4; Galaxy Nexus Build/IMM76B) AppleWebKit/537.36 (KHTML, like Gecko; Mediapartners-Google) Chrome/89.0.4389.130 Mobile Safari/537.36",
         "Mozilla/5.0 (Linux; Android 9; Redmi 7A) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/90.0.4430.66 Mobile Safari/537.36",
         "Mozilla/5.0 (Linux; Android 8.1.0; Pixel C) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/77.0.3865.116 Safari/537.36 EdgA/46.02.4.5147",
         "Mozilla/5.0 (Linux; Android 8.1.0; Pixel C) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/77.0.3865.116 Safari/537.36 EdgA/46.03.4.5155",
         "Mozilla/5.0 (Linux; U; Android 6.0.1; en-us; TESLA Build/JOP24G) AppleWebKit/534.30 (KHTML, like Gecko) Version/4.0 Chrome/43.0.2357.65 Mobile Safari/534.30",
-        "Mozilla/5.0 (Linux; Android 8.1.0; Pixel C) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/77.0.3865.116 Safari/537.36 EdgA/46.03.4.5155",
         "Mozilla/5.0 (Linux; Android 11) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/92.0.4515.131 Mobile Safari/537.36",
         "Mozilla/5.0 (Linux; Android 11; SM-A205U) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/92.0.4515.131 Mobile Safari/537.36",
         "Mozilla/5.0 (Linux; Android 11; SM-A102U) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/92.0.4515.131 Mobile Safari/537.36",
@@ -43,39 +37,29 @@ def list_user_agents():
         "Mozilla/5.0 (Linux; Android 11; LM-Q710(FGN)) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/92.0.4515.131 Mobile Safari/537.36",
         "Mozilla/5.0 (Android 11; Mobile; rv:68.0) Gecko/68.0 Firefox/90.0",
         "Mozilla/5.0 (Android 11; Mobile; LG-M255; rv:90.0) Gecko/90.0 Firefox/90.0",
-    ]
-    possible_user_agents["Android"] = android_user_agents
-
-    firefox_user_agents = [
+    ),
+    "Firefox": (
         "Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:90.0) Gecko/20100101 Firefox/90.0",
         "Mozilla/5.0 (Macintosh; Intel Mac OS X 11.5; rv:90.0) Gecko/20100101 Firefox/90.0",
         "Mozilla/5.0 (X11; Linux i686; rv:90.0) Gecko/20100101 Firefox/90.0",
         "Mozilla/5.0 (Linux x86_64; rv:90.0) Gecko/20100101 Firefox/90.0",
         "Mozilla/5.0 (X11; Ubuntu; Linux x86_64; rv:90.0) Gecko/20100101 Firefox/90.0",
         "Mozilla/5.0 (X11; Fedora; Linux x86_64; rv:90.0) Gecko/20100101 Firefox/90.0",
-    ]
-    possible_user_agents["Firefox"] = firefox_user_agents
-
-    safari_user_agents = [
+    ),
+    "Safari": (
         "Mozilla/5.0 (Macintosh; Intel Mac OS X 11_5_1) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/14.1.2 Safari/605.1.15",
-    ]
-    possible_user_agents["Safari"] = safari_user_agents
-
-    edge_user_agents = [
+    ),
+    "Edge": (
         "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/92.0.4515.131 Safari/537.36 Edg/92.0.902.67",
         "Mozilla/5.0 (Macintosh; Intel Mac OS X 11_5_1) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/92.0.4515.131 Safari/537.36 Edg/92.0.902.67",
-    ]
-    possible_user_agents["Edge"] = edge_user_agents
-
-    opera_user_agents = [
+    ),
+    "Opera": (
         "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/92.0.4515.131 Safari/537.36 OPR/78.0.4093.112",
         "Mozilla/5.0 (Windows NT 10.0; WOW64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/92.0.4515.131 Safari/537.36 OPR/78.0.4093.112",
         "Mozilla/5.0 (Macintosh; Intel Mac OS X 11_5_1) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/92.0.4515.131 Safari/537.36 OPR/78.0.4093.112",
         "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/92.0.4515.131 Safari/537.36 OPR/78.0.4093.112",
-    ]
-    possible_user_agents["Opera"] = opera_user_agents
-
-    bots_crawlers_user_agents = [
+    ),
+    "Bots": (
         "Mozilla/5.0 (compatible; Googlebot/2.1; +http://www.google.com/bot.html)",
         "Google (+https://developers.google.com/+/web/snippet/)",
         "Mozilla/5.0 (compatible; Bingbot/2.0; +http://www.bing.com/bingbot.htm)",
@@ -84,10 +68,8 @@ def list_user_agents():
         "Mozilla/5.0 (compatible; Baiduspider/2.0; +http://www.baidu.com/search/spider.html)",
         "Mozilla/5.0 (compatible; YandexBot/3.0; +http://yandex.com/bots)",
         "ia_archiver (+http://www.alexa.com/site/help/webmasters; crawler@alexa.com)",
-    ]
-    possible_user_agents["Bots"] = bots_crawlers_user_agents
-
-    internet_explorer_user_agents = [
+    ),
+    "IE": (
         "Mozilla/5.0 (Windows NT 10.0; Trident/7.0; rv:11.0) like Gecko",
         "Mozilla/5.0 (Windows NT 6.3; Trident/7.0; rv:11.0) like Gecko",
         "Mozilla/5.0 (Windows NT 6.1; Trident/7.0; rv:11.0) like Gecko",
@@ -95,15 +77,104 @@ def list_user_agents():
         "Mozilla/5.0 (compatible; MSIE 10.0; Windows NT 6.1; WOW64; Trident/6.0)",
         "Mozilla/4.0 (compatible; MSIE 7.0; Windows NT 6.0; WOW64; Trident/4.0;)",
         "Mozilla/4.0 (compatible; MSIE 8.0; Windows NT 5.1; Trident/4.0)",
-    ]
-    possible_user_agents["IE"] = internet_explorer_user_agents
-
-    return possible_user_agents
+    ),
+}
+AGENT_TYPES = tuple(USER_AGENTS)
 
 
 # pylint: enable=line-too-long
 
 
+class AgentPool:
+    """
+    Immutable pool of user agents to draw from, one per scan. Selection tables are built
+    once, so every draw is O(1): 'choice()' picks at random - uniformly, or in proportion
+    to each agent's weight using an alias table - and 'next()' rotates through the
+    agents in order. Both are safe to call from several worker threads.
+    """
+
+    def __init__(self, agents, weights=None):
+        self.agents = tuple(agents)
+        if not self.agents:
+            raise ValueError("an agent pool needs at least one user agent")
+        self.counter = itertools.count()
+        self.probabilities = None
+        self.aliases = None
+        if weights is not None and len(set(weights)) > 1:
+            self.probabilities, self.aliases = build_alias_table(weights)
+
+    def __len__(self):
+        return len(self.agents)
+
+    def choice(self):
+        """Returns a random agent from the pool, honouring its weights"""
+        index = random.randrange(len(self.agents))
+        if self.probabilities is not None and random.random() >= self.probabilities[index]:
+            index = self.aliases[index]
+        return self.agents[index]
+
+    def next(self):
+        """Returns the next agent in the pool's rotation"""
+        # Note: next() on an itertools.count is atomic, so threads never share a position
+        return self.agents[next(self.counter) % len(self.agents)]
+
+
+def build_alias_table(weights):
+    """
+    Method to build the tables of Vose's alias method for the given weights.
+    Returns (probabilities, aliases): slot 'i' keeps its own item with probability
+    'probabilities[i]' and otherwise hands the draw to item 'aliases[i]'
+    """
+    count = len(weights)
+    total = float(sum(weights))
+    if total <= 0:
+        raise ValueError("at least one weight must be positive")
+    scaled = [weight * count / total for weight in weights]
+    probabilities = [1.0] * count
+    aliases = list(range(count))
+    small = [index for index, value in enumerate(scaled) if value < 1.0]
+    large = [index for index, value in enumerate(scaled) if value >= 1.0]
+    while small and large:
+        less, more = small.pop(), large.pop()
+        probabilities[less] = scaled[less]
+        aliases[less] = more
+        scaled[more] -= 1.0 - scaled[less]
+        (small if scaled[more] < 1.0 else large).append(more)
+    return tuple(probabilities), tuple(aliases)
+
+
+def parse_agent_pool(spec):
+    """
+    Method to build an AgentPool from a spec of user agent types with optional weights,
+    e.g. 'iOS,Android' or 'iOS:3,Android:1' ('all' stands for every type). A type's
+    weight is shared between its agents. Raises ValueError for an unknown type or weight
+    """
+    agents = []
+    weights = []
+    for entry in spec.split(","):
+        name, _, weight = entry.strip().partition(":")
+        types = AGENT_TYPES if name.lower() == "all" else [find_agent_type(name)]
+        weight = float(weight) if weight else 1.0
+        for type_name in types:
+            for agent in USER_AGENTS[type_name]:
+                agents.append(agent)
+                weights.append(weight / len(USER_AGENTS[type_name]))
+    return AgentPool(agents, weights)
+
+
+def find_agent_type(name):
+    """Returns the user agent type matching a name regardless of case, or raises ValueError"""
+    for type_name in AGENT_TYPES:
+        if type_name.lower() == name.lower():
+            return type_name
+    raise ValueError(f"unknown user agent type: '{name}' (choose from: {', '.join(AGENT_TYPES)})")
+
+
+def list_user_agents():
+    """Returns a dictionary of the user agents divided by browser/os (a copy that may be modified)"""
+    return {type_name: list(agents) for type_name, agents in USER_AGENTS.items()}
+
+
 def select_from_dict(options, name):
     """Display the contents of a Dictionary and allow user to easily select one item """
     index = 0
@@ -145,49 +216,29 @@ def choose_from_list(list_of_options, choice_name):
 
 def show_user_agents():
     """displays all available user agents"""
-    user_agents = {}
-    index_valid_list = []
-
-    user_agents = list_user_agents()
-    user_agent_types = list(user_agents.keys())
-
     print("[+] Currently Availble User Agents...")
-    for agent_type in user_agent_types:
-        print(f"\n[+] '{agent_type}' User Agents:")
-        choices = dict(zip(user_agents[agent_type], user_agents[agent_type]))
-        index = 0
-        for agent in choices:
-            index = index + 1
-            index_valid_list.extend([choices[agent]])
+    for type_name in AGENT_TYPES:
+        print(f"\n[+] '{type_name}' User Agents:")
+        for index, agent in enumerate(USER_AGENTS[type_name], start=1):
             print(f"  [{str(index)}]  '{agent}'")
 
 
 def list_agent_types():
     """Method to return a list of all available user agent types: types are keys in a dict"""
-    all_agents = list_user_agents()
-    user_agent_types = list(all_agents.keys())
-
-    return user_agent_types
+    return list(AGENT_TYPES)
 
 
 def get_random_agent(agent_type):
     """Method to randomly select a user agent from one of the available types"""
-    all_agents = list_user_agents()
-    random_agent = random.choice(all_agents[agent_type])
-    return random_agent
+    return random.choice(USER_AGENTS[agent_type])
 
 
 def get_user_agent():
     """Returns selected type of user agent from provided dictionary, assumes types are keys"""
-    user_agents = {}
-    user_agents = list_user_agents()
-
-    user_agent_types = list(user_agents.keys())
-
-    chosen_type = choose_from_list(user_agent_types, "User Agent Type")
+    chosen_type = choose_from_list(AGENT_TYPES, "User Agent Type")
 
     type_name = str(chosen_type) + " User Agent"
-    chosen_user_agent = choose_from_list(user_agents[chosen_type], type_name)
+    chosen_user_agent = choose_from_list(USER_AGENTS[chosen_type], type_name)
 
     return chosen_user_agent
 
@@ -205,20 +256,18 @@ def main():
     print(f"[=] Success =) User Agent is:\n\t|\n\t+-> {user_agent}")
 
     print("\n[*] Commencing Random choice test...")
-    random_choices = {}
-    print("[+] Loading user agents...")
-    all_agents = list_user_agents()
-    user_agent_types = list_agent_types()
-    print("[+] Generating random selections...")
-    for key in user_agent_types:
-        random_choices[key] = random.choice(all_agents[key])
-
     print("[+] Random selections complete... Displaying results:")
     print("[+] User Agents:")
-    for key in user_agent_types:
+    for key in AGENT_TYPES:
         agent = get_random_agent(key)
         print(f"\n[=] {key}: \n\t'{agent}'")
 
+    print("\n[*] Commencing weighted pool test ('iOS:3,Android:1')...")
+    pool = parse_agent_pool("iOS:3,Android:1")
+    draws = [pool.choice() for _ in range(10000)]
+    ios_share = sum(1 for agent in draws if agent in USER_AGENTS["iOS"]) / len(draws)
+    print(f"[=] Share of iOS agents drawn: {ios_share:.2f} (expected: 0.75)")
+
     print("\n[*] Displaying all current user agents...")
     show_user_agents()
 
@@ -1,15 +1,49 @@
 #!/usr/bin/env python
 """Python tool designed to interact with URLScan.io's API and submit both URLs and UUIDs"""
 
-import re
 import os
 import sys
-import json
 import time
+import signal
+import logging
 import argparse
-import requests
+import threading
+import collections
 
 import user_agents as UA
+from urlscan_client import (
+    URLScanError,
+    NotFoundError,
+    RETRY_EXCEPTIONS,
+    retry_exceptions,
+    URLSCAN_URL,
+    BASE_URL_ENV_VAR,
+)
+from urlscan_api import URLScanClient, API_KEY_ENV_VAR, COUNTRY_CODES, DEFAULT_RATE_LIMIT, MAX_TAGS
+from key_pool import load_api_keys, KEYS_ENV_VAR
+from retry import RetryPolicy, DeadLetterQueue, RETRY_STATUSES
+from pipeline import ScanPipeline, map_in_order, map_pulled
+from result_cache import ResultCache, DEFAULT_CACHE_FILE
+from scan_history import ScanHistory, DEFAULT_HISTORY_FILE
+from journal import ProgressJournal
+from url_feed import URLFeed
+from scheduler import PriorityScheduler, SCAN_FIELDS, parse_line, parse_weights, read_items
+from artifacts import ArtifactDownloader, download_artifact
+from artifact_store import ArtifactStore, DEFAULT_MANIFEST_FILE, DEFAULT_STORE_DIR
+from iocs import IOCIndex, index_files
+from projection import load_parser, parse_fields
+from planner import format_plan, pacing_rate, parse_quotas, plan_submissions
+from scan_matrix import build_variants, choose_agents, group_variants, parse_agent_types
+from output_formats import (
+    OUTPUT_FORMATS,
+    STREAM_FORMATS,
+    dumps,
+    open_text,
+    output_path,
+    read_json,
+    write_json,
+    zstandard,
+)
 
 
 __author__ = ["Peter Robards"]
@@ -18,6 +52,9 @@ __description__ = "Python tool for interacting with URLScan.io's API.\
      Submit suspicious URL's to be scanned by their site and\
      Submit UUIDs to retrieve the data associated with that scan."
 
+# Set to False (--non_interactive) to never prompt: questions take their default answer
+INTERACTIVE = True
+
 ########################################################################################
 
 
@@ -27,10 +64,14 @@ def get_api_key():
     or, if this value is not found, prompt the user to input the key now
     """
     api_key = ""
-    env_var = "URLSCAN_API_KEY"
+    env_var = API_KEY_ENV_VAR
 
     if env_var in os.environ:
         api_key = os.environ[env_var]
+    elif not INTERACTIVE:
+        print(f"\n[!] Error: API key not detected in environment: Missing: '{env_var}'")
+        print("[-] Exiting program...")
+        sys.exit(1)
     else:
         print(
             f"\n[!] Warning: API key not detected in environment: Missing: '{env_var}'"
@@ -40,36 +81,79 @@ def get_api_key():
     return api_key
 
 
-def scan_urls(urls_to_scan, headers, data):
+def scan_urls(urls_to_scan, client, data, workers=1, journal=None, next_agent=None):
     """Method to scan multiple URLs via URLScan.io. Returns a list of JSON responses"""
+    return list(iter_scan_urls(urls_to_scan, client, data, workers, journal, next_agent))
 
-    responses = []
-    scan_data = data.copy()
 
-    for target_url in urls_to_scan:
-        scan_data["url"] = target_url
+def iter_scan_urls(urls_to_scan, client, data, workers=1, journal=None, next_agent=None):
+    """
+    Method to scan multiple URLs via URLScan.io, yielding each JSON response as it arrives.
+    Up to 'workers' submissions are kept in flight at once over the client's shared
+    connection pool and rate limiter - responses are yielded in the same order as the input
+    URLs found in the client's scan history (scanned within its TTL with the same visibility
+    and country) are not submitted again, the response saved from their earlier submission
+    is yielded instead
+    With 'next_agent' (e.g. AgentPool.choice) each submission gets its own user agent
+    Items may also be scheduled items (see scheduler.parse_item) carrying their own scan options
+    - from a PriorityScheduler each worker takes its next item once it is free, and responses
+    are yielded as they arrive
+    """
+
+    def submit_url(item):
+        item_options = {}
+        target_url = item
+        if isinstance(item, dict):
+            target_url = item["url"]
+            item_options = {field: item[field] for field in SCAN_FIELDS if field in item}
+
+        # Only a recent scan with the item's own visibility and country is reused
+        scan_data = dict(data)
+        scan_data.update(item_options)
+        previous = client.recent_scan(target_url, scan_data["visibility"], scan_data.get("country"))
+        if previous is not None:
+            print(f"\n[=] Reusing recent scan of '{target_url}': '{previous['uuid']}'")
+            return previous
+
+        if next_agent is not None and "customagent" not in item_options:
+            scan_data["customagent"] = next_agent()
         print(f"\n[*] Scanning '{target_url}' now...\n")
-        response = requests.post(
-            "https://urlscan.io/api/v1/scan/",
-            headers=headers,
-            data=json.dumps(scan_data),
-        )
+        try:
+            response_json = submit_to_client(client, target_url, scan_data)
+        except URLScanError as error:
+            # Keep going: the failed URL is linked to the error and saved like other failures
+            response_json = dict(error.content or {"message": str(error)})
 
         # Validate expected values in JSON response: check for 'uuid' key
-        valid_response = validate_response(target_url, response.json())
+        valid_response = validate_response(target_url, response_json)
+        if not valid_response["uuid"]:
+            record_failure(client, "url", target_url, valid_response.get("message"))
+
+        return valid_response
+
+    if isinstance(urls_to_scan, PriorityScheduler):
+        # Items pulled ahead would hold their place even if an urgent one arrived meanwhile
+        return map_pulled(submit_url, urls_to_scan.get, workers)
+    return map_in_order(submit_url, urls_to_scan, workers, journal)
+
 
-        responses.append(valid_response)
+def submit_to_client(client, target_url, data, record_history=True):
+    """Method to submit a URL with the scan options in 'data' (the history is checked by the caller)"""
+    scan_options = {key: value for key, value in data.items() if key != "url"}
+    return client.submit(
+        target_url, check_history=False, record_history=record_history, **scan_options
+    )
 
-        time.sleep(2)  # Wait 2 seconds in between url submissions.
-        response = ""
-        scan_data["url"] = ""
 
-    return responses
+def record_failure(client, kind, item, reason):
+    """Method to add an item that failed to the client's dead letter file (if it has one)"""
+    client.metrics.increment("items_failed_total", type=kind)
+    if client.dead_letter is not None:
+        client.dead_letter.record(kind, item, reason)
 
 
-def display_url_response(response):
+def display_url_response(response_content):
     """Displays the response received from URLScan.io when submitting a URL to be scanned"""
-    response_content = response.json()
 
     submitted_url = response_content.get("url")
     scanurl_uuid = response_content.get("uuid")
@@ -115,102 +199,18 @@ def validate_response(target_url, response_json_object):
 
     return response_json_object
 
-def error_check(content):
-    """Method to check json content returned by requests library for known error codes """
-    # Extract json content to check known error status
-    json_content = json.loads(content.text)
-
-    # Note: "\d+" matches one or more digits - used to find numbers in a string
-    reg_ex_pattern = r"\d+"
-    sleep_time = 0
-    status_code = 0
-
-    # Check for default error code '400' and/or if API quota for account has been reached
-    if "status" in json_content.keys():
-        status_code = json_content["status"]
-        if status_code == 400:
-            print(f'\n[!] Error, status returned 400:\n[-] Content:  "{content}".')
-            print("[-] Exiting program...\n\n")
-            sys.exit(1)
-        elif status_code == 429:
-            print("\n[!] Error: Status returned = '429'.")
-            print("[-] Pausing scan...")
-            # Note: int(re.findall(reg_ex_pattern, json_content["message"])[1]) + 5
-            #  re.findall(reg_ex_pattern, json_content["message"]): extracts all numbers
-            #  int(all_nmubers[1]) + 5: takes the second number in list and adds 5 to it
-            sleep_time = int(re.findall(reg_ex_pattern, json_content["message"])[1]) + 5
-            if sleep_time > 60:
-                print(
-                    f"\n[!] Warning: API submission quota exceeded, delay is {sleep_time}.\
-                    \n\tVisit: 'https://urlscan.io/about-api/#ratelimit/' for more info."
-                )
-                print(
-                    "[-] Try scan with a different privacy level selected\
-                     ('Public','Private','Unlisted')."
-                )
-                print("[-] Quitting program...")
-                sys.exit(1)
-        elif status_code == 200:
-            return sleep_time
-        else:
-            print(
-                f"\n[!] Error please check input... Response status code = '{status_code}'"
-            )
-            print(f"[-] Description: {content}.")
-            print("[-] Quitting program...")
-            sys.exit(1)
-    return sleep_time
-
-
-def replay_request(response, headers, data, delay, target_url):
-    """Resubmit request URLScan.io, repeats up to 5 attempts, exits on failure"""
-
-    counter = 0
-    while delay != 0:
-        attempts = counter + 1
-
-        # A delay of 0 means no errors detected
-        # otherwise delay should be between 1 and 60
-        if 0 < delay <= 60:
-            print(f"[-] Repeating scan in {delay} seconds...")
-            print(f"[-] There have been: '{attempts}' scans attempted.")
-            if ask_question("Would you like to QUIT now instead?"):
-                print("[-] Quitting program...")
-                sys.exit(1)
-            time.sleep(int(delay))
-            response = requests.post(
-                "https://urlscan.io/api/v1/scan/",
-                headers=headers,
-                data=json.dumps(data),
-            )
-
-        elif delay == 0:
-            break
-        else:
-            print(
-                f"\n[!] Error: value for time delay: '{delay}' is out of expected bounds..."
-            )
-            print("[-] Quitting program...")
-            sys.exit(1)
-
-        if attempts >= 5:
-            print(f"[!] Error: There have been '{attempts}' failed scan attempts!")
-            print(f"[-] Please check target url: /'{target_url}/'")
-            print("[-] Quitting program...")
-            sys.exit(1)
-        # Increment counter for each iteration of this loop
-        # quit after 5 attempts (counter will = 4)
-        counter += 1
-        delay = error_check(response)
-
-    return response
-
-
 ########################################################################################
 
 
-def ask_question(question="Would you like to continue?"):
-    """Provide a Yes or No question and prompt user for the answer. Returns True/False"""
+def ask_question(question="Would you like to continue?", default=False):
+    """
+    Provide a Yes or No question and prompt user for the answer. Returns True/False
+    In non-interactive mode the default answer is returned without prompting
+    """
+    if not INTERACTIVE:
+        print(f"\n[?] {question}\t[Non-interactive]: {'Yes' if default else 'No'}")
+        return default
+
     answer = False
 
     while not answer:
@@ -269,23 +269,76 @@ def extract_uuids(json_responses):
     return uuids
 
 
-def get_uuids_data(uuids_to_scan, options):
+def get_uuids_data(uuids_to_scan, options, client, journal=None):
     """
     Method to retrieve the data associated with multiple UUIDs via URLScan.io.
     Returns a list of JSON formatted objects
     """
-    content = []
-    for uuid in uuids_to_scan:
-        scan_content = get_uuid_data(uuid)
-        content.append(scan_content)
+    content = iter_uuids_data(uuids_to_scan, options, client, journal)
+    return [scan_content for scan_content in content if scan_content is not None]
 
-        # Download site PNG and/or DOM from provided uuid
-        if options.get_png:
-            get_uuid_png(uuid, options.out_dir)
-        if options.get_dom:
-            get_uuid_dom(uuid, options.out_dir)
 
-    return content
+def iter_uuids_data(uuids_to_scan, options, client, journal=None):
+    """
+    Method to retrieve the data associated with multiple UUIDs via URLScan.io.
+    Yields JSON formatted objects in input order, 'options.workers' UUIDs at a time
+    The site PNG and/or DOM are downloaded on their own pool of 'options.download_workers'
+    """
+    kinds = selected_artifacts(options)
+    deferred = journal is not None
+    if not kinds:
+
+        def get_data(uuid, record=None):
+            scan_content = try_uuid_data(uuid, client, options.fields)
+            # A failed UUID is left to the dead letter file instead of being journaled as done
+            if scan_content is not None and record is not None:
+                record(scan_content)
+            return scan_content
+
+        yield from map_in_order(get_data, uuids_to_scan, options.workers, journal, deferred)
+        return
+
+    with ArtifactDownloader(
+        client, options.out_dir, kinds, options.download_workers
+    ) as downloader:
+
+        def get_content(uuid, record=None):
+            scan_content = try_uuid_data(uuid, client, options.fields)
+            # Download site PNG and/or DOM from provided uuid
+            #  - the UUID is only journaled once they are saved, so '--resume' retries them
+            #  - a failed UUID is left to the dead letter file instead of being journaled
+            if scan_content is None:
+                return None
+            if record is not None:
+                downloader.submit(uuid, lambda: record(scan_content))
+            else:
+                downloader.submit(uuid)
+            return scan_content
+
+        yield from map_in_order(get_content, uuids_to_scan, options.workers, journal, deferred)
+
+
+def try_uuid_data(uuid, client, fields=None):
+    """
+    Method to retrieve the scan results for a UUID as part of a batch. Returns None
+    (after adding the UUID to the dead letter file) instead of exiting if it fails
+    """
+    try:
+        return get_uuid_data(uuid, client, fields)
+    except (URLScanError, ValueError) as error:
+        print(f"[!] Error: {error}")
+        record_failure(client, "uuid", uuid, error)
+        return None
+
+
+def selected_artifacts(options):
+    """Method to list the artifact kinds ('png', 'dom') selected in the options"""
+    kinds = []
+    if options.get_png:
+        kinds.append("png")
+    if options.get_dom:
+        kinds.append("dom")
+    return kinds
 
 
 ########################################################################################
@@ -293,56 +346,376 @@ def get_uuids_data(uuids_to_scan, options):
 # Note: E1101: Instance of 'LookupDict' has no 'ok' member (no-member)
 
 
-def get_uuid_data(uuid):
-    """Method to retrieve the scan results from URLScan.io with a provided UUID"""
-    target_url = "https://urlscan.io/api/v1/result/" + uuid
+def get_uuid_data(uuid, client, fields=None):
+    """
+    Method to retrieve the scan results from URLScan.io with a provided UUID
+    With 'fields' (see projection.parse_fields) only those parts of the results are returned
+    """
+    print(f"[+] Retrieving results for uuid: '{uuid}'...")
+    scan_content = client.result(uuid, fields)
+    print("[+] Successfully retrieved UUID data!")
+    return scan_content
 
-    print(f"[+] Submitting request to target url: '{target_url}'...")
-    response = requests.get(target_url)
 
-    status = response.status_code
+def poll_uuid_data(uuid, client, fields=None):
+    """
+    Method to check whether the scan for a provided UUID has finished.
+    Returns the scan results (only 'fields' if provided), or None while URLScan.io
+    still reports a '404'
+    """
+    try:
+        return client.result(uuid, fields)
+    except NotFoundError:
+        return None
 
-    if status != requests.codes.ok:
-        print(
-            f"[!] Error Data retrieval for uuid: '{uuid}' \
-        failed with status: '{status}'."
-        )
-        print("[-] Exiting program...")
-        sys.exit(5)
 
-    print("[+] Successfully retrieved UUID data!")
+def extract_iocs_offline(file_names, out_dir, workers=None):
+    """
+    Method to extract the indicators from result files saved by earlier runs (any output
+    format) across a pool of processes, saving a deduplicated IOC table to 'out_dir'
+    """
+    for file_name in file_names:
+        validate_file(file_name)
+    create_directory(out_dir)
 
-    return response.json()
+    print(f"[*] Extracting indicators from {len(file_names)} file(s)...")
+    index = index_files(file_names, IOCIndex(), workers)
+    save_file = out_dir + "/URLScan_IOCs.tsv"
+    index.write(save_file)
+    print(f"[+] Found {len(index)} unique indicator(s) in {index.results} result(s).")
+    print(f"[*] IOC table saved to: '{save_file}'...")
 
 
-def get_uuid_dom(uuid, out_dir):
-    """Retrieve the site DOM from URLScan.io associated with a provided UUID"""
-    target_url = "https://urlscan.io/dom/" + uuid
-    response = requests.get(target_url)
-    status = response.status_code
+def run_pipeline(urls_to_scan, client, data, options, journal=None):
+    """
+    Method to submit URLs and retrieve their results (plus PNG/DOM) in a single run.
+    Returns a tuple of (submission responses, scan results) in the same order as the input
+    """
+    submissions = iter_scan_urls(
+        urls_to_scan, client, data, options.workers, journal, options.next_agent
+    )
+    responses, results = pipeline_results(submissions, client, options)
 
-    if status != requests.codes.ok:
-        print(f"[!] Error: DOM retrieval failed with status: '{status}'.")
-    else:
-        out_file = out_dir + "/DOM_" + str(uuid) + ".html"
-        content = response.content
-        with open(out_file, "wb") as o_f:
-            o_f.write(content)
+    return responses, [result for result in results if result is not None]
 
 
-def get_uuid_png(uuid, out_dir):
-    """Retrieve the site PNG result from URLScan.io associated with a provided UUID"""
-    target_url = "https://urlscan.io/screenshots/" + uuid + ".png"
-    response = requests.get(target_url)
-    status = response.status_code
+def pipeline_results(submissions, client, options):
+    """
+    Method to run submission responses through a ScanPipeline as they arrive. Returns a tuple
+    of (submission responses, scan results) - a result is None if it could not be retrieved
+    """
+    responses = []
+
+    def keep_response(submissions):
+        for response in submissions:
+            responses.append(response)
+            yield response
+
+    results = create_pipeline(client, options).run(keep_response(submissions))
+    return responses, results
 
-    if status != requests.codes.ok:
-        print(f"[!] Error: PNG retrieval failed with status: '{status}'.")
+
+def matrix_batch(items, agents, client, data, options, journal=None):
+    """
+    Method to submit each URL once for every country and user agent variant ('items' and
+    'agents', see scan_matrix.build_variants). The variants are submitted 'options.workers'
+    at a time, paced by the client's shared rate limiter. They neither reuse scans from the
+    history nor are saved to it, so a later normal scan never picks up one of the variants.
+    With --pipeline their results are retrieved too, so the variants can be compared.
+    Returns a tuple of (submission responses, variants grouped per URL, scan results)
+    """
+
+    def submit_variant(item):
+        scan_data = dict(data, country=item["country"], customagent=agents[item["agent_type"]])
+        label = f"{item['country']}/{item['agent_type'] or 'default agent'}"
+        print(f"\n[*] Scanning '{item['url']}' ({label}) now...\n")
+        try:
+            response_json = submit_to_client(client, item["url"], scan_data, record_history=False)
+        except URLScanError as error:
+            response_json = dict(error.content or {"message": str(error)})
+
+        valid_response = validate_response(item["url"], response_json)
+        if not valid_response["uuid"]:
+            record_failure(client, "url", item["url"], valid_response.get("message"))
+        return valid_response
+
+    urls = len({item["url"] for item in items})
+    print(f"\n[*] Scanning {urls} URL(s) in {len(items) // urls} variant(s) each...")
+    submissions = map_in_order(submit_variant, items, options.workers, journal)
+    results = None
+    if options.pipeline:
+        responses, results = pipeline_results(submissions, client, options)
     else:
-        out_file = out_dir + "/" + str(uuid) + ".png"
-        content = response.content
-        with open(out_file, "wb") as o_f:
-            o_f.write(content)
+        responses = list(submissions)
+
+    groups = group_variants(items, agents, responses, results)
+    for group in groups:
+        if group.get("differs"):
+            print(f"[!] Variants of '{group['url']}' differ in: {', '.join(group['differs'])}")
+    return responses, groups, [result for result in results or [] if result is not None]
+
+
+def create_pipeline(client, options, on_result=None):
+    """Method to build a ScanPipeline that polls for results and downloads PNG/DOM via 'client'"""
+
+    kinds = selected_artifacts(options)
+
+    def fetch_artifacts(uuid):
+        for kind in kinds:
+            try_artifact(uuid, kind, options.out_dir, client)
+
+    return ScanPipeline(
+        lambda uuid: poll_uuid_data(uuid, client, options.fields),
+        fetch_artifacts if kinds else None,
+        on_result=on_result,
+        on_failure=lambda uuid, error: record_failure(client, "uuid", uuid, error),
+        workers=options.workers,
+        fetch_workers=options.download_workers,
+        first_poll=options.first_poll,
+        timeout=options.scan_timeout,
+    )
+
+
+def get_stream_format(options):
+    """Streamed responses are always written one per line - compressed if that was chosen"""
+    if options.output_format in STREAM_FORMATS:
+        return options.output_format
+    return "jsonl"
+
+
+def stream_batch(url_stream, uuid_stream, client, data, options, journal=None):
+    """
+    Method to process URLs and/or UUIDs read lazily from a file (or stdin), appending each
+    response to a JSONL file as soon as it arrives so memory use stays flat for any batch size
+    """
+    stream_format = get_stream_format(options)
+    # A resumed run adds to the files of the run it continues, any other run replaces them
+    mode = "a" if options.resume else "w"
+
+    if url_stream is not None:
+        save_file = output_path(options.out_dir + "/URLScan_Results_urls.json", stream_format)
+        uuid_file = options.out_dir + "/UUIDs.json"
+        results_file = output_path(options.out_dir + "/URLScan_Results_uuids.json", stream_format)
+        if options.export_uuids:
+            open(uuid_file, mode, encoding="utf8").close()
+
+        with JsonlWriter(save_file, client.metrics, mode) as writer:
+
+            def save_response(submissions):
+                for response in submissions:
+                    writer.write(response)
+                    if options.export_uuids and response.get("uuid"):
+                        with open(uuid_file, "a", encoding="utf8") as o_f:
+                            o_f.write(response["uuid"] + "\n")
+                    yield response
+
+            submissions = save_response(
+                iter_scan_urls(
+                    url_stream, client, data, options.workers, journal, options.next_agent
+                )
+            )
+            if options.pipeline:
+                with JsonlWriter(results_file, client.metrics, mode) as results_writer:
+                    scan_pipeline = create_pipeline(
+                        client, options, lambda index, result: results_writer.write(result)
+                    )
+                    scan_pipeline.run(submissions)
+                print(f"[*] Results saved to: '{results_file}'...")
+            else:
+                for _ in submissions:
+                    pass
+
+        print(f"[*] Results saved to: '{save_file}'...")
+        if options.export_uuids:
+            print(f"[*] List of UUIDs saved to: '{uuid_file}'...")
+
+    if uuid_stream is not None:
+        save_file = output_path(options.out_dir + "/URLScan_Results_uuids.json", stream_format)
+        with JsonlWriter(save_file, client.metrics, mode) as writer:
+            for scan_content in iter_uuids_data(uuid_stream, options, client, journal):
+                if scan_content is not None:
+                    writer.write(scan_content)
+        print(f"[*] Results saved to: '{save_file}'...")
+
+
+def watch_batch(url_feed, client, data, options):
+    """
+    Method to run as a daemon: URLs arriving from the feed's spool directories, named pipes
+    or stdin go through one shared priority scheduler, rate limiter and connection pool and
+    are saved as they arrive (see 'stream_batch'). SIGINT/SIGTERM stop reading new URLs and
+    drain the ones already queued - a second signal quits straight away
+    """
+
+    scheduler = create_scheduler(client, options)
+
+    def schedule_lines():
+        # Lines are URLs, or JSON items with their own priority and visibility
+        try:
+            for line in url_feed:
+                try:
+                    scheduler.put(parse_line(line))
+                except (ValueError, AttributeError) as error:
+                    print(f"[!] Error: Skipped invalid item: '{line}' ({error})")
+        finally:
+            scheduler.close()
+
+    def shutdown(signum, _frame):
+        if url_feed.stopping.is_set():
+            raise KeyboardInterrupt
+        queued = url_feed.pending() + scheduler.pending()
+        print(f"\n[-] Received signal {signum}: finishing {queued} queued URL(s) (repeat to quit now)...")
+        url_feed.stop()
+
+    handlers = {signum: signal.signal(signum, shutdown) for signum in (signal.SIGINT, signal.SIGTERM)}
+    print(f"\n[*] Watching for URLs in: {', '.join(options.watch)}...")
+    url_feed.start()
+    threading.Thread(target=schedule_lines, daemon=True).start()
+    try:
+        stream_batch(scheduler, None, client, data, options)
+    finally:
+        for signum, handler in handlers.items():
+            signal.signal(signum, handler)
+    print(f"[*] Stopped watching after {url_feed.queued} URL(s)...")
+
+
+def create_scheduler(client, options):
+    """Method to build a PriorityScheduler pacing each visibility by the client's quota for it"""
+    return PriorityScheduler(
+        ready_in=client.keys.wait_time,
+        weights=options.priority_weights,
+        default_visibility=options.scan_type,
+    )
+
+
+def schedule_batch(items, client, data, options):
+    """
+    Method to submit scheduled items (URLs with their own priority and visibility) in
+    weighted fair order, saving each response (and result, with --pipeline) as it arrives
+    """
+    scheduler = create_scheduler(client, options)
+    for item in items:
+        scheduler.put(item)
+    scheduler.close()
+
+    counts = ", ".join(f"{count} {priority}" for priority, count in scheduler.counts.most_common())
+    print(f"\n[*] Scheduled {len(items)} URL(s): {counts}...")
+    stream_batch(scheduler, None, client, data, options)
+
+
+def plan_batch(items, client, options, check_history=True):
+    """
+    Method to plan a batch (URLs or scheduled items) against the account's quota status:
+    prints, for each visibility, when its submissions can go out and the batch should
+    finish. URLs found in the scan history are not counted as they are not submitted again.
+    With --plan (not --plan_only) a batch that spans several quota windows is paced evenly
+    across them instead of running until a window is used up and then stalling on '429's
+    """
+    counts = collections.Counter()
+    for item in items:
+        target_url, visibility, country = item, options.scan_type, options.country_code
+        if isinstance(item, dict):
+            target_url = item["url"]
+            visibility = item.get("visibility", visibility)
+            country = item.get("country", country)
+        if (
+            not check_history
+            or client.history is None
+            or client.history.recent(target_url, visibility, country) is None
+        ):
+            counts[visibility] += 1
+    if not counts:
+        print("[+] Every URL was scanned recently - nothing will be submitted...")
+        return
+
+    try:
+        quotas = parse_quotas(client.quotas())
+    except URLScanError as error:
+        print(f"[!] Error: Could not read the quota status: {error}")
+        if options.plan_only:
+            print("[-] Exiting program...")
+            sys.exit(5)
+        print("[-] Continuing without a plan...")
+        return
+
+    keys = len(client.keys)
+    print(f"\n[*] Planning {sum(counts.values())} submission(s) across {keys} API key(s)...")
+    for visibility, count in counts.most_common():
+        windows = quotas.get(visibility, {})
+        try:
+            plan = plan_submissions(count, windows, keys, options.rate_limit)
+        except ValueError as error:
+            print(f"[!] Warning: {visibility} scans can not be submitted: {error}")
+            continue
+        pace = pacing_rate(plan, windows, keys)
+        if pace is not None:
+            pace = min(pace, options.rate_limit)
+            # The schedule the paced submissions follow
+            plan = plan_submissions(count, windows, keys, pace)
+        for line in format_plan(visibility, plan, windows, pace):
+            print(line)
+        if pace is not None and not options.plan_only:
+            client.set_rate_limit(visibility, pace)
+
+
+def search_batch(query, client, options):
+    """
+    Method to save every result of a search to a JSONL file, page by page as they arrive.
+    With 'options.search_fetch' the full scan results (plus PNG/DOM) of the matching UUIDs
+    are retrieved as well, while later pages are still being read
+    """
+    stream_format = get_stream_format(options)
+    save_file = output_path(options.out_dir + "/URLScan_Search.json", stream_format)
+    results_file = output_path(options.out_dir + "/URLScan_Results_uuids.json", stream_format)
+
+    # A repeated search replaces the saved results
+    print(f"\n[*] Searching URLScan.io for: '{query}'...")
+    with JsonlWriter(save_file, client.metrics, "w") as writer:
+
+        def search_uuids():
+            found = 0
+            for page in client.search_pages(query, options.search_size, options.search_limit):
+                for search_result in page:
+                    writer.write(search_result)
+                found += len(page)
+                print(f"[+] Retrieved {found} search result(s)...")
+                for search_result in page:
+                    uuid = search_result.get("_id") or search_result.get("task", {}).get("uuid")
+                    if uuid:
+                        yield uuid
+
+        if options.search_fetch:
+            with JsonlWriter(results_file, client.metrics, "w") as results_writer:
+                for scan_content in iter_uuids_data(search_uuids(), options, client):
+                    if scan_content is not None:
+                        results_writer.write(scan_content)
+            print(f"[*] Results saved to: '{results_file}'...")
+        else:
+            for _ in search_uuids():
+                pass
+
+    print(f"[*] Search results saved to: '{save_file}'...")
+
+
+def try_artifact(uuid, kind, out_dir, client):
+    """
+    Method to download an artifact ('png' or 'dom') for a UUID. Returns False (after
+    printing the error) instead of raising if it fails
+    """
+    try:
+        return download_artifact(uuid, kind, out_dir, client)
+    except URLScanError as error:
+        print(f"[!] Error: {error}")
+        return False
+
+
+def get_uuid_dom(uuid, out_dir, client):
+    """Retrieve the site DOM from URLScan.io associated with a provided UUID"""
+    return try_artifact(uuid, "dom", out_dir, client)
+
+
+def get_uuid_png(uuid, out_dir, client):
+    """Retrieve the site PNG result from URLScan.io associated with a provided UUID"""
+    return try_artifact(uuid, "png", out_dir, client)
 
 
 # pylint: enable=E1101
@@ -350,32 +723,45 @@ def get_uuid_png(uuid, out_dir):
 
 
 def validate_file(file_path):
-    """ Method to check if a provided file path exists and exit with error message if not"""
-    if os.path.isfile(file_path):
+    """ Method to check if a provided file path exists, raises FileNotFoundError if not"""
+    # Note: '-' stands for stdin when reading lists of URLs/UUIDs
+    if file_path == "-" or os.path.isfile(file_path):
         return
 
-    print("[!] Error: File not found!")
-    print(f"[-] Please check input: '{file_path}'")
-    print("[-] Exiting program...")
-    sys.exit(2)
+    raise FileNotFoundError(f"Please check input: '{file_path}'")
 
 
 def read_in_json(file_name):
-    """ Read in JSON data from a file"""
-    json_data = {}
-    with open(file_name, "r", encoding="utf8") as in_file:
-        json_data = json.load(in_file)
-
-    return json_data
+    """ Read in JSON data from a file (pretty, compact, JSONL or gzip/zstd compressed JSONL)"""
+    return read_json(file_name)
 
 
 def read_in_nline(file_name):
     """ Read in data from a file, splitting it up line by line"""
+    if file_name == "-":
+        return sys.stdin.read().splitlines()
     with open(file_name, "r", encoding="utf8") as in_file:
         data = in_file.read().splitlines()
     return data
 
 
+def iter_nline(file_name):
+    """Lazily read data from a file (or stdin for '-') one line at a time, skipping blank lines"""
+    if file_name == "-":
+        in_file = sys.stdin
+    else:
+        in_file = open(file_name, "r", encoding="utf8")  # pylint: disable=consider-using-with
+
+    try:
+        for line in in_file:
+            line = line.strip()
+            if line:
+                yield line
+    finally:
+        if in_file is not sys.stdin:
+            in_file.close()
+
+
 def create_directory(directory_path):
     """Method to create a new directory if it does not already exist"""
     try:
@@ -387,10 +773,46 @@ def create_directory(directory_path):
         )
 
 
-def save_json_content(out_file, json_content):
-    """ Method to save a JSON formatted content to a provided file path """
-    with open(out_file, "w", encoding="utf8") as o_f:
-        json.dump(json_content, o_f, ensure_ascii=False, indent=4)
+def save_json_content(out_file, json_content, metrics=None, output_format="pretty"):
+    """ Method to save a JSON formatted content to a provided file path in an output format """
+    start = time.perf_counter()
+    write_json(out_file, json_content, output_format)
+    if metrics is not None:
+        metrics.observe("disk_write_seconds", time.perf_counter() - start, kind="json")
+
+
+class JsonlWriter:
+    """
+    Appends JSON objects to a file one per line, flushing each one as soon as it is written
+    (mode 'w' replaces the file's earlier contents instead of adding to them)
+    Files ending in '.gz' or '.zst' are compressed (each flush ends a compressed block)
+    The time spent writing is recorded in 'metrics' (a RunMetrics) if one is given
+    """
+
+    def __init__(self, out_file, metrics=None, mode="a"):
+        self.out_file = open_text(out_file, mode)
+        self.metrics = metrics
+        self.lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def write(self, json_content):
+        """Append one JSON object to the file"""
+        line = dumps(json_content) + "\n"
+        with self.lock:
+            start = time.perf_counter()
+            self.out_file.write(line)
+            self.out_file.flush()
+            if self.metrics is not None:
+                self.metrics.observe("disk_write_seconds", time.perf_counter() - start, kind="jsonl")
+
+    def close(self):
+        """Close the underlying file"""
+        self.out_file.close()
 
 
 def save_list_to__file(out_file, content):
@@ -404,10 +826,8 @@ def save_list_to__file(out_file, content):
 ########################################################################################
 
 
-def main():
-    """Main driver method -- program provides interface to interact with URLScan.io API"""
-    #####################################################################
-    # Initialize Program Menu
+def build_parser():
+    """Method to build the program menu (command line arguments)"""
     parser = argparse.ArgumentParser(
         description=__description__,
         epilog=f"Last Modified by {__author__} on {__date__}",
@@ -437,6 +857,63 @@ def main():
         dest="response_file",
         help="Enter the path to a File containing response generated by submitting a URL.",
     )
+    parser.add_argument(
+        "--search",
+        dest="search",
+        help="Search URLScan.io's existing scans with a query (e.g. 'domain:example.com')\
+         and save every result, paging through them as they arrive.",
+    )
+    parser.add_argument(
+        "--search_size",
+        dest="search_size",
+        help="Used with --search: Number of results requested per page (default: 100).",
+        type=int,
+        default=100,
+    )
+    parser.add_argument(
+        "--search_limit",
+        dest="search_limit",
+        help="Used with --search: Stop after this many results (default: every result).",
+        type=int,
+    )
+    parser.add_argument(
+        "--search_fetch",
+        dest="search_fetch",
+        help="Used with --search: Also retrieve the full results (and --png/--dom) of every scan found.",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--priority_file",
+        dest="priority_file",
+        help="Submit URLs with their own priority (urgent, high, normal, low) and visibility from a CSV\
+         file (header row naming 'url', 'priority', 'visibility', 'tags', 'country' columns) or a JSONL\
+         file of objects with those keys. Each visibility is paced by its own quota and priorities\
+         share it by weight, so urgent URLs jump ahead of a bulk batch.",
+    )
+    parser.add_argument(
+        "--priority_weights",
+        dest="priority_weights",
+        help="Used with --priority_file/--watch: Share of submissions given to each priority while\
+         several wait, e.g. 'urgent:20,low:1' (default: urgent:8,high:4,normal:2,low:1).",
+    )
+    parser.add_argument(
+        "--watch",
+        dest="watch",
+        nargs="+",
+        metavar="SOURCE",
+        help="Run until stopped, scanning URLs as they arrive from spool directories (each new file\
+         is read, then moved to '<directory>/processed/'), named pipes or stdin ('-'). Lines are URLs or\
+         JSON objects with a priority and visibility as in --priority_file. Results are\
+         saved as they arrive (add --pipeline for the scan results); SIGINT/SIGTERM finish the\
+         queued URLs before exiting.",
+    )
+    parser.add_argument(
+        "--watch_interval",
+        dest="watch_interval",
+        help="Used with --watch: Seconds between checks of the spool directories (default: 5).",
+        type=float,
+        default=5.0,
+    )
     parser.add_argument(
         "-o",
         "--output_location",
@@ -462,6 +939,21 @@ def main():
         dest="custom_agent",
         help="Provide custom User Agent string - wrapped in quotes - to submit with scan.",
     )
+    parser.add_argument(
+        "--rotate_agents",
+        dest="rotate_agents",
+        help=f"Used with URL files: Give each scan its own user agent drawn from a pool of types\
+         with optional weights, e.g. 'iOS,Android' or 'iOS:3,Android:1' or 'all'\
+         (types: {', '.join(UA.AGENT_TYPES)}).",
+    )
+    parser.add_argument(
+        "--rotation",
+        dest="rotation",
+        help="Used with --rotate_agents: Draw agents at 'random' (honouring weights) or 'cycle' through them in order\
+         (default: random).",
+        choices=["random", "cycle"],
+        default="random",
+    )
     parser.add_argument(
         "-T",
         "--tags",
@@ -488,14 +980,301 @@ def main():
         help="Signal you wish to download the DOM associated with provided UUID.",
         action="store_true",
     )
+    parser.add_argument(
+        "--artifact_store",
+        dest="artifact_store",
+        help=f"Used with --png/--dom: Save each distinct PNG/DOM once, named by its SHA-256, under\
+         <output>/{DEFAULT_STORE_DIR}/ with a manifest of UUID -> hash in <output>/{DEFAULT_MANIFEST_FILE}.",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--compress_dom",
+        dest="compress_dom",
+        help="Used with --artifact_store: Save DOMs gzip compressed.",
+        action="store_true",
+    )
     parser.add_argument(
         "-c",
         "--country_code",
         dest="country_code",
         help="Country code that you wish the scan to originate from.",
-        choices=("de", "us", "jp", "fr", "gb", "nl", "ca", "it", "es"),
+        choices=COUNTRY_CODES,
         default="us",
     )
+    parser.add_argument(
+        "--matrix_countries",
+        dest="matrix_countries",
+        nargs="+",
+        metavar="COUNTRY",
+        help="Used with --url/--url_file: Scan every URL from each of these countries (and each\
+         --matrix_agents type), saving the UUIDs of its variants together in <output>/URLScan_Matrix.json.",
+        choices=COUNTRY_CODES,
+    )
+    parser.add_argument(
+        "--matrix_agents",
+        dest="matrix_agents",
+        nargs="+",
+        metavar="TYPE",
+        help=f"Used with --url/--url_file: Scan every URL with a user agent of each of these types\
+         (and from each --matrix_countries country), or 'all' (types: {', '.join(UA.AGENT_TYPES)}).",
+    )
+    parser.add_argument(
+        "-W",
+        "--workers",
+        dest="workers",
+        help="Used with URL files: Number of URL submissions to keep in flight at once.",
+        type=int,
+        default=1,
+    )
+    parser.add_argument(
+        "--rate_limit",
+        dest="rate_limit",
+        help="Used with URL files: Submission quota per minute for each URLScan.io API key.",
+        type=int,
+        default=DEFAULT_RATE_LIMIT,
+    )
+    parser.add_argument(
+        "--plan",
+        dest="plan",
+        help="Used with --url_file/--priority_file: Read the account's quota status, print when the batch\
+         should finish and pace each visibility so its submissions are spread across the quota windows.",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--plan_only",
+        "--plan-only",
+        dest="plan_only",
+        help="Like --plan, but only print the schedule and exit without submitting anything.",
+        action="store_true",
+    )
+    parser.add_argument(
+        "-P",
+        "--pipeline",
+        dest="pipeline",
+        help="Used with URLs: Wait for each scan to finish and retrieve its results (and PNG/DOM).",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--scan_timeout",
+        dest="scan_timeout",
+        help="Used with --pipeline: Seconds to wait for a scan to finish (default: 300).",
+        type=int,
+        default=300,
+    )
+    parser.add_argument(
+        "-S",
+        "--stream",
+        dest="stream",
+        help="Used with URL/UUID files: Read the file lazily ('-' for stdin) and append each\
+         response to a JSONL file as soon as it arrives.",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--cache_file",
+        dest="cache_file",
+        help=f"Used with UUIDs: Location of the local results cache (default: {DEFAULT_CACHE_FILE}).",
+        default=DEFAULT_CACHE_FILE,
+    )
+    parser.add_argument(
+        "--cache_size",
+        dest="cache_size",
+        help="Used with UUIDs: Maximum size of the local results cache in MB (default: 512).",
+        type=int,
+        default=512,
+    )
+    parser.add_argument(
+        "--no_cache",
+        "--no-cache",
+        dest="no_cache",
+        help="Used with UUIDs: Do not read from or write to the local results cache.",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--refresh",
+        dest="refresh",
+        help="Used with UUIDs: Ignore cached copies and download fresh ones into the cache.",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--history_file",
+        dest="history_file",
+        help=f"Used with URLs: Location of the local scan history (default: {DEFAULT_HISTORY_FILE}).",
+        default=DEFAULT_HISTORY_FILE,
+    )
+    parser.add_argument(
+        "--rescan_after",
+        dest="rescan_after",
+        help="Used with URL files: Hours before a URL in the scan history is submitted again (default: 24).",
+        type=float,
+        default=24,
+    )
+    parser.add_argument(
+        "--no_history",
+        dest="no_history",
+        help="Used with URL files: Submit every URL, ignoring the local scan history.",
+        action="store_true",
+    )
+    parser.add_argument(
+        "-R",
+        "--resume",
+        dest="resume",
+        help="Used with URL/UUID files: Skip items completed by a previous run that failed part way.",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--download_workers",
+        dest="download_workers",
+        help="Used with --png/--dom: Number of PNG/DOM downloads to run at once (default: 4).",
+        type=int,
+        default=4,
+    )
+    parser.add_argument(
+        "-N",
+        "--non_interactive",
+        "--non-interactive",
+        dest="non_interactive",
+        help="Never prompt for input: questions take their default answer (for unattended runs).",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--max_attempts",
+        dest="max_attempts",
+        help="Maximum number of attempts for each request to URLScan.io (default: 5).",
+        type=int,
+        default=5,
+    )
+    parser.add_argument(
+        "--retry_delay",
+        dest="retry_delay",
+        help="Base delay in seconds for the exponential back-off between retries (default: 1).",
+        type=float,
+        default=1.0,
+    )
+    parser.add_argument(
+        "--max_retry_delay",
+        dest="max_retry_delay",
+        help="Longest delay in seconds between two retries (default: 60).",
+        type=float,
+        default=60.0,
+    )
+    parser.add_argument(
+        "--retry_statuses",
+        dest="retry_statuses",
+        nargs="+",
+        type=int,
+        help=f"Response status codes that are retried (default: {' '.join(map(str, RETRY_STATUSES))}).",
+        default=list(RETRY_STATUSES),
+    )
+    parser.add_argument(
+        "--retry_on",
+        dest="retry_on",
+        nargs="+",
+        help="Request errors that are retried (default: all).",
+        choices=tuple(RETRY_EXCEPTIONS),
+        default=list(RETRY_EXCEPTIONS),
+    )
+    parser.add_argument(
+        "--timeout",
+        dest="timeout",
+        help="Seconds to wait for URLScan.io to respond to a request (default: 30).",
+        type=float,
+        default=30.0,
+    )
+    parser.add_argument(
+        "--dead_letter",
+        dest="dead_letter",
+        help="File where items that failed are saved (default: <output>/URLScan_Failed.jsonl).",
+    )
+    parser.add_argument(
+        "--key_file",
+        dest="key_file",
+        help=f"File with several API keys (one per line) to spread requests across\
+         (default: '{KEYS_ENV_VAR}' from the environment).",
+    )
+    parser.add_argument(
+        "--pool_size",
+        dest="pool_size",
+        help="Number of connections to URLScan.io kept open for reuse (default: max(10, all workers)).",
+        type=int,
+    )
+    parser.add_argument(
+        "--base_url",
+        dest="base_url",
+        help=f"Base URL of the URLScan.io API, e.g. a local mock server for testing\
+         (default: '{BASE_URL_ENV_VAR}' from the environment, else '{URLSCAN_URL}').",
+        default=os.environ.get(BASE_URL_ENV_VAR, URLSCAN_URL),
+    )
+    parser.add_argument(
+        "--fields",
+        dest="fields",
+        help="Used with UUIDs: Keep only these comma separated (dotted) parts of each result, e.g.\
+         'verdicts,page,lists' or 'task.uuid,lists.ips'. Results are parsed incrementally when\
+         'ijson' is installed and --no_cache is set, so only the selected parts are held in memory.",
+    )
+    parser.add_argument(
+        "--iocs",
+        dest="iocs",
+        help="Used with UUIDs: Extract the domains, IPs, ASNs, certificates and hashes of every result\
+         into a deduplicated table (<output>/URLScan_IOCs.tsv) as results arrive.",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--extract_iocs",
+        dest="extract_iocs",
+        nargs="+",
+        help="Extract the indicators from result files saved by earlier runs (any --output_format)\
+         into <output>/URLScan_IOCs.tsv without contacting URLScan.io.",
+    )
+    parser.add_argument(
+        "--ioc_workers",
+        dest="ioc_workers",
+        help="Used with --extract_iocs: Number of processes parsing result files (default: CPU count).",
+        type=int,
+    )
+    parser.add_argument(
+        "--output_format",
+        "--output-format",
+        dest="output_format",
+        help="Format of the result files: 'pretty' (indented JSON), 'compact' (single line JSON),\
+         'jsonl' (one result per line) or JSONL compressed with 'gzip' or 'zstd' (default: pretty).\
+         Uses 'orjson' to encode results if it is installed.",
+        choices=list(OUTPUT_FORMATS),
+        default="pretty",
+    )
+    parser.add_argument(
+        "--stats_file",
+        dest="stats_file",
+        help="File where request counts, latencies and quota use are saved as JSON\
+         (default: <output>/URLScan_Stats.json).",
+    )
+    parser.add_argument(
+        "--prometheus_file",
+        dest="prometheus_file",
+        help="Also save the run stats in Prometheus text format (e.g. for a node_exporter textfile collector).",
+    )
+    parser.add_argument(
+        "--stats_interval",
+        dest="stats_interval",
+        help="Seconds between saving the run stats during a run (default: 0 = only at the end).",
+        type=float,
+        default=0,
+    )
+    parser.add_argument(
+        "--first_poll",
+        dest="first_poll",
+        help="Seconds to wait before first polling for a submitted scan's result with --pipeline (default: 10).",
+        type=float,
+        default=10.0,
+    )
+
+    return parser
+
+
+def main():
+    """Main driver method -- program provides interface to interact with URLScan.io API"""
+    #####################################################################
+    # Initialize Program Menu
+    parser = build_parser()
 
     # Check for above arguments - if none are provided, Display --help and exit
     if len(sys.argv) == 1:
@@ -504,16 +1283,144 @@ def main():
 
     # Load menu options
     options = parser.parse_args()
+    # The client logs its retries and failed downloads - show them with the rest of the output
+    logging.basicConfig(format="%(message)s", level=logging.INFO, stream=sys.stdout)
+    try:
+        run(parser, options)
+    except FileNotFoundError as error:
+        print("[!] Error: File not found!")
+        print(f"[-] {error}")
+        print("[-] Exiting program...")
+        sys.exit(2)
+
+
+def run(parser, options):
+    """
+    Method to run the program for the parsed menu 'options' - a thin wrapper around
+    URLScanClient adding prompts, batch files, journals and the saved output
+    """
+    global INTERACTIVE  # pylint: disable=global-statement
+    INTERACTIVE = not options.non_interactive
+    if options.user_agent and not INTERACTIVE:
+        parser.error("-U/--user_agent prompts for a choice and can not be used with --non_interactive")
+
+    if options.output_format == "zstd" and zstandard is None:
+        parser.error("--output_format zstd requires the 'zstandard' package (pip install zstandard)")
+
+    if min(options.workers, options.download_workers, options.rate_limit) < 1:
+        parser.error("--workers, --download_workers and --rate_limit must be at least 1")
+
+    if options.search:
+        other_inputs = [
+            flag
+            for flag, value in (
+                ("--url", options.input_url),
+                ("--uuid", options.input_uuid),
+                ("--url_file", options.url_file),
+                ("--uuid_file", options.uuid_file),
+                ("--response_file", options.response_file),
+                ("--priority_file", options.priority_file),
+                ("--watch", options.watch),
+            )
+            if value
+        ]
+        if other_inputs:
+            parser.error(f"--search can not be combined with {', '.join(other_inputs)}")
+        # A search always pages from the start, resuming would only add its results again
+        if options.resume:
+            parser.error("--resume can not be used with --search")
+
+    if options.watch:
+        other_inputs = [
+            flag
+            for flag, value in (
+                ("--url", options.input_url),
+                ("--uuid", options.input_uuid),
+                ("--url_file", options.url_file),
+                ("--uuid_file", options.uuid_file),
+                ("--response_file", options.response_file),
+                ("--priority_file", options.priority_file),
+            )
+            if value
+        ]
+        if other_inputs:
+            parser.error(f"--watch can not be combined with {', '.join(other_inputs)}")
+
+    # Input read from stdin leaves nothing to answer the prompts for the API key or output location
+    stdin_inputs = [
+        flag
+        for flag, value in (
+            ("--url_file", options.url_file),
+            ("--uuid_file", options.uuid_file),
+            ("--priority_file", options.priority_file),
+            ("--watch", "-" if options.watch and "-" in options.watch else None),
+        )
+        if value == "-"
+    ]
+    if stdin_inputs:
+        reading = f"{'/'.join(stdin_inputs)} '-' reads stdin"
+        if not (options.key_file or load_api_keys() or os.environ.get(API_KEY_ENV_VAR)):
+            parser.error(f"{reading}: set '{API_KEY_ENV_VAR}' (or '{KEYS_ENV_VAR}' or --key_file)")
+        if not options.out_dir:
+            parser.error(f"{reading}: an output location (-o) is required")
+        if options.user_agent:
+            parser.error(f"{reading}: -U/--user_agent prompts for a choice and can not be used")
+
+    if options.compress_dom and not options.artifact_store:
+        parser.error("--compress_dom can only be used with --artifact_store")
+
+    if options.priority_weights is not None:
+        try:
+            options.priority_weights = parse_weights(options.priority_weights)
+        except ValueError as error:
+            parser.error(f"--priority_weights: {error}")
+
+    if options.fields is not None:
+        try:
+            options.fields = parse_fields(options.fields)
+        except ValueError as error:
+            parser.error(f"--fields: {error}")
+        # Results are parsed on the worker threads - load the parser before they start
+        load_parser()
+
+    if options.search_size < 1 or (options.search_limit is not None and options.search_limit < 1):
+        parser.error("--search_size and --search_limit must be at least 1")
+
+    options.matrix = bool(options.matrix_countries or options.matrix_agents)
+    if options.matrix:
+        if not (options.input_url or (options.url_file and not options.stream)):
+            parser.error("--matrix_countries/--matrix_agents need --url or --url_file (without --stream)")
+        if options.rotate_agents:
+            parser.error("--rotate_agents can not be used with --matrix_agents/--matrix_countries")
+        try:
+            options.matrix_agents = parse_agent_types(options.matrix_agents or [])
+        except ValueError as error:
+            parser.error(f"--matrix_agents: {error}")
+
+    options.plan = options.plan or options.plan_only
+    if options.plan and not (options.priority_file or (options.url_file and not options.stream)):
+        parser.error(
+            "--plan and --plan_only need the whole batch up front: use --url_file (without --stream) or --priority_file"
+        )
+    #####################################################################
+
+    # Indicators can be extracted from earlier results without contacting URLScan.io
+    if options.extract_iocs:
+        extract_iocs_offline(options.extract_iocs, options.out_dir or ".", options.ioc_workers)
+        return
     #####################################################################
 
     #####################################################################
     # Initialize variables
-    time_delay = 0
     target_url = ""
     target_uuid = ""
 
     json_file_data = {}
+    scheduled_items = []
     responses = []
+    matrix_groups = []
+    url_stream = None
+    uuid_stream = None
     urls_to_scan = []
     uuids_to_save = []
     uuids_to_scan = []
@@ -532,20 +1439,47 @@ def main():
         # Check to make sure the provided file exists, if not show error message and exit
         validate_file(options.url_file)
         # Read in URL's from a file where each URL is on a separate line
-        urls_to_scan = read_in_nline(options.url_file)
+        if options.stream:
+            url_stream = iter_nline(options.url_file)
+        else:
+            urls_to_scan = read_in_nline(options.url_file)
     elif options.uuid_file:
         # Check to make sure the provided file exists, if not show error message and exit
         validate_file(options.uuid_file)
         # Read in UUID's from a file where each UUID is on a separate line
-        uuids_to_scan = read_in_nline(options.uuid_file)
+        if options.stream:
+            uuid_stream = iter_nline(options.uuid_file)
+        else:
+            uuids_to_scan = read_in_nline(options.uuid_file)
+    elif options.search:
+        # Search results are read page by page once the client is ready
+        pass
+    elif options.priority_file:
+        validate_file(options.priority_file)
+        try:
+            if options.priority_file == "-":
+                scheduled_items = list(read_items(sys.stdin))
+            else:
+                with open(options.priority_file, "r", encoding="utf8", newline="") as in_file:
+                    scheduled_items = list(read_items(in_file))
+        except ValueError as error:
+            parser.error(f"--priority_file: {error}")
+    elif options.watch:
+        # URLs keep arriving while the program runs - see 'watch_batch()'
+        try:
+            url_feed = URLFeed(options.watch, options.watch_interval)
+        except ValueError as error:
+            parser.error(f"--watch: {error}")
     elif options.response_file:
         # Check to make sure the provided file exists, if not show error message and exit
         validate_file(options.response_file)
         json_file_data = read_in_json(options.response_file)
-        if ask_question("Select UUID from file to submit?"):
+        if ask_question("Select UUID from file to submit?", default=True):
             uuids_to_scan = extract_uuids(json_file_data)
         elif ask_question("Select URL from file to submit?"):
             urls_to_scan = extract_urls(json_file_data)
+    elif not INTERACTIVE:
+        parser.error("an input (--url, --uuid, --url_file, ...) is required with --non_interactive")
     else:
         target_url = input(
             "[->] Please enter the suspicious URL you would like to scan: "
@@ -555,7 +1489,12 @@ def main():
     #####################################################################
     # Check environment for URLSCAN API Key
     #  if not found prompt user for their api key
-    api_key = get_api_key()
+    # Several keys (--key_file or URLSCAN_API_KEYS) are pooled, otherwise a single key is used
+    if options.key_file:
+        validate_file(options.key_file)
+    api_keys = load_api_keys(options.key_file)
+    if not api_keys:
+        api_keys = [get_api_key()]
 
     # Initialize user agent variable for http POST request to URLScan.io
     if options.user_agent:
@@ -568,6 +1507,26 @@ def main():
     else:
         # Randomly select a user agent of the "iOS" type
         user_agent = UA.get_random_agent("iOS")
+
+    # Optionally rotate through a pool of user agents: one per submitted URL
+    options.next_agent = None
+    if options.rotate_agents:
+        try:
+            agent_pool = UA.parse_agent_pool(options.rotate_agents)
+        except ValueError as error:
+            parser.error(f"--rotate_agents: {error}")
+        options.next_agent = agent_pool.choice if options.rotation == "random" else agent_pool.next
+    #####################################################################
+
+    # Scan each URL once for every combination of country and user agent type
+    matrix_items = []
+    if options.matrix:
+        matrix_agents = choose_agents(options.matrix_agents, user_agent)
+        if target_url:
+            urls_to_scan, target_url = [target_url], ""
+        matrix_items = build_variants(
+            urls_to_scan, options.matrix_countries or [options.country_code], matrix_agents
+        )
     #####################################################################
 
     #####################################################################
@@ -581,17 +1540,16 @@ def main():
     # Note: URLScan.io limits the number of tags to 10
     tags = []
     if options.tags:
-        if len(options.tags) > 10:
+        if len(options.tags) > MAX_TAGS:
             print(
-                f"\n[!] Warning: MAX number of tags is 10 - you provided: '{len(options.tags)}'"
+                f"\n[!] Warning: MAX number of tags is {MAX_TAGS} - you provided: '{len(options.tags)}'"
             )
-            print("[-] Submitting only the first 10 tags:")
-            tags = options.tags[0:10]
+            print(f"[-] Submitting only the first {MAX_TAGS} tags:")
+            tags = options.tags[0:MAX_TAGS]
             print(f"\t{tags}")
         else:
             tags = options.tags
 
-    headers = {"API-Key": api_key, "Content-Type": "application/json"}
     data = {
         "url": "",
         "visibility": privacy_level,
@@ -600,97 +1558,268 @@ def main():
         "tags": tags,
     }
 
+    # Every request shares one pooled session so connections to URLScan.io are reused
+    #  instead of opened for each request, and is paced by the limiter of the key it uses:
+    #  submissions follow the account's per-minute quota and slow down as the quota
+    #  headers report the window running out
+    pool_size = options.pool_size or max(10, options.workers + options.download_workers)
+    retry_policy = RetryPolicy(
+        max_attempts=options.max_attempts,
+        base_delay=options.retry_delay,
+        max_delay=options.max_retry_delay,
+        retry_statuses=options.retry_statuses,
+        retry_exceptions=lambda: retry_exceptions(options.retry_on),
+    )
+    client = URLScanClient(
+        api_keys,
+        base_url=options.base_url,
+        visibility=privacy_level,
+        country=source_country,
+        user_agent=user_agent,
+        tags=tags,
+        rate_limit=options.rate_limit,
+        workers=options.workers,
+        pool_size=pool_size,
+        retry=retry_policy,
+        timeout=options.timeout,
+    )
+    if len(client.keys) > 1:
+        print(f"[+] Spreading requests across {len(client.keys)} API keys...")
+
+    # Finished scans never change: keep results, PNGs and DOMs in a local cache
+    #  so UUIDs that have already been downloaded are served without a network call
+    if not options.no_cache:
+        client.cache = ResultCache(
+            options.cache_file,
+            max_bytes=options.cache_size * 1024 * 1024,
+            refresh=options.refresh,
+        )
+
+    # Remember every submission so URLs scanned within the last 'rescan_after' hours
+    #  reuse their earlier UUID instead of spending submission quota again
+    if not options.no_history:
+        client.history = ScanHistory(
+            options.history_file, ttl=options.rescan_after * 60 * 60
+        )
+
+    # Check the batch against the account's quota before any of it is submitted
+    if options.plan:
+        if matrix_items:
+            # Every variant is a new submission, even for URLs in the scan history
+            plan_batch(matrix_items, client, options, check_history=False)
+        else:
+            plan_batch(scheduled_items or urls_to_scan, client, options)
+        if options.plan_only:
+            client.close()
+            print("\n[+] Plan complete - nothing was submitted!\n")
+            print("*** " * 12)
+            print("\n")
+            return
+
     #####################################################################
     # Create Directory to save results...
     if options.out_dir:
         save_dir = options.out_dir
+    elif not INTERACTIVE:
+        parser.error("an output location (-o) is required with --non_interactive")
     else:
         save_dir = input(
             "\n[->] Please enter the Directory name where you wish to save the results: "
         )
 
     create_directory(save_dir)
+    # Batch downloads (PNG/DOM) read the save location from the options
+    options.out_dir = save_dir
+
+    # Count and time every request (plus rate limit and retry waits) for the run stats
+    stats_file = options.stats_file or save_dir + "/URLScan_Stats.json"
+    if options.stats_interval > 0:
+        client.metrics.start_flushing(
+            options.stats_interval, stats_file, options.prometheus_file
+        )
+
+    # Optionally save PNGs/DOMs once per distinct body instead of once per UUID
+    if options.artifact_store:
+        client.artifact_store = ArtifactStore(
+            os.path.join(save_dir, DEFAULT_STORE_DIR),
+            os.path.join(save_dir, DEFAULT_MANIFEST_FILE),
+            compress_dom=options.compress_dom,
+        )
+
+    # Optionally index the indicators of every result as it arrives
+    if options.iocs:
+        client.iocs = IOCIndex()
+
+    # Items that still fail after retrying are set aside instead of stopping the batch
+    client.dead_letter = DeadLetterQueue(
+        options.dead_letter or save_dir + "/URLScan_Failed.jsonl"
+    )
+
+    # Record each completed item of a URL/UUID file so a failed run can be resumed
+    journal = None
+    if options.url_file or options.uuid_file:
+        journal_file = save_dir + (
+            "/URLScan_Journal_urls.jsonl"
+            if options.url_file
+            else "/URLScan_Journal_uuids.jsonl"
+        )
+        # Streamed results are already on disk - resumed items only need to be skipped
+        journal = ProgressJournal(
+            journal_file, resume=options.resume, keep_results=not options.stream
+        )
 
     #####################################################################
 
     #####################################################################
     # Submit http POST request to URLScan.io and retrieve response(s)
-    if urls_to_scan:
-        responses = scan_urls(urls_to_scan, headers, data)
+    if options.search:
+        try:
+            search_batch(options.search, client, options)
+        except (URLScanError, ValueError) as error:
+            print(f"[!] Error: {error}")
+            print("[-] Exiting program...")
+            sys.exit(5)
+
+    elif options.watch:
+        watch_batch(url_feed, client, data, options)
+
+    elif scheduled_items:
+        schedule_batch(scheduled_items, client, data, options)
+
+    elif matrix_items:
+        responses, matrix_groups, uuid_responses = matrix_batch(
+            matrix_items, matrix_agents, client, data, options, journal
+        )
         if options.export_uuids:
             uuids_to_save = extract_uuids(responses)
 
-    elif target_url:
-        data["url"] = target_url
-        print(f"\n[+] Scanning '{target_url}' now...")
-        response = requests.post(
-            "https://urlscan.io/api/v1/scan/", headers=headers, data=json.dumps(data)
+    elif url_stream is not None or uuid_stream is not None:
+        # Responses are saved as they arrive instead of with the other results below
+        stream_batch(url_stream, uuid_stream, client, data, options, journal)
+
+    elif urls_to_scan and options.pipeline:
+        responses, uuid_responses = run_pipeline(
+            urls_to_scan, client, data, options, journal
         )
+        if options.export_uuids:
+            uuids_to_save = extract_uuids(responses)
 
-        print("[-] Checking Response...")
+    elif urls_to_scan:
+        responses = scan_urls(
+            urls_to_scan,
+            client,
+            data,
+            workers=options.workers,
+            journal=journal,
+            next_agent=options.next_agent,
+        )
+        if options.export_uuids:
+            uuids_to_save = extract_uuids(responses)
 
-        time_delay = error_check(response)
-        if time_delay != 0:
-            response = replay_request(response, headers, data, time_delay, target_url)
+    elif target_url:
+        print(f"\n[+] Scanning '{target_url}' now...")
+        # Note: '429's wait for the quota to reset and other errors are retried by the client
+        try:
+            submission = submit_to_client(client, target_url, data)
+        except URLScanError as error:
+            print(f"[!] Error: {error}")
+            print("[-] Exiting program...")
+            sys.exit(1)
 
-        if response:
-            if ask_question("[?] Would you like to view the URL submission results?"):
-                display_url_response(response)
+        if ask_question("[?] Would you like to view the URL submission results?"):
+            display_url_response(submission)
 
     #####################################################################
 
     #####################################################################
     # Submit http POST request to URLScan.io and retrieve data associated with provided UUID
     if uuids_to_scan:
-        uuid_responses = get_uuids_data(uuids_to_scan, options)
+        uuid_responses = get_uuids_data(uuids_to_scan, options, client, journal)
     elif target_uuid:
         print(f"\n[*] Retrieving scan results associated with UUID: '{target_uuid}'...")
-        scan_content = get_uuid_data(target_uuid)
+        try:
+            scan_content = get_uuid_data(target_uuid, client, options.fields)
+        except URLScanError as error:
+            print(f"[!] Error {error}")
+            print("[-] Exiting program...")
+            sys.exit(5)
 
         # Download site PNG and/or DOM from provided uuid
         if options.get_png:
-            get_uuid_png(target_uuid, save_dir)
+            get_uuid_png(target_uuid, save_dir, client)
         if options.get_dom:
-            get_uuid_dom(target_uuid, save_dir)
+            get_uuid_dom(target_uuid, save_dir, client)
 
     #####################################################################
 
     #####################################################################
     # Save results
     if responses:
-        save_file = save_dir + "/URLScan_Results_urls.json"
-        save_json_content(save_file, responses)
+        save_file = output_path(save_dir + "/URLScan_Results_urls.json", options.output_format)
+        save_json_content(save_file, responses, client.metrics, options.output_format)
         print(f"[*] Results saved to: '{save_file}'...")
 
-    if options.export_uuids:
+    if matrix_groups:
+        save_file = output_path(save_dir + "/URLScan_Matrix.json", options.output_format)
+        save_json_content(save_file, matrix_groups, client.metrics, options.output_format)
+        print(f"[*] Variants grouped per URL saved to: '{save_file}'...")
+
+    if options.export_uuids and url_stream is None:
         save_file = save_dir + "/UUIDs.json"
         save_list_to__file(save_file, uuids_to_save)
         print(f"[*] List of UUIDs saved to: '{save_file}'...")
 
     if target_url:
-        save_file = (
+        save_file = output_path(
             save_dir
             + "/"
             + "URLScan_"
             + target_url.replace("/", "_")
-            + "_Response.json"
+            + "_Response.json",
+            options.output_format,
         )
-        save_json_content(save_file, response.json())
+        save_json_content(save_file, submission, client.metrics, options.output_format)
         print(f"[*] Results saved to: '{save_file}'...")
 
     if uuid_responses:
-        save_file = save_dir + "/URLScan_Results_uuids.json"
-        save_json_content(save_file, uuid_responses)
+        save_file = output_path(save_dir + "/URLScan_Results_uuids.json", options.output_format)
+        save_json_content(save_file, uuid_responses, client.metrics, options.output_format)
         print(f"[*] Results saved to: '{save_file}'...")
 
     if target_uuid:
-        save_file = save_dir + "/URLScan_" + target_uuid + ".json"
-        save_json_content(save_file, scan_content)
+        save_file = output_path(save_dir + "/URLScan_" + target_uuid + ".json", options.output_format)
+        save_json_content(save_file, scan_content, client.metrics, options.output_format)
         print(f"[*] Results saved to: '{save_file}'...")
 
     #####################################################################
 
     #####################################################################
+    if client.iocs is not None:
+        save_file = save_dir + "/URLScan_IOCs.tsv"
+        client.iocs.write(save_file)
+        print(f"[*] IOC table ({len(client.iocs)} unique indicators) saved to: '{save_file}'...")
+
+    store = client.artifact_store
+    if store is not None:
+        print(
+            f"[*] Artifact store: {len(store)} artifacts, {store.duplicates} duplicate bodies not written again\
+ ({store.bytes_saved / (1024 * 1024):.1f} MB) - manifest: '{store.manifest_file}'..."
+        )
+
+    # Release the pooled connections to URLScan.io
+    client.close()
+    client.metrics.close(stats_file, options.prometheus_file)
+    print(f"[*] Run stats saved to: '{stats_file}'...")
+
+    # The batch completed: a later '--resume' has nothing left to pick up
+    if journal is not None:
+        journal.close(finished=True)
+
+    if client.dead_letter.count:
+        print(
+            f"[!] Warning: {client.dead_letter.count} item(s) failed, see: '{client.dead_letter.dead_letter_file}'"
+        )
+    #####################################################################
 
     #####################################################################
     print("[+] Operations complete!\n")